@@ -7,30 +7,31 @@ from datetime import date, datetime
 
 # Import data and functions from run.py
 # MODIFICATION: We only need the main generation function now.
-from run import generate_timetable_from_config, CONTRACTED_HOURS
+from run import generate_timetable_from_config, repair_timetable_from_config
 
 # The HourTracker Agent
 class HourTracker:
-    def __init__(self, filepath='hour_tracker.json'):
-        """Manages the state of remaining contracted hours."""
+    def __init__(self, filepath='hour_tracker.json', contracted_hours: dict = None):
+        """Manages the state of remaining contracted hours, starting from `contracted_hours`."""
         self.filepath = filepath
+        self.contracted_hours = contracted_hours or {}
         self.remaining_hours = self._load_data()
 
     def _load_data(self):
         """Loads remaining hours, handling in-memory or file-based storage."""
         if self.filepath is None:
             # When running in-memory, start with a fresh copy of the hours
-            return {k: v.copy() for k, v in CONTRACTED_HOURS.items()} if CONTRACTED_HOURS else {}
+            return {k: v.copy() for k, v in self.contracted_hours.items()}
 
         if not os.path.exists(self.filepath):
             print("Tracker file not found. Initializing with full contracted hours.")
-            return {k: v.copy() for k, v in CONTRACTED_HOURS.items()} if CONTRACTED_HOURS else {}
+            return {k: v.copy() for k, v in self.contracted_hours.items()}
         try:
             with open(self.filepath, 'r') as f:
                 return json.load(f)
         except json.JSONDecodeError:
             print("Could not read tracker file. Re-initializing.")
-            return {k: v.copy() for k, v in CONTRACTED_HOURS.items()} if CONTRACTED_HOURS else {}
+            return {k: v.copy() for k, v in self.contracted_hours.items()}
 
     def _save_data(self):
         """Saves the current state of remaining hours to the file."""
@@ -75,11 +76,19 @@ class HourTracker:
 
 # --- Core GA Execution & Dynamic Request Functions ---
 
+# "repair" moves only the displaced sessions; "full" re-solves the week.
+DYNAMIC_REQUEST_MODES = ("repair", "full")
+
 ### THIS IS THE FIX ###
 # The function signature is updated to accept the 'config' dictionary.
 # This resolves the "unexpected keyword argument" TypeError.
-def process_dynamic_request(remaining_hours, week_num, teacher_name: str, unavailable_days: list, day_dates: dict, config: dict):
-    """Processes a structured request for a teacher's leave using the provided configuration."""
+def process_dynamic_request(remaining_hours, week_num, teacher_name: str, unavailable_days: list, day_dates: dict, config: dict, solver_options: dict = None, previous_timetable: dict = None, mode: str = "repair"):
+    """
+    Processes a structured request for a teacher's leave using the provided configuration.
+    When the week's existing 'raw' timetable is passed as previous_timetable, it is
+    repaired locally (mode "repair": only the displaced sessions move) or used to
+    warm-start a full re-solve of the week (mode "full").
+    """
     print(f"\n🚀 Processing dynamic request for teacher: \"{teacher_name}\" on days: {unavailable_days}")
 
     # Validation is now performed against the config object passed for this specific request.
@@ -89,7 +98,7 @@ def process_dynamic_request(remaining_hours, week_num, teacher_name: str, unavai
         return None
 
     if not isinstance(unavailable_days, list) or not unavailable_days:
-        print(f"🔴 ERROR: 'unavailable_days' must be a non-empty list.")
+        print("🔴 ERROR: 'unavailable_days' must be a non-empty list.")
         return None
 
     # Directly create the constraints object from the structured input.
@@ -100,12 +109,24 @@ def process_dynamic_request(remaining_hours, week_num, teacher_name: str, unavai
         }]
     }
     
+    if previous_timetable and mode == "repair":
+        return repair_timetable_from_config(
+            config=config,
+            day_dates=day_dates,
+            previous_timetable=previous_timetable,
+            remaining_hours=remaining_hours,
+            dynamic_constraints=constraints,
+            solver_options=solver_options
+        )
+
     # This requires that the main generation function can accept dynamic constraints
     return generate_timetable_from_config(
         config=config,
         day_dates=day_dates,
         remaining_hours=remaining_hours,
-        dynamic_constraints=constraints
+        dynamic_constraints=constraints,
+        solver_options=solver_options,
+        previous_timetable=previous_timetable
     )
 
 # This function is kept for potential future use but is not part of the primary fix.
@@ -0,0 +1,170 @@
+import copy
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from metrics import AUTH_TOKEN_CACHE
+
+# ==============================================================================
+#                     ID-TOKEN VERIFICATION (cached, shared by all endpoints)
+# ==============================================================================
+# Endpoints authenticate through one verifier object instead of calling
+# firebase_admin.auth.verify_id_token on every request:
+#   FirebaseTokenVerifier - the real check, plus a background thread that
+#                           keeps Google's public signing keys fresh
+#   FakeTokenVerifier     - local stand-in for tests: the token is the uid
+#   CachedTokenVerifier   - bounded LRU of verified tokens in front of either
+#
+# Cache entries are keyed by the SHA-256 of the token (raw tokens are never
+# held as keys) and expire at the token's own `exp`, so a cached token is
+# accepted exactly as long as verifying it again would accept it. As with
+# verify_id_token(check_revoked=False), revocation is not checked.
+
+DEFAULT_CACHE_SIZE = 1024
+KEY_REFRESH_INTERVAL = 30 * 60  # seconds; Google rotates its keys every few hours
+
+
+class TokenVerifier:
+    """Interface: verify(id_token) returns the decoded claims (with "uid") or raises."""
+
+    def verify(self, id_token: str):
+        raise NotImplementedError
+
+
+class FirebaseTokenVerifier(TokenVerifier):
+    """firebase_admin.auth.verify_id_token for the default (or given) app."""
+
+    def __init__(self, app=None):
+        self.app = app
+        self._refresh_thread = None
+        self._stop = threading.Event()
+
+    def verify(self, id_token: str):
+        from firebase_admin import auth
+        return auth.verify_id_token(id_token, app=self.app)
+
+    def refresh_keys(self):
+        """
+        Re-downloads the public signing keys into the HTTP cache firebase_admin
+        verifies against, so no request has to wait for that download.
+        Best effort: returns False, without raising, when the installed
+        firebase_admin does not expose that cache the way this expects.
+        """
+        # firebase_admin keeps its cache-control aware key fetcher on the
+        # app's auth client, which is not public API; a separate download
+        # would not warm the cache verification reads from.
+        try:
+            from firebase_admin import auth, _token_gen
+            request = auth._get_client(self.app)._token_verifier.request
+            cert_uri = _token_gen.ID_TOKEN_CERT_URI
+        except (ImportError, AttributeError) as e:
+            print(f"Signing key refresh unavailable with this firebase_admin ({e}); keys are fetched on demand")
+            return False
+        # "no-cache" makes it revalidate and store the keys.
+        request(cert_uri, method="GET", headers={"Cache-Control": "no-cache"})
+        return True
+
+    def start_key_refresh(self, interval: float = KEY_REFRESH_INTERVAL):
+        """Refreshes the keys now and then every `interval` seconds on a daemon thread."""
+        if self._refresh_thread is not None:
+            return
+
+        def loop():
+            while True:
+                # Verification still fetches the keys itself when they are stale.
+                try:
+                    if not self.refresh_keys():
+                        return
+                except Exception as e:
+                    print(f"Signing key refresh failed: {e}")
+                if self._stop.wait(interval):
+                    return
+
+        self._refresh_thread = threading.Thread(target=loop, name="auth-key-refresh", daemon=True)
+        self._refresh_thread.start()
+
+    def stop_key_refresh(self):
+        self._stop.set()
+
+
+class FakeTokenVerifier(TokenVerifier):
+    """
+    Accepts any non-empty token and treats it as the uid, or only the tokens
+    in `claims_by_token` when given. Claims expire `lifetime` seconds after
+    verification unless they carry their own "exp". Counts its calls.
+    """
+
+    def __init__(self, claims_by_token: dict = None, lifetime: float = 3600, clock=time.time):
+        self.claims_by_token = claims_by_token
+        self.lifetime = lifetime
+        self.clock = clock
+        self.calls = 0
+
+    def verify(self, id_token: str):
+        self.calls += 1
+        if self.claims_by_token is not None:
+            if id_token not in self.claims_by_token:
+                raise ValueError("Unknown token")
+            claims = dict(self.claims_by_token[id_token])
+        elif id_token:
+            claims = {"uid": id_token}
+        else:
+            raise ValueError("Empty token")
+        claims.setdefault("exp", self.clock() + self.lifetime)
+        return claims
+
+
+class CachedTokenVerifier(TokenVerifier):
+    """Thread-safe LRU cache of verified claims in front of another verifier."""
+
+    def __init__(self, verifier: TokenVerifier, max_entries: int = DEFAULT_CACHE_SIZE, clock=time.time):
+        self.verifier = verifier
+        self.max_entries = max_entries
+        self.clock = clock
+        self._entries = OrderedDict()  # token hash -> (expires_at, claims)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(id_token: str):
+        return hashlib.sha256(id_token.encode("utf-8")).hexdigest()
+
+    def verify(self, id_token: str):
+        key = self._key(id_token)
+        now = self.clock()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._entries.move_to_end(key)
+                    AUTH_TOKEN_CACHE.inc(result="hit")
+                    return copy.deepcopy(entry[1])
+                del self._entries[key]
+        AUTH_TOKEN_CACHE.inc(result="miss")
+
+        # Verified outside the lock; failures raise and are not cached.
+        claims = self.verifier.verify(id_token)
+        expires_at = claims.get("exp")
+        if expires_at is None or expires_at <= now or self.max_entries <= 0:
+            return claims
+        with self._lock:
+            self._entries[key] = (expires_at, copy.deepcopy(claims))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return claims
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+
+def bearer_token(authorization_header: str):
+    """The token of an "Authorization: Bearer <token>" header, or None."""
+    if not authorization_header or not authorization_header.startswith("Bearer "):
+        return None
+    return authorization_header[len("Bearer "):].strip() or None
@@ -0,0 +1,2 @@
+"""Synthetic configs and a runner for benchmarking the timetable solver."""
+from benchmarks.synthetic import PRESETS, generate_config
@@ -0,0 +1,191 @@
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import queue
+import subprocess
+import sys
+import time
+import traceback
+from datetime import date, datetime, timedelta
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from benchmarks.synthetic import PRESETS, generate_config
+
+# ==============================================================================
+#                     SOLVER BENCHMARK RUNNER
+# ==============================================================================
+# Runs run_genetic_algorithm and generate_timetable_from_config on synthetic
+# configs and writes one JSON record per (size, entry point, repeat):
+# the backend that ran, wall time, fitness evaluations (as counted by the
+# solver) per second, exact-search nodes, peak RSS, best fitness and the
+# conflicts left. Every case runs in a fresh process so peak RSS is its own;
+# that process is not a pool worker (pool workers are daemonic and may not
+# start children), so the solver can still split a case across islands.
+#
+#   python -m benchmarks.runner --sizes small,medium --output bench.json
+
+TARGETS = ("run_genetic_algorithm", "generate_timetable_from_config")
+# A fixed week keeps the calendar (and so the problem) identical across runs.
+BENCHMARK_MONDAY = date(2025, 1, 6)
+
+
+def _peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes.
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def _run_case(case):
+    """Child-process entry point: runs one case and returns its record."""
+    from fitness import conflict_breakdown
+    from problem import compile_problem, encode_timetable
+    from run import generate_timetable_from_config, run_genetic_algorithm
+
+    config = generate_config(**case["config"])
+    problem = compile_problem(config)
+    solver_options = dict(case["solver_options"])
+    solver_options["cache"] = "bypass"  # Every case is timed solving, never read from the result cache.
+
+    started = time.perf_counter()
+    if case["target"] == "run_genetic_algorithm":
+        timetable, stats = run_genetic_algorithm(config, config["CONTRACTED_HOURS"], 1, solver_options=solver_options, return_stats=True)
+    else:
+        day_dates = {day: (BENCHMARK_MONDAY + timedelta(days=i)).isoformat() for i, day in enumerate(config["DAYS"])}
+        result = generate_timetable_from_config(config, day_dates, solver_options=solver_options)
+        timetable, stats = (result["raw"], result["stats"]) if result else ({}, {})
+    wall_time = time.perf_counter() - started
+
+    # The exported cell genome shows the clashes and gaps left, but not the
+    # sessions the solver could not place; best_fitness is the solver's own.
+    genome = encode_timetable(problem, timetable)
+    conflicts = {name: int(values[0]) for name, values in conflict_breakdown(problem, genome[None]).items() if name != "unplaced"}
+    evaluations = stats.get("evaluations", 0)
+    return {
+        "size": case["size"],
+        "target": case["target"],
+        "repeat": case["repeat"],
+        "batches": problem.num_batches,
+        "teachers": problem.num_teachers,
+        "rooms": problem.num_rooms,
+        "cells": problem.num_batches * problem.num_days * problem.num_slots,
+        "backend": stats.get("backend"),
+        "islands": stats.get("islands", 0),
+        "wall_time": round(wall_time, 3),
+        "generations": stats.get("generations", 0),
+        "evaluations": evaluations,
+        "evaluations_per_second": round(evaluations / wall_time, 1) if evaluations and wall_time > 0 else None,
+        "exact_nodes": stats.get("exact_nodes", 0),
+        "peak_rss_mb": _peak_rss_mb(),
+        "best_fitness": stats.get("best_fitness", 0.0),
+        "conflicts": conflicts,
+    }
+
+
+def _case_process(case, results):
+    try:
+        results.put((_run_case(case), None))
+    except Exception:
+        results.put((None, traceback.format_exc()))
+
+
+def _run_in_process(ctx, case):
+    """Runs one case in a fresh non-daemon process and returns its record."""
+    results = ctx.Queue()
+    process = ctx.Process(target=_case_process, args=(case, results))
+    process.start()
+    try:
+        while True:
+            try:
+                record, error = results.get(timeout=1)
+                break
+            except queue.Empty:
+                if not process.is_alive():
+                    record, error = None, f"benchmark process exited with code {process.exitcode}"
+                    break
+    finally:
+        process.join()
+    if error:
+        raise RuntimeError(f"Benchmark case {case['size']} / {case['target']} failed:\n{error}")
+    return record
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(sizes, targets=TARGETS, repeats: int = 1, seed: int = 0, solver_options: dict = None):
+    """Runs every (size, target, repeat) case in its own process and returns the records."""
+    ctx = multiprocessing.get_context("spawn")
+    records = []
+    for size in sizes:
+        for target in targets:
+            for repeat in range(repeats):
+                case = {
+                    "size": size,
+                    "target": target,
+                    "repeat": repeat,
+                    "config": dict(PRESETS[size], seed=seed),
+                    "solver_options": dict(solver_options or {}, seed=seed + repeat),
+                }
+                print(f"Benchmark: {size} / {target} / run {repeat + 1}")
+                record = _run_in_process(ctx, case)
+                print(f"   -> {record['backend']}, {record['wall_time']}s, fitness {record['best_fitness']:.4f}, conflicts {record['conflicts']}")
+                records.append(record)
+    return records
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the timetable solver on synthetic configs.")
+    parser.add_argument("--sizes", default="small,medium", help=f"comma-separated presets: {', '.join(PRESETS)}")
+    parser.add_argument("--targets", default=",".join(TARGETS), help="comma-separated entry points to run")
+    parser.add_argument("--repeats", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--population-size", type=int, default=None)
+    parser.add_argument("--generations", type=int, default=None)
+    parser.add_argument("--time-limit", type=float, default=None, help="seconds per solve")
+    parser.add_argument("--backend", default=None, help="solver backend: ga, exact or auto")
+    parser.add_argument("--islands", type=int, default=None, help="GA islands (default: one per CPU for larger configs)")
+    parser.add_argument("--output", default="benchmark_results.json")
+    args = parser.parse_args(argv)
+
+    solver_options = {}
+    if args.population_size is not None:
+        solver_options["population_size"] = args.population_size
+    if args.generations is not None:
+        solver_options["generations"] = args.generations
+    if args.time_limit is not None:
+        solver_options["time_limit"] = args.time_limit
+    if args.backend is not None:
+        solver_options["backend"] = args.backend
+    if args.islands is not None:
+        solver_options["islands"] = args.islands
+
+    records = run_benchmarks(args.sizes.split(","), args.targets.split(","), args.repeats, args.seed, solver_options)
+    report = {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "seed": args.seed,
+        "solver_options": solver_options,
+        "results": records,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Benchmark results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
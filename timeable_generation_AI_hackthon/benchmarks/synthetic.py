@@ -0,0 +1,91 @@
+import math
+import random
+
+# ==============================================================================
+#                     SEEDED SYNTHETIC TIMETABLE CONFIGS
+# ==============================================================================
+# Builds configs in the same format as config.json, at department scale.
+# The same arguments and seed always give the same config.
+
+DAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday"]
+
+# Named sizes used by the benchmark runner.
+PRESETS = {
+    "small": dict(batches=3, subjects_per_batch=5, teachers=8),
+    "medium": dict(batches=12, subjects_per_batch=6, teachers=40),
+    "large": dict(batches=40, subjects_per_batch=6, teachers=150),
+    "xlarge": dict(batches=80, subjects_per_batch=7, teachers=400),
+}
+
+
+def _timeslots(count: int):
+    return [f"{9 + i}-{10 + i}" for i in range(count)]
+
+
+def generate_config(batches: int = 10, subjects_per_batch: int = 5, teachers: int = 30,
+                    lecture_rooms: int = None, lab_rooms: int = None, lab_ratio: float = 0.2,
+                    availability: float = 0.7, days: int = 5, slots_per_day: int = 6,
+                    weekly_load: tuple = (2, 3), semester_weeks: int = 15, seed: int = 0):
+    """
+    Returns a synthetic config dict.
+
+    lab_ratio is the share of subjects that are (two-slot) labs, availability
+    the share of the day each teacher can teach (as one contiguous window),
+    and weekly_load the (min, max) weekly sessions of a lecture subject.
+    Room counts default to what the batch count and lab ratio need.
+    """
+    rng = random.Random(seed)
+    day_names = DAYS[:days]
+    timeslots = _timeslots(slots_per_day)
+
+    # Subjects are shared between batches, as courses are across sections.
+    pool_size = max(subjects_per_batch, batches * subjects_per_batch // 3)
+    subjects = {}
+    for i in range(pool_size):
+        is_lab = rng.random() < lab_ratio
+        subjects[f"S{i:03d}_Lab" if is_lab else f"S{i:03d}"] = {"is_lab": is_lab}
+    subject_names = list(subjects)
+
+    # Every subject gets at least one teacher; the rest pick 1-3 subjects each.
+    teacher_names = [f"T{i:03d}" for i in range(teachers)]
+    teacher_subjects = {name: [] for name in teacher_names}
+    for i, subject in enumerate(subject_names):
+        teacher_subjects[teacher_names[i % teachers]].append(subject)
+    for name in teacher_names:
+        for subject in rng.sample(subject_names, min(len(subject_names), rng.randint(1, 3))):
+            if subject not in teacher_subjects[name]:
+                teacher_subjects[name].append(subject)
+
+    window = max(2, min(slots_per_day, round(availability * slots_per_day)))
+    teacher_availability = {}
+    for name in teacher_names:
+        start = rng.randint(0, slots_per_day - window)
+        teacher_availability[name] = timeslots[start:start + window]
+
+    lab_count = sum(1 for s in subjects.values() if s["is_lab"])
+    lecture_rooms = lecture_rooms or math.ceil(batches * 0.6) + 1
+    lab_rooms = lab_rooms or (max(1, math.ceil(batches * lab_ratio)) if lab_count else 0)
+    rooms = {f"R{i:03d}": {"type": "Lecture"} for i in range(lecture_rooms)}
+    rooms.update({f"L{i:03d}": {"type": "Lab"} for i in range(lab_rooms)})
+
+    batch_names = [f"Batch_{i:03d}" for i in range(batches)]
+    course_load, contracted_hours = {}, {}
+    for batch in batch_names:
+        load = {}
+        for subject in rng.sample(subject_names, min(subjects_per_batch, len(subject_names))):
+            load[subject] = 1 if subjects[subject]["is_lab"] else rng.randint(*weekly_load)
+        course_load[batch] = load
+        contracted_hours[batch] = {subject: sessions * semester_weeks for subject, sessions in load.items()}
+
+    return {
+        "DAYS": day_names,
+        "TIMESLOTS": timeslots,
+        "SEMESTER_WEEKS": semester_weeks,
+        "BATCHES": batch_names,
+        "ROOMS": rooms,
+        "SUBJECTS": subjects,
+        "TEACHERS": teacher_subjects,
+        "TEACHER_AVAILABILITY": teacher_availability,
+        "CONTRACTED_HOURS": contracted_hours,
+        "COURSE_LOAD": course_load,
+    }
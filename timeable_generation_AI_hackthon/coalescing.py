@@ -0,0 +1,149 @@
+import hashlib
+import json
+import threading
+import traceback
+import weakref
+
+# ==============================================================================
+#                     SINGLE-FLIGHT REQUEST COALESCING
+# ==============================================================================
+# Identical requests that arrive while one is still being computed share that
+# computation instead of starting their own. The first request for a key
+# starts a "flight": a background thread that runs the producer (an iterator,
+# e.g. the weeks of a generation) and publishes every item it yields. Every
+# request for the same key, the first included, reads the items from the
+# flight as they appear, so a late joiner catches up on what is already done
+# and then waits for the rest.
+#
+# The producer runs independently of any one request, so a client that
+# disconnects does not stop the others. Work that must happen whether or not
+# a client keeps reading (e.g. saving the result) goes in a done callback,
+# which runs on the producer's thread before any reader sees the end of the
+# items, so a client that reads to the end finds its effects. A flight is
+# forgotten once its producer finishes; requests after that start a new one.
+#
+# KeyedLocks serialises work on one key (e.g. updates to one stored
+# generation) that must not run twice at the same time but, unlike a
+# flight, is not shared: every caller runs its own update in turn.
+
+
+def canonical_key(*parts):
+    """SHA-256 of the JSON of `parts` with sorted keys, so dict order does not matter."""
+    payload = json.dumps(parts, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class Flight:
+    """The published items of one in-flight producer."""
+
+    def __init__(self, key: str):
+        self.key = key
+        self.items = []
+        self.done = False
+        self.finishing = False
+        self.error = None
+        self.waiters = 0
+        self._callbacks = []
+        self._changed = threading.Condition()
+
+    def _publish(self, item):
+        with self._changed:
+            self.items.append(item)
+            self._changed.notify_all()
+
+    def _finish(self, error: BaseException = None):
+        with self._changed:
+            self.finishing, self.error = True, error
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            self._call(callback)
+        with self._changed:
+            self.done = True
+            self._changed.notify_all()
+
+    def _call(self, callback):
+        try:
+            callback(list(self.items), self.error)
+        except Exception:
+            print(f"Done callback of flight {self.key[:12]} failed:\n{traceback.format_exc()}")
+
+    def add_done_callback(self, callback):
+        """Calls callback(items, error) once the producer finishes, or now if it already has."""
+        with self._changed:
+            if not self.finishing:
+                self._callbacks.append(callback)
+                return
+        self._call(callback)
+
+    def __iter__(self):
+        """Yields every item in order, blocking until each is published; re-raises the producer's error."""
+        index = 0
+        while True:
+            with self._changed:
+                while index >= len(self.items) and not self.done:
+                    self._changed.wait()
+                if index < len(self.items):
+                    item = self.items[index]
+                elif self.error is not None:
+                    raise self.error
+                else:
+                    return
+            index += 1
+            yield item
+
+
+class SingleFlight:
+    """Registry of in-flight producers by key."""
+
+    def __init__(self, name: str = "flight"):
+        self.name = name
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def join(self, key: str, producer):
+        """
+        Returns (flight, started). `producer` is a zero-argument callable
+        returning an iterator; it is called (on a new thread) only when no
+        flight for `key` is running, in which case `started` is True.
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            started = flight is None
+            if started:
+                flight = self._flights[key] = Flight(key)
+            flight.waiters += 1
+        if started:
+            threading.Thread(target=self._run, args=(flight, producer), name=f"{self.name}-{key[:8]}", daemon=True).start()
+        return flight, started
+
+    def _run(self, flight: Flight, producer):
+        error = None
+        try:
+            for item in producer():
+                flight._publish(item)
+        except BaseException as e:  # Handed to every waiter.
+            error = e
+        finally:
+            with self._lock:
+                if self._flights.get(flight.key) is flight:
+                    del self._flights[flight.key]
+            flight._finish(error)
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._flights)
+
+
+class KeyedLocks:
+    """A re-entrant lock per key, kept only while some thread holds or waits for it."""
+
+    def __init__(self):
+        self._locks = weakref.WeakValueDictionary()
+        self._guard = threading.Lock()
+
+    def lock(self, key: str):
+        with self._guard:
+            lock = self._locks.get(key)
+            if lock is None:
+                lock = self._locks[key] = threading.RLock()
+            return lock
@@ -0,0 +1,182 @@
+import time
+
+from problem import CompiledProblem, new_genome
+from fitness import genome_fitness, with_unplaced
+from seeding import TimetableConstructor
+from occupancy import positions
+
+# ==============================================================================
+#                     EXACT BACKTRACKING SEARCH (bitset domains)
+# ==============================================================================
+# A complete depth-first search over sessions instead of random evolution.
+# Occupancy of every batch, teacher and room is an int bitmask over the
+# week's (day, slot) cells (occupancy.py), so "is this start free" is an AND.
+#   - variable order: the (batch, subject) unit with the fewest remaining
+#     placements per session still to place (most constrained first)
+#   - value order: placements that add the fewest idle blocks to the
+#     teacher's day first
+#   - forward checking: after every placement each unit must still have
+#     enough free starts for its remaining sessions, and the teacher gaps
+#     so far must be closable by the sessions still to place
+# All sessions of a unit share one teacher, as in the GA. Exhausting the
+# search without a complete placement proves the week cannot be scheduled
+# in full without clashes.
+
+DEFAULT_NODE_LIMIT = 200_000
+
+
+class ExactSearch:
+    """Backtracking search for one (config, week, constraints) run."""
+
+    def __init__(self, problem: CompiledProblem, remaining_hours: dict, week_num: int, dynamic_constraints: dict = None):
+        self.problem = problem
+        constructor = TimetableConstructor(problem, remaining_hours, week_num, dynamic_constraints)
+        self.occupancy = constructor.occupancy
+
+        # unit: (batch, subject, sessions, length, rooms, teachers)
+        self.units = [
+            (b, subject_id, sessions, length, problem.subject_rooms[subject_id], problem.subject_teachers[subject_id])
+            for b, subject_id, sessions, length in constructor.requests if sessions > 0
+        ]
+        self.total_sessions = sum(unit[2] for unit in self.units)
+
+        self.nodes = 0
+        self.best = None  # (fitness, placements) of the best complete placement
+        self.deepest = []  # longest partial placement, used when nothing completes
+
+    # --- Occupancy helpers ---
+    def _day_gaps(self, teacher: int, day: int, extra: int = 0):
+        return max(self.occupancy.day_blocks(teacher, day, extra) - 1, 0)
+
+    def _start_masks(self, unit_index: int):
+        """(teacher, free start cells) for the unit's next session, per candidate teacher."""
+        b, _, _, length, rooms, teachers = self.units[unit_index]
+        teacher = self.unit_teacher[unit_index]
+        # Sessions of a unit are interchangeable, so each starts after the previous one.
+        after = self.last_position[unit_index] + 1
+        free_starts = self.occupancy.free_starts
+        return [(t, free_starts(b, t, length, rooms) >> after << after) for t in ([teacher] if teacher is not None else teachers)]
+
+    def _options(self, unit_index: int, start_masks):
+        """All (teacher, position, mask, rooms) placements for the unit's next session."""
+        length, rooms = self.units[unit_index][3], self.units[unit_index][4]
+        occupancy = self.occupancy
+        options = []
+        for teacher, starts in start_masks:
+            for position in positions(starts):
+                d, s = occupancy.cell(position)
+                options.append((teacher, position, occupancy.span(d, s, length), occupancy.free_rooms(rooms, d, s, length)))
+        return options
+
+    def _added_blocks(self, teacher: int, position: int, mask: int):
+        day = position // self.problem.num_slots
+        return self._day_gaps(teacher, day, mask) - self._day_gaps(teacher, day)
+
+    # --- Search ---
+    def run(self, deadline: float = None, node_limit: int = DEFAULT_NODE_LIMIT):
+        """
+        Searches until a perfect timetable is found, the search space is
+        exhausted, or a limit is hit. Returns (genome, stats); stats has
+        stop_reason "perfect", "infeasible" (no complete clash-free placement
+        exists), "exhausted" (complete placements exist but all leave
+        teacher gaps), "deadline" or "node_limit", plus nodes and fitness.
+        """
+        problem = self.problem
+        self.occupancy.clear()
+        self.unit_teacher = [None] * len(self.units)
+        self.last_position = [-1] * len(self.units)
+        self.placed = [0] * len(self.units)
+        self.gaps = 0
+        self.placements = []
+        self.deadline, self.node_limit = deadline, node_limit
+
+        try:
+            outcome = self._search()
+        except _SearchLimit as limit:
+            outcome = limit.reason
+        if outcome is None:
+            outcome = "exhausted" if self.best else "infeasible"
+
+        placements = self.best[1] if self.best else self.deepest
+        genome = self._genome(placements)
+        # A partial placement is scored with its missing sessions, so it never reads as perfect.
+        fitness = self.best[0] if self.best else with_unplaced(genome_fitness(problem, genome), self.total_sessions - len(placements))
+        return genome, {"stop_reason": outcome, "nodes": self.nodes, "best_fitness": fitness, "complete": self.best is not None}
+
+    def _check_limits(self):
+        self.nodes += 1
+        if self.node_limit is not None and self.nodes > self.node_limit:
+            raise _SearchLimit("node_limit")
+        if self.deadline is not None and time.time() >= self.deadline:
+            raise _SearchLimit("deadline")
+
+    def _search(self):
+        """Returns "perfect" once found, otherwise None after exhausting this subtree."""
+        self._check_limits()
+        remaining = self.total_sessions - len(self.placements)
+        if len(self.placements) > len(self.deepest):
+            self.deepest = list(self.placements)
+        if remaining == 0:
+            genome = self._genome(self.placements)
+            fitness = genome_fitness(self.problem, genome)
+            if self.best is None or fitness > self.best[0]:
+                self.best = (fitness, list(self.placements))
+            return "perfect" if fitness == 1.0 else None
+
+        # Most constrained unit first; fail as soon as any unit cannot finish.
+        chosen, chosen_masks, chosen_key = None, None, None
+        for u, unit in enumerate(self.units):
+            left = unit[2] - self.placed[u]
+            if left == 0:
+                continue
+            start_masks = self._start_masks(u)
+            count = sum(bin(starts).count("1") for _, starts in start_masks)
+            if count < left if self.unit_teacher[u] is not None else not count:
+                return None
+            key = count / left
+            if chosen_key is None or key < chosen_key:
+                chosen, chosen_masks, chosen_key = u, start_masks, key
+        if chosen is None:
+            return None
+        chosen_options = self._options(chosen, chosen_masks)
+
+        b, subject_id, length = self.units[chosen][0], self.units[chosen][1], self.units[chosen][3]
+        occupancy = self.occupancy
+        chosen_options.sort(key=lambda o: (self._added_blocks(o[0], o[1], o[2]), o[1]))
+        for teacher, position, mask, rooms in chosen_options:
+            for room in rooms:
+                day, start = occupancy.cell(position)
+                gaps_before = self._day_gaps(teacher, day)
+                previous = (self.unit_teacher[chosen], self.last_position[chosen])
+                occupancy.place(b, teacher, room, day, start, length)
+                self.unit_teacher[chosen] = teacher
+                self.last_position[chosen] = position
+                self.placed[chosen] += 1
+                self.gaps += self._day_gaps(teacher, day) - gaps_before
+                self.placements.append((b, position, length, (subject_id, teacher, room)))
+
+                # Each later session can close at most one gap.
+                if self.gaps <= remaining - 1 or self.best is None:
+                    if self._search() == "perfect":
+                        return "perfect"
+
+                self.placements.pop()
+                self.gaps -= self._day_gaps(teacher, day) - gaps_before
+                self.placed[chosen] -= 1
+                self.unit_teacher[chosen], self.last_position[chosen] = previous
+                occupancy.remove(b, teacher, room, day, start, length)
+        return None
+
+    def _genome(self, placements):
+        genome = new_genome(self.problem)
+        slots = self.problem.num_slots
+        for b, position, length, value in placements:
+            d, s = divmod(position, slots)
+            for i in range(length):
+                genome[b, d, s + i] = value
+        return genome
+
+
+class _SearchLimit(Exception):
+    def __init__(self, reason: str):
+        self.reason = reason
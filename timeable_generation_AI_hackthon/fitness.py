@@ -0,0 +1,191 @@
+import numpy as np
+
+from problem import CompiledProblem, EMPTY, SUBJECT, TEACHER, ROOM
+from session_genome import expand_cells, GENE_DAY, UNPLACED
+
+# ==============================================================================
+#                     VECTORISED FITNESS (whole population per call)
+# ==============================================================================
+# Scores match run.calculate_fitness exactly:
+#   +1   for every extra teacher, room or batch booked in the same (day, slot)
+#   +0.5 for every idle gap between two blocks of a teacher's classes in a day
+#   +1   for every session of a session genome left unplaced
+#   fitness = 1 / (1 + conflicts)
+# Cell genomes can hold only one session per batch cell; session genomes
+# can overlap within a batch, which then counts as a batch double booking.
+# A fitness of 1.0 therefore always means every demanded session is placed.
+
+UNPLACED_PENALTY = 1
+
+
+def _occupancy(problem: CompiledProblem, genomes):
+    """
+    Returns (cells, resources) where cells index the (p, d, s) occupied slots.
+    Takes a stack of cell genomes or of session genomes (see session_genome.py).
+    """
+    if genomes.ndim == 3:
+        filled_p, filled_b, filled_d, filled_s, teachers, rooms, _ = expand_cells(genomes)
+        cells = (filled_p * problem.num_days + filled_d) * problem.num_slots + filled_s
+        return cells, {
+            "teachers": (teachers, problem.num_teachers),
+            "rooms": (rooms, problem.num_rooms),
+            "batches": (filled_b, problem.num_batches),
+        }
+    filled_p, filled_b, filled_d, filled_s = np.nonzero(genomes[..., SUBJECT] != EMPTY)
+    cells = (filled_p * problem.num_days + filled_d) * problem.num_slots + filled_s
+    resources = {
+        "teachers": (genomes[filled_p, filled_b, filled_d, filled_s, TEACHER], problem.num_teachers),
+        "rooms": (genomes[filled_p, filled_b, filled_d, filled_s, ROOM], problem.num_rooms),
+        "batches": (filled_b, problem.num_batches),
+    }
+    return cells, resources
+
+
+def _count_tensor(cells, resource_ids, num_resources: int, shape):
+    """Bookings per (population, day, slot, resource)."""
+    size = int(np.prod(shape)) * num_resources
+    counts = np.bincount(cells * num_resources + resource_ids, minlength=size)
+    return counts.reshape(*shape, num_resources)
+
+
+def conflict_breakdown(problem: CompiledProblem, genomes):
+    """Per-individual teacher/room/batch double-bookings, teacher gaps and unplaced sessions."""
+    genomes = np.asarray(genomes)
+    shape = (len(genomes), problem.num_days, problem.num_slots)
+    cells, resources = _occupancy(problem, genomes)
+
+    breakdown = {}
+    for name, (resource_ids, num_resources) in resources.items():
+        counts = _count_tensor(cells, resource_ids, num_resources, shape)
+        breakdown[name] = np.maximum(counts - 1, 0).sum(axis=(1, 2, 3))
+        if name == "teachers":
+            teacher_counts = counts
+
+    # A teacher's day with N separate blocks of classes has N - 1 idle gaps.
+    busy = teacher_counts > 0
+    block_starts = busy.copy()
+    block_starts[:, :, 1:] &= ~busy[:, :, :-1]
+    breakdown["gaps"] = np.maximum(block_starts.sum(axis=2) - 1, 0).sum(axis=(1, 2))
+    if genomes.ndim == 3:
+        breakdown["unplaced"] = (genomes[..., GENE_DAY] == UNPLACED).sum(axis=1)
+    else:
+        breakdown["unplaced"] = np.zeros(len(genomes), dtype=np.int64)
+    return breakdown
+
+
+def evaluate_population(problem: CompiledProblem, genomes):
+    """Fitness of every genome in a (population, batch, day, slot, 3) or (population, sessions, 7) stack."""
+    if len(genomes) == 0:
+        return np.zeros(0)
+    breakdown = conflict_breakdown(problem, genomes)
+    conflicts = (breakdown["teachers"] + breakdown["rooms"] + breakdown["batches"] + 0.5 * breakdown["gaps"]
+                 + UNPLACED_PENALTY * breakdown["unplaced"])
+    return 1 / (1 + conflicts)
+
+
+def genome_fitness(problem: CompiledProblem, genome):
+    return float(evaluate_population(problem, genome[None])[0])
+
+
+def with_unplaced(fitness: float, unplaced: int):
+    """The fitness of a cell genome whose week is missing `unplaced` demanded sessions."""
+    return 1 / (1 / fitness + UNPLACED_PENALTY * unplaced)
+
+
+# ==============================================================================
+#                     INCREMENTAL (DELTA) FITNESS FOR ONE INDIVIDUAL
+# ==============================================================================
+class ConflictTracker:
+    """
+    Keeps occupancy counts per (day, slot, teacher/room/batch) and gap counts
+    per teacher-day for one cell genome, so that swaps and moves update the
+    score by touching only the affected slots and days instead of rescoring.
+    The tracker edits the genome it was built from in place. Local search
+    (local_search.py) scores its moves through it; the GA's mutation checks
+    placements against occupancy.Occupancy instead.
+    """
+
+    def __init__(self, problem: CompiledProblem, genome):
+        self.problem = problem
+        self.genome = genome
+        shape = (problem.num_days, problem.num_slots)
+        self.teacher_counts = np.zeros(shape + (problem.num_teachers,), dtype=np.int32)
+        self.room_counts = np.zeros(shape + (problem.num_rooms,), dtype=np.int32)
+        self.batch_counts = np.zeros(shape + (problem.num_batches,), dtype=np.int32)
+
+        b, d, s = np.nonzero(genome[..., SUBJECT] != EMPTY)
+        np.add.at(self.teacher_counts, (d, s, genome[b, d, s, TEACHER]), 1)
+        np.add.at(self.room_counts, (d, s, genome[b, d, s, ROOM]), 1)
+        np.add.at(self.batch_counts, (d, s, b), 1)
+        self.double_bookings = int(sum(
+            np.maximum(counts - 1, 0).sum() for counts in (self.teacher_counts, self.room_counts, self.batch_counts)
+        ))
+
+        busy = self.teacher_counts > 0
+        block_starts = busy.copy()
+        block_starts[:, 1:] &= ~busy[:, :-1]
+        self.teacher_gaps = np.maximum(block_starts.sum(axis=1) - 1, 0).T.copy()  # (teacher, day)
+        self.total_gaps = int(self.teacher_gaps.sum())
+
+    @property
+    def conflicts(self):
+        return self.double_bookings + 0.5 * self.total_gaps
+
+    @property
+    def fitness(self):
+        return 1 / (1 + self.conflicts)
+
+    # --- Low-level count updates ---
+    def _book(self, counts, day, slot, resource, step):
+        before = int(counts[day, slot, resource])
+        counts[day, slot, resource] = before + step
+        self.double_bookings += max(before + step - 1, 0) - max(before - 1, 0)
+
+    def _refresh_gaps(self, teacher, day):
+        busy = self.teacher_counts[day, :, teacher] > 0
+        blocks = int(busy[0]) + int(np.count_nonzero(busy[1:] & ~busy[:-1])) if len(busy) else 0
+        gaps = max(blocks - 1, 0)
+        self.total_gaps += gaps - int(self.teacher_gaps[teacher, day])
+        self.teacher_gaps[teacher, day] = gaps
+
+    def set_cell(self, cell, value):
+        """Writes (subject, teacher, room) or None (empty) into a cell, updating the score."""
+        b, d, s = cell
+        touched_teachers = set()
+        old = self.genome[b, d, s]
+        if old[SUBJECT] != EMPTY:
+            teacher, room = int(old[TEACHER]), int(old[ROOM])
+            self._book(self.teacher_counts, d, s, teacher, -1)
+            self._book(self.room_counts, d, s, room, -1)
+            self._book(self.batch_counts, d, s, b, -1)
+            touched_teachers.add(teacher)
+        if value is None:
+            self.genome[b, d, s] = EMPTY
+        else:
+            self.genome[b, d, s] = value
+            teacher, room = int(value[TEACHER]), int(value[ROOM])
+            self._book(self.teacher_counts, d, s, teacher, 1)
+            self._book(self.room_counts, d, s, room, 1)
+            self._book(self.batch_counts, d, s, b, 1)
+            touched_teachers.add(teacher)
+        for teacher in touched_teachers:
+            self._refresh_gaps(teacher, d)
+
+    def _value(self, cell):
+        value = self.genome[cell].copy()
+        return None if value[SUBJECT] == EMPTY else value
+
+    # --- Moves ---
+    def swap(self, cell1, cell2):
+        """Swaps the contents of two cells and returns the new fitness."""
+        value1, value2 = self._value(cell1), self._value(cell2)
+        self.set_cell(cell1, value2)
+        self.set_cell(cell2, value1)
+        return self.fitness
+
+    def move(self, cell, target):
+        """Moves a cell's entry to another cell (overwriting it) and returns the new fitness."""
+        value = self._value(cell)
+        self.set_cell(cell, None)
+        self.set_cell(target, value)
+        return self.fitness
@@ -0,0 +1,231 @@
+import atexit
+import os
+import random
+import threading
+import time
+import multiprocessing
+
+from problem import CompiledProblem
+from run import create_initial_population, evolve_population
+from metrics import generation_stats
+
+# ==============================================================================
+#                     ISLAND-MODEL GA (one population per CPU)
+# ==============================================================================
+# Each island evolves its own population in a worker process. Every
+# `migration_interval` generations the islands report back, and the best
+# `migrants` individuals of each island replace the worst of the next island
+# (ring topology). The run ends as soon as any island finds a perfect timetable.
+#
+# Workers are started with "spawn", not fork: the server process has request
+# threads, job workers and the token-key refresher running, and a forked
+# child inherits any lock one of them holds at that moment (e.g. a metrics
+# or print lock) with nobody left to release it.
+#
+# Spawned workers re-import the parent's __main__, so the pool is created
+# once per process and kept: its workers start (and import server.py, when
+# that is the entry point) once, not for every week solved. One solve at a
+# time runs on it; a concurrent solve evolves in its own process instead.
+# Every wait for results is bounded - by the deadline when there is one, and
+# by the work asked for otherwise - so a killed or stuck worker cannot hang
+# the request; the pool is then replaced.
+
+DEFAULT_MIGRATION_INTERVAL = 20
+DEFAULT_MIGRANTS = 2
+# Below this many (batch, day, slot) cells a single process is faster than
+# paying for worker start-up and population pickling.
+PARALLEL_MIN_CELLS = 150
+
+START_METHOD = "spawn"
+# Seconds past the expected end of an epoch to wait for its results (worker
+# start-up plus the generation each island is in the middle of).
+RESULT_GRACE = 30.0
+# Generous upper bound on the time to breed and score one individual, used
+# to bound an epoch without a deadline.
+SECONDS_PER_EVALUATION = 0.05
+
+# Set in every worker by the pool initializer: non-zero once the running
+# solve should stop (an island found a perfect timetable, or the parent
+# gave up waiting).
+_STOP_FLAG = None
+
+# (pool, stop flag, worker count) of this process, created on first use.
+_POOL = None
+_POOL_LOCK = threading.Lock()
+# Held by the solve using the pool.
+_RUN_LOCK = threading.Lock()
+
+
+class IslandsUnavailable(RuntimeError):
+    """The pool is busy with another solve, or returned nothing in time."""
+
+
+def resolve_island_count(problem: CompiledProblem, requested: int = None):
+    """Explicit island count, or one per CPU for configs large enough to benefit."""
+    if requested is not None:
+        return max(1, int(requested))
+    if problem.num_batches * problem.num_days * problem.num_slots < PARALLEL_MIN_CELLS:
+        return 1
+    return os.cpu_count() or 1
+
+
+def _init_worker(stop_flag):
+    global _STOP_FLAG
+    _STOP_FLAG = stop_flag
+
+
+def _should_stop():
+    return bool(_STOP_FLAG.value)
+
+
+def _evolve_island(task):
+    """Worker entry point: seeds (first epoch only) and evolves one island."""
+    problem, population, seeding_args, population_size, generations, seed, fitness_backend, deadline = task
+    # Each task gets its own RNG seeded by the parent, so a seeded run is reproducible.
+    rng = random.Random(seed)
+    if population is None:
+        population = create_initial_population(problem, population_size, *seeding_args, rng=rng)
+
+    population, scores, generations_run, _, evaluations = evolve_population(
+        problem, population, generations, fitness_backend, should_stop=_should_stop, deadline=deadline, rng=rng,
+        dynamic_constraints=seeding_args[2],
+    )
+    if max(scores) == 1.0:
+        _STOP_FLAG.value = 1
+    return population, scores, generations_run, evaluations
+
+
+def _island_pool(num_islands: int):
+    """This process's worker pool, (re)created with at least `num_islands` workers."""
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is None or _POOL[2] < num_islands:
+            _close_pool()
+            ctx = multiprocessing.get_context(START_METHOD)
+            stop_flag = ctx.Value("b", 0, lock=False)
+            _POOL = (ctx.Pool(num_islands, initializer=_init_worker, initargs=(stop_flag,)), stop_flag, num_islands)
+        return _POOL
+
+
+def _close_pool():
+    global _POOL
+    if _POOL is not None:
+        _POOL[0].terminate()
+        _POOL[0].join()
+        _POOL = None
+
+
+def shutdown_pool():
+    """Terminates this process's island workers; the next solve starts new ones."""
+    with _POOL_LOCK:
+        _close_pool()
+
+
+atexit.register(shutdown_pool)
+
+
+def _result_timeout(epoch: int, population_size: int, deadline: float = None):
+    """Seconds to wait for an epoch: to the deadline when set, and never longer than its work should take."""
+    timeout = epoch * population_size * SECONDS_PER_EVALUATION + RESULT_GRACE
+    if deadline is not None:
+        timeout = min(timeout, max(deadline - time.time(), 0) + RESULT_GRACE)
+    return timeout
+
+
+def _migrate(populations: list, scores: list, migrants: int):
+    """Ring migration: island i's best individuals replace island i+1's worst."""
+    best = []
+    for population, island_scores in zip(populations, scores):
+        order = sorted(range(len(population)), key=island_scores.__getitem__, reverse=True)
+        best.append([(population[i].copy(), island_scores[i]) for i in order[:migrants]])
+
+    for i, (population, island_scores) in enumerate(zip(populations, scores)):
+        incoming = best[i - 1]
+        worst = sorted(range(len(population)), key=island_scores.__getitem__)[:len(incoming)]
+        for slot, (genome, fitness) in zip(worst, incoming):
+            population[slot] = genome
+            island_scores[slot] = fitness
+
+
+def run_island_model(problem: CompiledProblem, remaining_hours: dict, week_num: int, dynamic_constraints: dict = None,
+                     num_islands: int = None, population_size: int = 100, generations: int = 200,
+                     migration_interval: int = None, migrants: int = None, fitness_backend: str = None, seeding: str = None,
+                     warm_start=None, deadline: float = None, stall_limit: int = None, on_generation=None, rng=random,
+                     on_generation_stats=None):
+    """
+    Evolves `num_islands` populations in parallel. Returns (island_bests,
+    generations_run, stop_reason, evaluations) where island_bests lists each
+    island's (best_genome, fitness), best first, and evaluations counts the
+    individuals scored on all islands. Raises IslandsUnavailable when
+    another solve is using the pool or the workers return nothing in time;
+    a later epoch timing out ends the run with the populations of the last
+    complete one.
+    """
+    num_islands = num_islands or resolve_island_count(problem)
+    migration_interval = max(1, migration_interval or DEFAULT_MIGRATION_INTERVAL)
+    migrants = DEFAULT_MIGRANTS if migrants is None else migrants
+    seeding_args = (remaining_hours, week_num, dynamic_constraints, seeding, warm_start)
+    populations = [None] * num_islands
+    scores = [None] * num_islands
+
+    if not _RUN_LOCK.acquire(blocking=False):
+        raise IslandsUnavailable("Island workers are busy with another solve")
+    try:
+        pool, stop_flag, _ = _island_pool(num_islands)
+        stop_flag.value = 0
+        generations_done, stop_reason, evaluations = 0, "max_generations", 0
+        best_so_far, improved_at = None, 0
+        while generations_done < generations:
+            epoch = min(migration_interval, generations - generations_done)
+            pending = [
+                pool.apply_async(_evolve_island, ((problem, populations[i], seeding_args, population_size, epoch, rng.getrandbits(32), fitness_backend, deadline),))
+                for i in range(num_islands)
+            ]
+            wait_until = time.time() + _result_timeout(epoch, population_size, deadline)
+            try:
+                results = [p.get(timeout=max(wait_until - time.time(), 0)) for p in pending]
+            except multiprocessing.TimeoutError:
+                # The workers may be stuck or dead; the next solve gets new ones.
+                stop_flag.value = 1
+                shutdown_pool()
+                if populations[0] is None:
+                    raise IslandsUnavailable("Island workers returned no results in time")
+                print(f"Islands: no results in time; keeping generation {generations_done:03}")
+                stop_reason = "deadline"
+                break
+            populations = [r[0] for r in results]
+            scores = [list(r[1]) for r in results]
+            generations_done += max(r[2] for r in results)
+            evaluations += sum(r[3] for r in results)
+
+            best_fitness = max(max(s) for s in scores)
+            print(f"Islands: generation {generations_done:03} | Best Fitness: {best_fitness:.4f}")
+            if on_generation:
+                on_generation(generations_done, best_fitness)
+            if on_generation_stats:
+                # Reported at migration boundaries, over all islands together.
+                everyone = [genome for population in populations for genome in population]
+                on_generation_stats(generation_stats(generations_done, everyone, [f for s in scores for f in s], evaluations))
+            if best_so_far is None or best_fitness > best_so_far:
+                best_so_far, improved_at = best_fitness, generations_done
+
+            if stop_flag.value or best_fitness == 1.0:
+                stop_reason = "perfect"
+                break
+            # Stall is only checked at migration boundaries.
+            if stall_limit and generations_done - improved_at >= stall_limit:
+                stop_reason = "stalled"
+                break
+            if deadline is not None and time.time() >= deadline:
+                stop_reason = "deadline"
+                break
+            if migrants > 0 and num_islands > 1:
+                _migrate(populations, scores, migrants)
+    finally:
+        _RUN_LOCK.release()
+
+    island_bests = []
+    for population, island_scores in zip(populations, scores):
+        best_index = island_scores.index(max(island_scores))
+        island_bests.append((population[best_index], island_scores[best_index]))
+    return sorted(island_bests, key=lambda x: x[1], reverse=True), generations_done, stop_reason, evaluations
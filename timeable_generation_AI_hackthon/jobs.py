@@ -0,0 +1,140 @@
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+# ==============================================================================
+#                     ASYNCHRONOUS GENERATION JOBS
+# ==============================================================================
+# A job is submitted, queued on a bounded local worker pool, and polled for
+# status and results. The store is an interface so that the job lifecycle,
+# the queue and the workers can run against the in-memory stand-in below
+# without Firestore.
+
+QUEUED, RUNNING, SUCCEEDED, FAILED = "queued", "running", "succeeded", "failed"
+
+
+class QueueFullError(Exception):
+    """Raised when the worker pool already has its maximum of pending jobs."""
+
+
+class Job:
+    """One generation request and its progress."""
+
+    def __init__(self, user_id: str, payload: dict, total_weeks: int):
+        self.id = uuid.uuid4().hex
+        self.user_id = user_id
+        self.payload = payload
+        self.status = QUEUED
+        self.total_weeks = total_weeks
+        self.current_week = 0
+        self.weeks_completed = 0
+        self.best_fitness = None
+        self.error = None
+        self.result = None  # {"weeklyData": [...], "generationId": ...}; the CSV is rendered on download
+        self.created_at = time.time()
+        self.finished_at = None
+
+    def to_dict(self):
+        """Status view returned by the polling endpoint (no result payload)."""
+        return {
+            "jobId": self.id,
+            "status": self.status,
+            "currentWeek": self.current_week,
+            "weeksCompleted": self.weeks_completed,
+            "totalWeeks": self.total_weeks,
+            "bestFitness": self.best_fitness,
+            "error": self.error,
+            "generationId": (self.result or {}).get("generationId"),
+        }
+
+
+class JobStore:
+    """Interface for job persistence."""
+
+    def add(self, job: Job):
+        raise NotImplementedError
+
+    def get(self, job_id: str):
+        raise NotImplementedError
+
+    def update(self, job_id: str, **fields):
+        raise NotImplementedError
+
+
+class InMemoryJobStore(JobStore):
+    """Thread-safe local store; keeps at most `max_finished` finished jobs."""
+
+    def __init__(self, max_finished: int = 200):
+        self.max_finished = max_finished
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def add(self, job: Job):
+        with self._lock:
+            self._jobs[job.id] = job
+
+    def get(self, job_id: str):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def update(self, job_id: str, **fields):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            for name, value in fields.items():
+                setattr(job, name, value)
+            if job.status in (SUCCEEDED, FAILED):
+                self._evict_finished()
+            return job
+
+    def _evict_finished(self):
+        finished = sorted((j for j in self._jobs.values() if j.finished_at), key=lambda j: j.finished_at)
+        for job in finished[:max(0, len(finished) - self.max_finished)]:
+            del self._jobs[job.id]
+
+
+class JobRunner:
+    """
+    Runs jobs on a bounded thread pool. `work(job, report)` does the actual
+    generation and returns the job result; it calls report(**fields) to
+    publish progress (current_week, weeks_completed, best_fitness).
+    """
+
+    def __init__(self, work, store: JobStore = None, max_workers: int = 2, max_pending: int = 20):
+        self.work = work
+        self.store = store or InMemoryJobStore()
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="generation-job")
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    def submit(self, user_id: str, payload: dict, total_weeks: int):
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise QueueFullError(f"Too many generation jobs in progress ({self._pending}).")
+            self._pending += 1
+        job = Job(user_id, payload, total_weeks)
+        self.store.add(job)
+        self._executor.submit(self._run, job.id)
+        return job
+
+    def get(self, job_id: str):
+        return self.store.get(job_id)
+
+    def _run(self, job_id: str):
+        job = self.store.update(job_id, status=RUNNING)
+        try:
+            result = self.work(job, lambda **fields: self.store.update(job_id, **fields))
+            self.store.update(job_id, status=SUCCEEDED, result=result, finished_at=time.time())
+        except Exception as e:
+            print(traceback.format_exc())
+            self.store.update(job_id, status=FAILED, error=str(e), finished_at=time.time())
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    def shutdown(self, wait: bool = True):
+        self._executor.shutdown(wait=wait)
@@ -0,0 +1,192 @@
+import math
+import random
+import time
+
+import numpy as np
+
+from problem import CompiledProblem, extract_sessions, EMPTY, SUBJECT, TEACHER
+from fitness import ConflictTracker, genome_fitness
+from occupancy import Occupancy, cells_mask, positions
+
+# ==============================================================================
+#                     MEMETIC REPAIR (tabu search / simulated annealing)
+# ==============================================================================
+# Runs after the GA on its best individuals and removes leftover clashes and
+# gaps with targeted moves on whole sessions (a lab's two cells move together):
+#   relocate - move a session to cells where its batch, teacher and room are
+#              all free (any free cells of the batch if there are none)
+#   swap     - exchange two same-length sessions of the same batch
+#   room     - give a session another room of the right type
+# Every move is scored in O(1) through a ConflictTracker.
+
+DEFAULT_ITERATIONS = 500
+DEFAULT_TIME_BUDGET = 2.0  # seconds
+CANDIDATES_PER_ITERATION = 20
+TABU_TENURE = 10
+
+
+class LocalSearch:
+    """Tabu search or simulated annealing over one genome (edited in place)."""
+
+    def __init__(self, problem: CompiledProblem, genome, dynamic_constraints: dict = None, rng=random):
+        self.problem = problem
+        self.rng = rng
+        self.tracker = ConflictTracker(problem, genome)
+        self.sessions = extract_sessions(problem, genome)
+        self.occupancy = Occupancy(problem, dynamic_constraints)
+        self.day_blocked, self.teacher_day_blocked = self.occupancy.day_blocked, self.occupancy.teacher_day_blocked
+        self.evaluations = 0
+
+    # --- Feasibility helpers ---
+    def _can_start(self, teacher, d, s, length):
+        return (s + length <= self.problem.num_slots and not self.day_blocked[d]
+                and not self.teacher_day_blocked[teacher, d] and self.problem.available[teacher, s])
+
+    def _cells_free(self, b, d, s, length, ignore=None):
+        genome = self.tracker.genome
+        for i in range(length):
+            if genome[b, d, s + i, SUBJECT] != EMPTY and (ignore is None or (d, s + i) not in ignore):
+                return False
+        return True
+
+    def _clash_free_starts(self, session):
+        """Start cells where the session clashes with nothing else (its own cells count as free)."""
+        b, d, s, length, (_, teacher, room) = session
+        tracker = self.tracker
+        own = np.zeros((self.problem.num_days, self.problem.num_slots), dtype=np.int32)
+        own[d, s:s + length] = 1
+        busy = (cells_mask((tracker.genome[b, ..., SUBJECT] != EMPTY) & (own == 0))
+                | cells_mask(tracker.teacher_counts[..., teacher] > own)
+                | cells_mask(tracker.room_counts[..., room] > own))
+        occupancy = self.occupancy
+        return occupancy.runs(~busy & occupancy.all_cells, length) & occupancy.allowed_starts(teacher, length)
+
+    def _is_hot(self, session):
+        """True if the session sits on a double-booked cell or a gappy teacher-day."""
+        b, d, s, length, (_, teacher, room) = session
+        tracker = self.tracker
+        if tracker.teacher_gaps[teacher, d] > 0:
+            return True
+        return any(tracker.teacher_counts[d, s + i, teacher] > 1 or tracker.room_counts[d, s + i, room] > 1 for i in range(length))
+
+    # --- Moves: lists of (session_index, day, start, value) ---
+    def _random_move(self, hot):
+        rng = self.rng
+        index = rng.choice(hot) if hot else rng.randrange(len(self.sessions))
+        b, d, s, length, value = self.sessions[index]
+        subject, teacher, room = value
+        kind = rng.random()
+
+        if kind < 0.5:
+            starts = self._clash_free_starts(self.sessions[index]) & ~(1 << (d * self.problem.num_slots + s))
+            if starts:
+                nd, ns = self.occupancy.cell(rng.choice(list(positions(starts))))
+            else:
+                nd, ns = rng.randrange(self.problem.num_days), rng.randrange(self.problem.num_slots)
+            own = {(d, s + i) for i in range(length)}
+            if (nd, ns) != (d, s) and self._can_start(teacher, nd, ns, length) and self._cells_free(b, nd, ns, length, own):
+                return [(index, nd, ns, value)]
+        elif kind < 0.8:
+            other = rng.randrange(len(self.sessions))
+            ob, od, os_, olength, ovalue = self.sessions[other]
+            if other != index and ob == b and olength == length and (od, os_) != (d, s) \
+                    and self._can_start(teacher, od, os_, length) and self._can_start(ovalue[TEACHER], d, s, length):
+                return [(index, od, os_, value), (other, d, s, ovalue)]
+        else:
+            rooms = self.problem.subject_rooms[subject]
+            if len(rooms) > 1:
+                new_room = rng.choice(rooms)
+                if new_room != room:
+                    return [(index, d, s, (subject, teacher, new_room))]
+        return None
+
+    def _apply(self, move):
+        """Applies a move and returns the move that undoes it."""
+        undo = [(i, self.sessions[i][1], self.sessions[i][2], self.sessions[i][4]) for i, _, _, _ in move]
+        for i, _, _, _ in move:
+            b, d, s, length, _ = self.sessions[i]
+            for k in range(length):
+                self.tracker.set_cell((b, d, s + k), None)
+        for i, nd, ns, value in move:
+            session = self.sessions[i]
+            for k in range(session[3]):
+                self.tracker.set_cell((session[0], nd, ns + k), value)
+            session[1], session[2], session[4] = nd, ns, value
+        self.evaluations += 1
+        return undo
+
+    def _candidates(self, count: int):
+        hot = [i for i, session in enumerate(self.sessions) if self._is_hot(session)]
+        moves = (self._random_move(hot) for _ in range(count))
+        return [m for m in moves if m]
+
+    # --- Search strategies ---
+    def run(self, method: str = "tabu", max_iterations: int = DEFAULT_ITERATIONS, time_budget: float = DEFAULT_TIME_BUDGET):
+        """Improves the genome; returns (best_genome, best_fitness)."""
+        best_genome, best_conflicts = self.tracker.genome.copy(), self.tracker.conflicts
+        if not self.sessions:
+            return best_genome, self.tracker.fitness
+        deadline = time.monotonic() + time_budget
+        tabu = {}
+        temperature = 1.0
+
+        for iteration in range(max_iterations):
+            if best_conflicts == 0 or time.monotonic() > deadline:
+                break
+
+            if method == "anneal":
+                moves = self._candidates(1)
+                if not moves:
+                    continue
+                move = moves[0]
+                before = self.tracker.conflicts
+                undo = self._apply(move)
+                delta = self.tracker.conflicts - before
+                if delta > 0 and self.rng.random() >= math.exp(-delta / temperature):
+                    self._apply(undo)
+                temperature = max(0.01, temperature * 0.995)
+            else:
+                best_move, best_move_conflicts = None, None
+                for move in self._candidates(CANDIDATES_PER_ITERATION):
+                    undo = self._apply(move)
+                    conflicts = self.tracker.conflicts
+                    self._apply(undo)
+                    is_tabu = any(tabu.get((i, nd, ns), -1) >= iteration for i, nd, ns, _ in move)
+                    # Aspiration: a tabu move is still allowed if it beats the best so far.
+                    if is_tabu and conflicts >= best_conflicts:
+                        continue
+                    if best_move is None or conflicts < best_move_conflicts:
+                        best_move, best_move_conflicts = move, conflicts
+                if best_move is None:
+                    continue
+                undo = self._apply(best_move)
+                for i, d, s, _ in undo:
+                    tabu[(i, d, s)] = iteration + TABU_TENURE
+
+            if self.tracker.conflicts < best_conflicts:
+                best_genome, best_conflicts = self.tracker.genome.copy(), self.tracker.conflicts
+
+        return best_genome, 1 / (1 + best_conflicts)
+
+
+def repair(problem: CompiledProblem, genomes: list, dynamic_constraints: dict = None, method: str = "tabu",
+           max_iterations: int = DEFAULT_ITERATIONS, time_budget: float = DEFAULT_TIME_BUDGET, rng=random):
+    """
+    Runs local search on each genome, splitting the time budget; returns the
+    best (genome, fitness). With no budget left the first genome is returned
+    unchanged, so callers always get a pair.
+    """
+    best = None
+    deadline = time.monotonic() + time_budget
+    for i, genome in enumerate(genomes):
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        result = LocalSearch(problem, genome.copy(), dynamic_constraints, rng).run(method, max_iterations, remaining / (len(genomes) - i))
+        if best is None or result[1] > best[1]:
+            best = result
+        if best[1] == 1.0:
+            break
+    if best is None:
+        best = genomes[0].copy(), genome_fitness(problem, genomes[0])
+    return best
@@ -1,19 +1,26 @@
 # Save this as main.py
+import json
 from datetime import date, timedelta
 # MODIFIED: Import the new 'check_for_holidays' function
-from run import run_genetic_algorithm, display_console_timetable, export_grid_timetables, export_detailed_timetables, check_for_holidays
-from agent import HourTracker, process_dynamic_request
+from run import run_genetic_algorithm, format_timetable_for_json, check_for_holidays
+from agent import HourTracker
+
+with open('config.json', 'r') as f:
+    CONFIG = json.load(f)
+
+# Solved weeks by demand signature, so identical weeks are not solved twice.
+SOLUTION_MEMO = {}
 
 def create_weekly_schedule(tracker: HourTracker, week_num: int, dynamic_constraints: dict = None):
     """Generates a weekly schedule using the tracker's current data and any dynamic constraints."""
     print(f"--- Generating schedule for Week {week_num} ---")
     remaining_hours = tracker.get_remaining_hours()
     # Pass dynamic constraints to the algorithm
-    timetable = run_genetic_algorithm(remaining_hours, week_num, dynamic_constraints)
+    timetable = run_genetic_algorithm(CONFIG, remaining_hours, week_num, dynamic_constraints, solution_memo=SOLUTION_MEMO)
     return timetable
 
 if __name__ == "__main__":
-    tracker = HourTracker()
+    tracker = HourTracker(contracted_hours=CONFIG.get("CONTRACTED_HOURS"))
     print("Initial State:")
     tracker.print_status()
 
@@ -55,10 +62,11 @@ if __name__ == "__main__":
         if schedule:
             print(f"\n--- Final Timetable for Week {week} ---")
 
-            # Pass the calculated DAY_DATES to the display and export functions
-            display_console_timetable(schedule, DAY_DATES)
-            export_grid_timetables(schedule, DAY_DATES)
-            export_detailed_timetables(schedule, DAY_DATES)
+            # Print and export the week in the same JSON shape the API returns
+            week_json = format_timetable_for_json(schedule, DAY_DATES, CONFIG["DAYS"], CONFIG["BATCHES"])
+            print(json.dumps(week_json, indent=2))
+            with open(f"timetable_week_{week}.json", 'w') as f:
+                json.dump(week_json, f, indent=4)
 
             tracker.update_after_week(schedule)
             tracker.print_status()
@@ -0,0 +1,195 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+# ==============================================================================
+#                     INSTRUMENTATION (counters, histograms, phase timers)
+# ==============================================================================
+# A small in-process metrics registry rendered in the Prometheus text format
+# by the server's /metrics endpoint. Solver code times its phases with
+# `phase(...)`, and per-generation statistics can be received through the
+# `on_generation_stats` solver option (see generation_stats).
+#
+# Island workers run in separate processes, so their phase timings are not
+# collected; run totals (generations, evaluations, stop reasons) are counted
+# in the parent once the run ends.
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+def _label_key(labelnames, labels):
+    return tuple(str(labels.get(name, "")) for name in labelnames)
+
+
+def _format_labels(labelnames, key, extra=None):
+    pairs = list(zip(labelnames, key)) + list(extra or [])
+    if not pairs:
+        return ""
+    escaped = (value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+class Counter:
+    """Monotonic counter, optionally split by labels."""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(_label_key(self.labelnames, labels), 0)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Histogram:
+    """Cumulative-bucket histogram, optionally split by labels."""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # label key -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            series = self._series.setdefault(key, [0] * len(self.buckets) + [0.0, 0])
+            index = bisect.bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def count(self, **labels):
+        with self._lock:
+            series = self._series.get(_label_key(self.labelnames, labels))
+            return series[-1] if series else 0
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, series):
+                    cumulative += bucket_count
+                    lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, [('le', str(bound))])} {cumulative}")
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, [('le', '+Inf')])} {series[-1]}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {series[-2]}")
+                lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {series[-1]}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format."""
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+REQUEST_LATENCY = REGISTRY.register(Histogram(
+    "timetable_http_request_duration_seconds", "HTTP request latency until the response starts.", ("endpoint", "method", "status")))
+PHASE_SECONDS = REGISTRY.register(Histogram(
+    "timetable_phase_duration_seconds", "Time spent per phase (seeding, exact_search, evaluation, selection_crossover, local_search, formatting, csv, storage).", ("phase",)))
+SOLVER_RUNS = REGISTRY.register(Counter(
+    "timetable_solver_runs_total", "Solved weeks by stop reason.", ("stop_reason",)))
+SOLVER_GENERATIONS = REGISTRY.register(Counter(
+    "timetable_solver_generations_total", "GA generations run."))
+SOLVER_EVALUATIONS = REGISTRY.register(Counter(
+    "timetable_solver_evaluations_total", "Fitness evaluations of individual timetables."))
+SOLVER_TIMEOUTS = REGISTRY.register(Counter(
+    "timetable_solver_timeouts_total", "Solves stopped by their wall-clock deadline."))
+AUTH_TOKEN_CACHE = REGISTRY.register(Counter(
+    "timetable_auth_token_cache_total", "ID-token lookups in the verified-token cache by result (hit, miss).", ("result",)))
+RESULT_CACHE = REGISTRY.register(Counter(
+    "timetable_result_cache_total", "Solved-week result cache lookups by result (hit, miss) and skipped lookups (refresh, bypass).", ("result",)))
+GENERATION_FLIGHTS = REGISTRY.register(Counter(
+    "timetable_generation_flights_total", "Generate requests by role: leader (started a computation) or follower (joined an identical in-flight one).", ("role",)))
+
+
+def phase(name: str):
+    """Context manager timing a block into timetable_phase_duration_seconds."""
+    return PHASE_SECONDS.time(phase=name)
+
+
+def record_solve(stop_reason: str, generations: int, evaluations: int):
+    """Counts one finished solve."""
+    SOLVER_RUNS.inc(stop_reason=stop_reason)
+    SOLVER_GENERATIONS.inc(generations)
+    SOLVER_EVALUATIONS.inc(evaluations)
+    if stop_reason == "deadline":
+        SOLVER_TIMEOUTS.inc()
+
+
+def generation_stats(generation: int, population: list, scores: list, evaluations: int):
+    """
+    Per-generation statistics passed to on_generation_stats: best and mean
+    fitness, diversity (mean share of genes, i.e. sessions, in which an
+    individual differs from the best one) and the evaluations run so far.
+    """
+    best = int(np.argmax(scores))
+    stacked = np.asarray(population)
+    differs = (stacked != stacked[best]).any(axis=-1)
+    return {
+        "generation": generation,
+        "best_fitness": float(scores[best]),
+        "mean_fitness": float(np.mean(scores)),
+        "diversity": float(differs.mean()) if differs.size else 0.0,
+        "evaluations": evaluations,
+    }
+
+
+class InstrumentedProxy:
+    """Wraps an object so that each of its method calls is timed as `phase_name`."""
+
+    def __init__(self, target, phase_name: str):
+        self._target = target
+        self._phase_name = phase_name
+
+    def __getattr__(self, name):
+        attribute = getattr(self._target, name)
+        if not callable(attribute):
+            return attribute
+
+        def timed(*args, **kwargs):
+            with phase(self._phase_name):
+                return attribute(*args, **kwargs)
+        return timed
@@ -0,0 +1,159 @@
+import numpy as np
+
+from problem import CompiledProblem
+from session_genome import GENE_BATCH, GENE_TEACHER, GENE_ROOM, GENE_DAY, GENE_START, GENE_LENGTH, UNPLACED
+
+# ==============================================================================
+#                     BITSET OCCUPANCY (one int per batch, teacher, room)
+# ==============================================================================
+# Every (day, slot) cell of the week is one bit, at position day * slots + slot.
+# A session of `length` slots starting at (d, s) is the mask
+# ((1 << length) - 1) << (d * slots + s), so "is this session free for the
+# batch, the teacher and the room" is three ANDs, and all free starts of a
+# session at once are a few shifts and ANDs over the whole week.
+#
+# Construction, mutation, local search and the exact search check placements
+# here, so they never create a double booking in the first place.
+
+
+def cells_mask(cells) -> int:
+    """Bitmask of a (days, slots) boolean array."""
+    bits = np.packbits(np.asarray(cells, dtype=bool).ravel(), bitorder="little")
+    return int.from_bytes(bits.tobytes(), "little")
+
+
+def positions(mask: int):
+    """Cell positions of the set bits, lowest first."""
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+class Occupancy:
+    """
+    Busy cells of every batch, teacher and room, plus the start cells each
+    teacher may use (availability, holidays and leave days from
+    dynamic_constraints). place/remove assume the placement is clash-free;
+    `load_sessions` rebuilds everything from a session genome.
+    """
+
+    def __init__(self, problem: CompiledProblem, dynamic_constraints: dict = None):
+        self.problem = problem
+        self.num_slots = problem.num_slots
+        self.num_cells = problem.num_days * problem.num_slots
+        self.all_cells = (1 << self.num_cells) - 1
+        self.day_mask = (1 << self.num_slots) - 1
+        self.day_blocked, self.teacher_day_blocked = problem.blocked_masks(dynamic_constraints)
+        self._allowed = {}
+        self._day_starts = {}
+        self.clear()
+
+    # --- Masks ---
+    def span(self, d: int, s: int, length: int) -> int:
+        return ((1 << length) - 1) << (d * self.num_slots + s)
+
+    def cell(self, position: int):
+        """(day, slot) of a bit position."""
+        return divmod(position, self.num_slots)
+
+    def day_starts(self, length: int) -> int:
+        """Start cells whose `length` slots stay within one day."""
+        if length not in self._day_starts:
+            per_day = (1 << max(self.num_slots - length + 1, 0)) - 1
+            mask = 0
+            for d in range(self.problem.num_days):
+                mask |= per_day << (d * self.num_slots)
+            self._day_starts[length] = mask
+        return self._day_starts[length]
+
+    def allowed_starts(self, teacher: int, length: int) -> int:
+        """Start cells the teacher may begin a session of this length on."""
+        key = (teacher, length)
+        if key not in self._allowed:
+            problem = self.problem
+            allowed = np.zeros((problem.num_days, problem.num_slots), dtype=bool)
+            open_days = ~(self.day_blocked | self.teacher_day_blocked[teacher])
+            allowed[open_days] = problem.available[teacher]
+            self._allowed[key] = cells_mask(allowed) & self.day_starts(length)
+        return self._allowed[key]
+
+    def runs(self, free: int, length: int) -> int:
+        """Start cells from which `length` consecutive cells of `free` lie within one day."""
+        run = free
+        for i in range(1, length):
+            run &= free >> i
+        return run & self.day_starts(length)
+
+    # --- Queries ---
+    def free_starts(self, b: int, teacher: int, length: int, rooms=None) -> int:
+        """
+        Start cells where a session is free for the batch and the teacher and
+        allowed for the teacher, and (when `rooms` is given) where at least
+        one of those rooms is free too.
+        """
+        free = ~(self.batch[b] | self.teacher[teacher]) & self.all_cells
+        starts = self.runs(free, length) & self.allowed_starts(teacher, length)
+        if rooms is not None and starts:
+            room_starts = 0
+            for r in rooms:
+                room_starts |= self.runs(~self.room[r] & self.all_cells, length)
+            starts &= room_starts
+        return starts
+
+    def fallback_starts(self, b: int, teacher: int, length: int) -> int:
+        """
+        Start cells for a session with no free start: allowed for the teacher
+        and free for the batch, teacher and room clashes accepted (any allowed
+        start when the batch has none free either).
+        """
+        allowed = self.allowed_starts(teacher, length)
+        return self.runs(~self.batch[b] & self.all_cells, length) & allowed or allowed
+
+    def first_free(self, b: int, teacher: int, length: int, rooms=None):
+        """Earliest free (day, start slot) for the session, or None."""
+        starts = self.free_starts(b, teacher, length, rooms)
+        return self.cell((starts & -starts).bit_length() - 1) if starts else None
+
+    def can_place(self, b: int, teacher: int, room: int, d: int, s: int, length: int) -> bool:
+        mask = self.span(d, s, length)
+        return not (mask & self.batch[b] or mask & self.teacher[teacher] or mask & self.room[room])
+
+    def free_rooms(self, rooms, d: int, s: int, length: int):
+        mask = self.span(d, s, length)
+        return [r for r in rooms if not mask & self.room[r]]
+
+    def day_blocks(self, teacher: int, d: int, extra: int = 0) -> int:
+        """Separate blocks of busy slots in the teacher's day, with `extra` cells added."""
+        bits = ((self.teacher[teacher] | extra) >> (d * self.num_slots)) & self.day_mask
+        return bin(bits & ~(bits << 1)).count("1")
+
+    # --- Updates ---
+    def clear(self):
+        problem = self.problem
+        self.batch = [0] * problem.num_batches
+        self.teacher = [0] * problem.num_teachers
+        self.room = [0] * problem.num_rooms
+        return self
+
+    def place(self, b: int, teacher: int, room: int, d: int, s: int, length: int):
+        mask = self.span(d, s, length)
+        self.batch[b] |= mask
+        self.teacher[teacher] |= mask
+        self.room[room] |= mask
+
+    def remove(self, b: int, teacher: int, room: int, d: int, s: int, length: int):
+        mask = ~self.span(d, s, length)
+        self.batch[b] &= mask
+        self.teacher[teacher] &= mask
+        self.room[room] &= mask
+
+    def load_sessions(self, genome):
+        """Rebuilds the masks from the placed genes of a session genome."""
+        self.clear()
+        for gene in genome[genome[:, GENE_DAY] != UNPLACED].tolist():
+            mask = self.span(gene[GENE_DAY], gene[GENE_START], gene[GENE_LENGTH])
+            self.batch[gene[GENE_BATCH]] |= mask
+            self.teacher[gene[GENE_TEACHER]] |= mask
+            self.room[gene[GENE_ROOM]] |= mask
+        return self
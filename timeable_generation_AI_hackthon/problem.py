@@ -0,0 +1,218 @@
+import math
+
+import numpy as np
+
+# ==============================================================================
+#                     COMPILED PROBLEM (integer IDs + lookup tables)
+# ==============================================================================
+# The GA used to work directly on the config dict, re-hashing day/slot/teacher
+# strings on every fitness call. A CompiledProblem turns a config into dense
+# integer IDs once per run, and timetables live in a compact numpy genome.
+
+# Genome layout: int16 array of shape (batches, days, timeslots, 3).
+# The last axis holds (subject_id, teacher_id, room_id); EMPTY marks a free cell.
+EMPTY = -1
+SUBJECT, TEACHER, ROOM = 0, 1, 2
+GENOME_DTYPE = np.int16
+
+
+def _subject_priorities(batch_hours: dict):
+    """Normalised priority per subject (0.3..1.0) based on contracted hours."""
+    numeric = {s: h for s, h in batch_hours.items() if isinstance(h, (int, float))}
+    if not numeric:
+        return {}
+    max_hours, min_hours = max(numeric.values()), min(numeric.values())
+    if max_hours == min_hours:
+        return {s: 1.0 for s in numeric}
+    return {s: 0.3 + 0.7 * (h - min_hours) / (max_hours - min_hours) for s, h in numeric.items()}
+
+
+class CompiledProblem:
+    """Dense integer view of a timetable config, built once per GA run."""
+
+    def __init__(self, config: dict):
+        self.config = config
+        self.days = list(config.get("DAYS", []))
+        self.timeslots = list(config.get("TIMESLOTS", []))
+        self.batches = list(config.get("BATCHES", []))
+        self.semester_weeks = config.get("SEMESTER_WEEKS", 15)
+        self.course_load = config.get("COURSE_LOAD", {})
+        self.contracted_hours = config.get("CONTRACTED_HOURS", {})
+
+        subjects_cfg = config.get("SUBJECTS", {})
+        teachers_cfg = config.get("TEACHERS", {})
+        availability_cfg = config.get("TEACHER_AVAILABILITY", {})
+        rooms_cfg = config.get("ROOMS", {})
+
+        # --- Name tables (index -> name) ---
+        subjects = list(subjects_cfg)
+        for source in (self.course_load, self.contracted_hours):
+            for batch_subjects in source.values():
+                subjects.extend(batch_subjects)
+        for teacher_subjects in teachers_cfg.values():
+            subjects.extend(teacher_subjects)
+        self.subjects = list(dict.fromkeys(subjects))
+        self.teachers = list(dict.fromkeys(list(teachers_cfg) + list(availability_cfg)))
+        self.rooms = list(rooms_cfg)
+
+        # --- Reverse lookups (name -> index) ---
+        self.day_index = {d: i for i, d in enumerate(self.days)}
+        self.slot_index = {s: i for i, s in enumerate(self.timeslots)}
+        self.batch_index = {b: i for i, b in enumerate(self.batches)}
+        self.subject_index = {s: i for i, s in enumerate(self.subjects)}
+        self.teacher_index = {t: i for i, t in enumerate(self.teachers)}
+        self.room_index = {r: i for i, r in enumerate(self.rooms)}
+
+        self.num_days = len(self.days)
+        self.num_slots = len(self.timeslots)
+        self.num_batches = len(self.batches)
+        self.num_teachers = len(self.teachers)
+        self.num_rooms = len(self.rooms)
+
+        # --- Subjects: lab flag and session length in slots ---
+        self.is_lab = np.array([bool(subjects_cfg.get(s, {}).get("is_lab", False)) for s in self.subjects], dtype=bool)
+        self.session_length = np.where(self.is_lab, 2, 1)
+
+        # --- Teacher -> subject eligibility ---
+        self.can_teach = np.zeros((self.num_teachers, len(self.subjects)), dtype=bool)
+        for teacher, teacher_subjects in teachers_cfg.items():
+            for subject in teacher_subjects:
+                self.can_teach[self.teacher_index[teacher], self.subject_index[subject]] = True
+        # Only teachers listed under TEACHERS may be assigned, in config order.
+        self.subject_teachers = [
+            [self.teacher_index[t] for t, subs in teachers_cfg.items() if s in subs] for s in self.subjects
+        ]
+
+        # --- Room types ---
+        self.rooms_by_type = {}
+        for room, details in rooms_cfg.items():
+            self.rooms_by_type.setdefault(details["type"], []).append(self.room_index[room])
+        self.subject_rooms = [
+            self.rooms_by_type.get("Lab" if lab else "Lecture", []) for lab in self.is_lab
+        ]
+
+        # --- Availability mask: teacher x timeslot ---
+        self.available = np.zeros((self.num_teachers, self.num_slots), dtype=bool)
+        for teacher, slots in availability_cfg.items():
+            for slot in slots:
+                if slot in self.slot_index:
+                    self.available[self.teacher_index[teacher], self.slot_index[slot]] = True
+
+        # --- Per-batch subject lists (COURSE_LOAD order) and priorities ---
+        self.batch_subjects = [
+            [self.subject_index[s] for s in self.course_load.get(b, {})] for b in self.batches
+        ]
+        self.priorities = [
+            {self.subject_index[s]: p for s, p in _subject_priorities(self.contracted_hours.get(b, {})).items()}
+            for b in self.batches
+        ]
+
+    # --- Per-run helpers ---
+    def ordered_subjects(self, batch_id: int, remaining_hours: dict):
+        """Subjects of a batch ordered by priority, as (subject_id, remaining_hours) pairs."""
+        batch = self.batches[batch_id]
+        batch_remaining = remaining_hours.get(batch, {})
+        contracted = self.contracted_hours.get(batch, {})
+        subject_info = []
+        for subject_id in self.batch_subjects[batch_id]:
+            subject = self.subjects[subject_id]
+            priority = self.priorities[batch_id].get(subject_id, 0.5)
+            remaining = batch_remaining.get(subject, contracted.get(subject, 0))
+            subject_info.append((subject_id, priority * (1 + remaining / 100), remaining))
+        subject_info.sort(key=lambda x: (-x[1], -x[2]))
+        return [(subject_id, remaining) for subject_id, _, remaining in subject_info]
+
+    def sessions_to_schedule(self, batch_id: int, subject_id: int, remaining_hours: dict, week_num: int):
+        """Number of sessions (lab sessions count as one) to place this week."""
+        batch, subject = self.batches[batch_id], self.subjects[subject_id]
+        length = int(self.session_length[subject_id])
+        min_hours = self.course_load.get(batch, {}).get(subject, 1)
+        rem_hrs = remaining_hours.get(batch, {}).get(subject, 0)
+        weeks_left = max(1, self.semester_weeks - week_num + 1)
+        hours_to_schedule = max(min_hours, math.ceil(rem_hrs / weeks_left))
+        return int((hours_to_schedule + length - 1) // length)
+
+    def blocked_masks(self, dynamic_constraints: dict = None):
+        """Returns (day_blocked[day], teacher_day_blocked[teacher, day]) boolean masks."""
+        dynamic_constraints = dynamic_constraints or {}
+        day_blocked = np.zeros(self.num_days, dtype=bool)
+        for day in dynamic_constraints.get("holiday_days", []):
+            if day in self.day_index:
+                day_blocked[self.day_index[day]] = True
+        teacher_day_blocked = np.zeros((self.num_teachers, self.num_days), dtype=bool)
+        for entry in dynamic_constraints.get("unavailable_teachers", []):
+            teacher_id = self.teacher_index.get(entry.get("teacher"))
+            if teacher_id is None:
+                continue
+            for day in entry.get("days", []):
+                if day in self.day_index:
+                    teacher_day_blocked[teacher_id, self.day_index[day]] = True
+        return day_blocked, teacher_day_blocked
+
+
+    def demand_signature(self, remaining_hours: dict, week_num: int, dynamic_constraints: dict = None):
+        """
+        Hashable summary of everything that varies between weeks of one config:
+        sessions per (batch, subject) plus blocked days and teacher-days. Two
+        weeks with equal signatures are the same scheduling problem.
+        """
+        sessions = tuple(
+            (b, subject_id, self.sessions_to_schedule(b, subject_id, remaining_hours, week_num))
+            for b in range(self.num_batches) for subject_id in self.batch_subjects[b]
+        )
+        day_blocked, teacher_day_blocked = self.blocked_masks(dynamic_constraints)
+        blocked_teacher_days = tuple(map(tuple, np.argwhere(teacher_day_blocked).tolist()))
+        return sessions, tuple(np.flatnonzero(day_blocked).tolist()), blocked_teacher_days
+
+
+def compile_problem(config: dict) -> CompiledProblem:
+    return CompiledProblem(config)
+
+
+# --- Genome helpers ---
+def new_genome(problem: CompiledProblem):
+    return np.full((problem.num_batches, problem.num_days, problem.num_slots, 3), EMPTY, dtype=GENOME_DTYPE)
+
+
+def decode_genome(problem: CompiledProblem, genome):
+    """Converts a genome back to the {(day, timeslot, batch): (subject, teacher, room)} dict."""
+    timetable = {}
+    for b, d, s in np.argwhere(genome[..., SUBJECT] != EMPTY):
+        subject_id, teacher_id, room_id = genome[b, d, s]
+        key = (problem.days[d], problem.timeslots[s], problem.batches[b])
+        timetable[key] = (problem.subjects[subject_id], problem.teachers[teacher_id], problem.rooms[room_id])
+    return timetable
+
+
+def encode_timetable(problem: CompiledProblem, timetable: dict):
+    """Builds a genome from a tuple-keyed or 'Day|slot|Batch'-keyed timetable dict."""
+    genome = new_genome(problem)
+    for key, value in timetable.items():
+        day, timeslot, batch = key.split('|') if isinstance(key, str) else key
+        subject, teacher, room = value
+        try:
+            cell = (problem.batch_index[batch], problem.day_index[day], problem.slot_index[timeslot])
+            genome[cell] = (problem.subject_index[subject], problem.teacher_index[teacher], problem.room_index[room])
+        except KeyError:
+            continue  # Entries that no longer match the config are dropped.
+    return genome
+
+
+def extract_sessions(problem: CompiledProblem, genome):
+    """Groups consecutive identical cells into sessions: [batch, day, start, length, value]."""
+    sessions = []
+    for b in range(problem.num_batches):
+        for d in range(problem.num_days):
+            s = 0
+            while s < problem.num_slots:
+                value = tuple(int(v) for v in genome[b, d, s])
+                if value[SUBJECT] == EMPTY:
+                    s += 1
+                    continue
+                max_length = int(problem.session_length[value[SUBJECT]])
+                length = 1
+                while length < max_length and s + length < problem.num_slots and tuple(int(v) for v in genome[b, d, s + length]) == value:
+                    length += 1
+                sessions.append([b, d, s, length, value])
+                s += length
+    return sessions
@@ -0,0 +1,154 @@
+import os
+import sqlite3
+import threading
+import time
+
+from coalescing import canonical_key
+from metrics import RESULT_CACHE
+
+# ==============================================================================
+#                     PERSISTENT RESULT CACHE (SQLite, content-addressed)
+# ==============================================================================
+# Solved weeks are stored under a SHA-256 of everything the solver reads:
+# the config, the remaining hours, the blocked days and teacher-days, the
+# week index, the warm start, the result-relevant solver options and
+# SOLVER_VERSION. The same inputs on another day or after a restart return
+# the stored result without running the solver again.
+#
+# Only perfect timetables are stored: a result cut short by the deadline or
+# a stall depends on how much time that run had and is not worth replaying.
+# A value is the exact JSON bytes of the result, so a hit returns exactly
+# what the solve returned, with stats["cache"] = "hit" added. The table is
+# bounded: entries older than `ttl` seconds are not served, and beyond
+# `max_entries` the least recently used ones are deleted.
+#
+# solver_options["cache"] picks the behaviour per request:
+#   "use"     - serve a stored result, otherwise solve and store it if perfect (default)
+#   "refresh" - always solve, then overwrite the stored result if perfect
+#   "bypass"  - neither read nor write the cache
+
+CACHE_PATH = os.environ.get("TIMETABLE_CACHE_PATH", "timetable_cache.sqlite3")  # "" disables the cache
+CACHE_MAX_ENTRIES = int(os.environ.get("TIMETABLE_CACHE_MAX_ENTRIES", "1000"))
+CACHE_TTL = float(os.environ.get("TIMETABLE_CACHE_TTL", str(7 * 24 * 3600)))  # seconds; 0 keeps entries forever
+CACHE_MODES = ("use", "refresh", "bypass")
+# Part of every key; bump it when a solver change alters results, so entries
+# written by the old solver are no longer served.
+SOLVER_VERSION = 1
+
+# Solver options that do not change the result (callbacks, wall-clock deadline).
+_UNKEYED_OPTIONS = ("cache", "deadline", "on_generation", "on_generation_stats")
+
+
+def _constraints_key(dynamic_constraints: dict):
+    """Blocked days and teacher-days in a fixed order."""
+    constraints = dynamic_constraints or {}
+    teacher_days = {}
+    for entry in constraints.get("unavailable_teachers", []):
+        teacher_days.setdefault(entry["teacher"], set()).update(entry.get("days", []))
+    return {
+        "holiday_days": sorted(set(constraints.get("holiday_days", []))),
+        "unavailable_teachers": {teacher: sorted(days) for teacher, days in teacher_days.items()},
+    }
+
+
+def result_key(config: dict, remaining_hours: dict, dynamic_constraints: dict, week_num: int, solver_options: dict = None, previous_timetable: dict = None):
+    """Content address of one week's solve."""
+    options = {k: v for k, v in (solver_options or {}).items() if k not in _UNKEYED_OPTIONS and not callable(v)}
+    return canonical_key(SOLVER_VERSION, config, remaining_hours, _constraints_key(dynamic_constraints), week_num, options, previous_timetable)
+
+
+class ResultCache:
+    """Thread-safe SQLite table of key -> result bytes with LRU and TTL eviction."""
+
+    def __init__(self, path: str = CACHE_PATH, max_entries: int = CACHE_MAX_ENTRIES, ttl: float = CACHE_TTL, clock=time.time):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.clock = clock
+        self.hits = self.misses = self.stores = self.evictions = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            "key TEXT PRIMARY KEY, value BLOB NOT NULL, created_at REAL NOT NULL, accessed_at REAL NOT NULL)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed_at)")
+
+    def get(self, key: str):
+        """Stored bytes for `key`, or None when missing or expired."""
+        now = self.clock()
+        with self._lock:
+            row = self._db.execute("SELECT value, created_at FROM results WHERE key = ?", (key,)).fetchone()
+            if row is not None and self.ttl and row[1] <= now - self.ttl:
+                self._db.execute("DELETE FROM results WHERE key = ?", (key,))
+                self.evictions += 1
+                row = None
+            if row is None:
+                self.misses += 1
+                RESULT_CACHE.inc(result="miss")
+                return None
+            self._db.execute("UPDATE results SET accessed_at = ? WHERE key = ?", (now, key))
+            self.hits += 1
+        RESULT_CACHE.inc(result="hit")
+        return bytes(row[0])
+
+    def put(self, key: str, value: bytes):
+        """Stores (or overwrites) `key`, then evicts expired and least recently used entries."""
+        now = self.clock()
+        with self._lock:
+            self._db.execute("BEGIN")
+            try:
+                self._db.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)", (key, value, now, now))
+                evicted = 0
+                if self.ttl:
+                    evicted += self._db.execute("DELETE FROM results WHERE created_at <= ?", (now - self.ttl,)).rowcount
+                evicted += self._db.execute(
+                    "DELETE FROM results WHERE key IN (SELECT key FROM results ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                    (max(self.max_entries, 0),)).rowcount
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+            self.stores += 1
+            self.evictions += evicted
+
+    def record(self, mode: str):
+        """Counts a request that skipped the lookup ("refresh" or "bypass")."""
+        RESULT_CACHE.inc(result=mode)
+
+    def stats(self):
+        """Entry count plus this process's hits, misses, hit rate, stores and evictions."""
+        with self._lock:
+            entries = self._db.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+            lookups = self.hits + self.misses
+            return {
+                "entries": entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "stores": self.stores,
+                "evictions": self.evictions,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._db.execute("DELETE FROM results")
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+_SHARED = None
+_SHARED_LOCK = threading.Lock()
+
+
+def shared_cache():
+    """The process-wide cache at CACHE_PATH, opened on first use; None when disabled."""
+    global _SHARED
+    if not CACHE_PATH:
+        return None
+    with _SHARED_LOCK:
+        if _SHARED is None:
+            _SHARED = ResultCache(CACHE_PATH)
+        return _SHARED
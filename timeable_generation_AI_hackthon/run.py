@@ -1,95 +1,406 @@
 import random
 import copy
-import math
 import json
 import os
-from colorama import Fore, Style, init
-from datetime import date, timedelta, datetime
-
-# NEW: Import libraries for holiday detection
-import holidays
-from dateutil.parser import parse
+import time
+import numpy as np
+from colorama import Fore, init
+from datetime import date, timedelta
+
+from problem import CompiledProblem, compile_problem, new_genome, decode_genome, encode_timetable, extract_sessions
+from fitness import evaluate_population, genome_fitness, with_unplaced, UNPLACED_PENALTY
+from seeding import TimetableConstructor
+from exact import ExactSearch, DEFAULT_NODE_LIMIT
+from occupancy import Occupancy, positions
+from session_genome import SessionLayout, decode_sessions, placed, to_cell_genome, GENE_BATCH, GENE_SUBJECT, GENE_TEACHER, GENE_ROOM, GENE_DAY, GENE_START, GENE_LENGTH, UNPLACED
+from local_search import repair, DEFAULT_ITERATIONS, DEFAULT_TIME_BUDGET
+from semester_calendar import SemesterCalendar, calendar_for_config, country_holidays, merge_constraints
+from metrics import phase, record_solve, generation_stats
+from result_cache import CACHE_MODES, result_key, shared_cache
 
 # Initialize colorama
 init(autoreset=True)
 
-# --- Global Configuration (will be overridden by the config from the server) ---
-DAYS = []
-TIMESLOTS = []
-SEMESTER_WEEKS = 15
-CONTRACTED_HOURS = {}
-COURSE_LOAD = {}
-SUBJECTS = {}
-TEACHERS = {}
-TEACHER_AVAILABILITY = {}
-ROOMS = {}
-BATCHES = []
+DEFAULT_POPULATION_SIZE, DEFAULT_GENERATIONS = 100, 200 # Reduced for faster API response
+REPAIR_TIME_BUDGET = 0.5  # seconds of local search for a localized repair
+
+# --- Solver backends ---
+# "ga" is the genetic algorithm, "exact" the backtracking search in exact.py
+# and "auto" tries the exact search first on small enough weeks, falling back
+# to the GA (warm-started from its result) when it does not finish perfect.
+SOLVER_BACKEND = os.environ.get("TIMETABLE_SOLVER_BACKEND", "auto")
+EXACT_MAX_SESSIONS = 250  # larger weeks go straight to the GA under "auto"
+EXACT_TIME_LIMIT = 2.0  # seconds for the exact search when the solve has no deadline
+EXACT_TIME_SHARE = 0.5  # share of the remaining time it may use when it has one
+EXACT_MIN_BUDGET = 0.1  # below this many seconds "auto" skips the exact search
+
+
+def choose_backend(problem: CompiledProblem, remaining_hours: dict, week_num: int, solver_options: dict = None, deadline: float = None):
+    """Backend for one week: solver_options["backend"] or SOLVER_BACKEND, with "auto" resolved by size and time budget."""
+    backend = (solver_options or {}).get("backend") or SOLVER_BACKEND
+    if backend != "auto":
+        return backend
+    if deadline is not None and deadline - time.time() < EXACT_MIN_BUDGET:
+        return "ga"
+    session_count = sum(
+        problem.sessions_to_schedule(b, subject_id, remaining_hours, week_num)
+        for b in range(problem.num_batches)
+        for subject_id, _ in problem.ordered_subjects(b, remaining_hours)
+    )
+    return "exact" if session_count <= EXACT_MAX_SESSIONS else "ga"
 
 # ==============================================================================
 #                               MAIN BACKEND FUNCTION (HEAVILY MODIFIED)
 # ==============================================================================
-def generate_timetable_from_config(config: dict, day_dates: dict, remaining_hours: dict = None, dynamic_constraints: dict = None):
+class TimetableSolver:
+    """
+    One solver context: its own config, compiled problem and RNG, with no
+    module-level state. Create one per request/thread; concurrent solvers
+    never see each other's configuration, and a given seed reproduces a run.
+    """
+
+    def __init__(self, config: dict, seed: int = None, calendar: SemesterCalendar = None):
+        self.config = config
+        self.problem = compile_problem(config)
+        self.rng = random.Random(seed)
+        self.calendar = calendar
+
+    def _week_constraints(self, day_dates: dict, dynamic_constraints: dict = None):
+        # Holidays, closures and configured leave come from the semester calendar
+        # and are merged with any constraints passed by the caller.
+        calendar = self.calendar or calendar_for_config(self.config)
+        return merge_constraints(calendar.constraints_for_week(day_dates), dynamic_constraints)
+
+    def _result(self, genome, day_dates: dict, stats: dict):
+        with phase("formatting"):
+            return self._format_result(genome, day_dates, stats)
+
+    def _format_result(self, genome, day_dates: dict, stats: dict):
+        problem = self.problem
+        final_timetable_raw = decode_genome(problem, genome)
+
+        if final_timetable_raw:
+            # ### FIX ###
+            # Firestore cannot save dictionaries that have tuples as keys.
+            # To fix this, we convert the tuple keys e.g., ('Monday', '9-10', 'Batch_A')
+            # into a single string e.g., "Monday|9-10|Batch_A".
+            firestore_safe_raw = {f"{k[0]}|{k[1]}|{k[2]}": v for k, v in final_timetable_raw.items()}
+
+            return {
+                # IMPORTANT: The 'raw' key now contains string keys to be Firestore-compatible.
+                # The HourTracker class in 'agent.py' MUST be updated to handle this.
+                # The line in `update_after_week`:
+                #   _, _, batch = key
+                # MUST be changed to:
+                #   day, timeslot, batch = key.split('|')
+                "raw": firestore_safe_raw,
+                "batches": format_timetable_for_json(final_timetable_raw, day_dates, problem.days, problem.batches)["batches"],
+                # Why the solver stopped, generations run and best fitness reached.
+                "stats": stats
+            }
+        else:
+            return None
+
+    def generate(self, day_dates: dict, remaining_hours: dict = None, dynamic_constraints: dict = None, solver_options: dict = None, previous_timetable: dict = None, solution_memo: dict = None):
+        """Solves one week and returns the {"raw", "batches", "stats"} result (None without a Monday date)."""
+        # --- Start of generation logic ---
+        monday_date_str = day_dates.get("Monday")
+        if not monday_date_str:
+            return None # Cannot proceed without a start date
+        dynamic_constraints = self._week_constraints(day_dates, dynamic_constraints)
+
+        if remaining_hours is None:
+            current_remaining_hours = copy.deepcopy(self.problem.contracted_hours)
+        else:
+            current_remaining_hours = copy.deepcopy(remaining_hours)
+
+        week_number = 1
+
+        # Persistent result cache (result_cache.py), per request: solver_options["cache"].
+        cache_mode = (solver_options or {}).get("cache") or "use"
+        if cache_mode not in CACHE_MODES:
+            raise ValueError(f"Unknown cache mode: {cache_mode!r} (expected one of {', '.join(CACHE_MODES)})")
+        cache = shared_cache()
+        cache_key = None
+        if cache is not None and cache_mode != "use":
+            cache.record(cache_mode)
+        if cache is not None and cache_mode != "bypass":
+            cache_key = result_key(self.config, current_remaining_hours, dynamic_constraints, week_number, solver_options, previous_timetable)
+            payload = cache.get(cache_key) if cache_mode == "use" else None
+            if payload is not None:
+                print(f"Serving the cached result {cache_key[:12]} for the week of {monday_date_str}.")
+                result = json.loads(payload)
+                result["stats"]["cache"] = "hit"
+                return result
+
+        warm_start = encode_timetable(self.problem, previous_timetable) if previous_timetable else None
+        best_genome, stats = self.solve_week(current_remaining_hours, week_number, dynamic_constraints, solver_options, warm_start, solution_memo)
+        result = self._result(best_genome, day_dates, stats)
+        if cache_key is None or result is None or stats["best_fitness"] < 1.0:
+            return result
+        # Stored and returned as the same JSON bytes, so a later hit is identical.
+        payload = json.dumps(result).encode("utf-8")
+        cache.put(cache_key, payload)
+        return json.loads(payload)
+
+    def repair_week(self, day_dates: dict, previous_timetable: dict, remaining_hours: dict = None, dynamic_constraints: dict = None, solver_options: dict = None):
+        """
+        Localized repair of an already solved week (e.g. after teacher leave).
+        Every session that is still valid stays where it is; only the displaced
+        ones are re-placed around the existing occupancy, followed by a short
+        local search if clashes remain. Falls back to a full solve_week only
+        when that does not give a conflict-free week. stats["sessions_moved"]
+        counts the previous sessions that did not stay in place.
+        """
+        if not day_dates.get("Monday"):
+            return None
+        problem = self.problem
+        solver_options = solver_options or {}
+        started = time.time()
+        dynamic_constraints = self._week_constraints(day_dates, dynamic_constraints)
+        current_remaining_hours = copy.deepcopy(self.problem.contracted_hours if remaining_hours is None else remaining_hours)
+        week_number = 1
+
+        base = encode_timetable(problem, previous_timetable)
+        with phase("seeding"):
+            constructor = TimetableConstructor(problem, current_remaining_hours, week_number, dynamic_constraints, self.rng)
+            genome = constructor.build(base=base)
+        fitness = genome_fitness(problem, genome)
+        stop_reason = "repaired"
+        if fitness < 1.0:
+            with phase("local_search"):
+                repaired, repaired_fitness = repair(
+                    problem, [genome], dynamic_constraints, solver_options.get("local_search") or "tabu",
+                    max_iterations=solver_options.get("local_search_iterations", DEFAULT_ITERATIONS),
+                    time_budget=solver_options.get("repair_time", REPAIR_TIME_BUDGET),
+                    rng=self.rng,
+                )
+            if repaired_fitness > fitness:
+                genome, fitness = repaired, repaired_fitness
+        if fitness < 1.0:
+            print("Localized repair left conflicts; solving the whole week.")
+            solved, solve_stats = self.solve_week(current_remaining_hours, week_number, dynamic_constraints, solver_options, warm_start=genome)
+            if solve_stats["best_fitness"] > fitness:
+                genome, fitness, stop_reason = solved, solve_stats["best_fitness"], solve_stats["stop_reason"]
+        else:
+            record_solve("repaired", 0, 0)
+
+        before = {(b, d, s, length, value) for b, d, s, length, value in extract_sessions(problem, base)}
+        after = {(b, d, s, length, value) for b, d, s, length, value in extract_sessions(problem, genome)}
+        stats = {
+            "stop_reason": stop_reason,
+            "generations": 0,
+            "best_fitness": fitness,
+            "elapsed": round(time.time() - started, 3),
+            "sessions_moved": len(before - after),
+        }
+        print(f"Repaired week: {stats['sessions_moved']} sessions moved, fitness {fitness:.4f} ({stats['elapsed']}s)")
+        return self._result(genome, day_dates, stats)
+
+    def solve_week(self, remaining_hours: dict, week_num: int, dynamic_constraints: dict = None, solver_options: dict = None, warm_start=None, solution_memo: dict = None):
+        """
+        Solves one week with the backend picked by choose_backend (the GA,
+        single-process or islands, with an optional local-search phase, or the
+        exact search), optionally seeded from a `warm_start` genome. Returns
+        (best_genome, stats) where stats reports the backend used, why the run
+        stopped, how many generations ran and the best fitness reached.
+
+        solution_memo is a dict shared by the weeks of one multi-week run. It maps
+        demand signatures to solved (genome, fitness): a perfect earlier solution
+        is reused as-is, an imperfect one becomes the warm start.
+        """
+        problem = self.problem
+        solver_options = solver_options or {}
+        started = time.time()
+
+        signature = None
+        if solution_memo is not None:
+            signature = problem.demand_signature(remaining_hours, week_num, dynamic_constraints)
+            if signature in solution_memo:
+                memo_genome, memo_fitness = solution_memo[signature]
+                if memo_fitness == 1.0:
+                    print("Reusing the solved timetable of an earlier week with the same demand.")
+                    stats = {"stop_reason": "reused", "backend": "memo", "generations": 0, "evaluations": 0, "best_fitness": memo_fitness, "elapsed": round(time.time() - started, 3)}
+                    record_solve("reused", 0, 0)
+                    return memo_genome.copy(), stats
+                if warm_start is None:
+                    warm_start = memo_genome
+        deadline = _resolve_deadline(solver_options)
+        requested = solver_options.get("backend") or SOLVER_BACKEND
+        backend = choose_backend(problem, remaining_hours, week_num, solver_options, deadline)
+
+        stats = {"backend": backend, "evaluations": 0}
+        if backend == "exact":
+            if requested == "exact":
+                exact_deadline = deadline
+            elif deadline is not None:
+                exact_deadline = time.time() + EXACT_TIME_SHARE * (deadline - time.time())
+            else:
+                exact_deadline = time.time() + solver_options.get("exact_time_limit", EXACT_TIME_LIMIT)
+            best_genome, exact_stats = self._solve_exact(remaining_hours, week_num, dynamic_constraints, solver_options, exact_deadline)
+            best_fitness, stop_reason, generations_run = exact_stats["best_fitness"], exact_stats["stop_reason"], 0
+            stats["exact_nodes"] = exact_stats["nodes"]
+            if stop_reason == "perfect" or requested == "exact":
+                record_solve(stop_reason, 0, 0)
+            else:
+                # Not solved outright: the GA continues from the exact search's best placement.
+                print(f"Exact search stopped ({stop_reason}) after {exact_stats['nodes']} nodes; continuing with the GA.")
+                stats.update(backend="exact+ga", exact_stop_reason=stop_reason)
+                best_genome, best_fitness, generations_run, stop_reason, ga_stats = self._solve_ga(
+                    remaining_hours, week_num, dynamic_constraints, solver_options, best_genome, deadline)
+                stats.update(ga_stats)
+        else:
+            best_genome, best_fitness, generations_run, stop_reason, ga_stats = self._solve_ga(
+                remaining_hours, week_num, dynamic_constraints, solver_options, warm_start, deadline)
+            stats.update(ga_stats)
+
+        if signature is not None and best_fitness >= solution_memo.get(signature, (None, -1))[1]:
+            solution_memo[signature] = (best_genome.copy(), best_fitness)
+
+        stats.update({
+            "stop_reason": stop_reason,
+            "generations": generations_run,
+            "best_fitness": best_fitness,
+            "elapsed": round(time.time() - started, 3),
+        })
+        return best_genome, stats
+
+    def _solve_exact(self, remaining_hours: dict, week_num: int, dynamic_constraints: dict, solver_options: dict, deadline: float = None):
+        """Exact backend; returns (genome, search stats) as ExactSearch.run does."""
+        with phase("exact_search"):
+            search = ExactSearch(self.problem, remaining_hours, week_num, dynamic_constraints)
+            genome, stats = search.run(deadline, solver_options.get("exact_node_limit", DEFAULT_NODE_LIMIT))
+        print(f"Exact search ({search.total_sessions} sessions) | {stats['stop_reason']} after {stats['nodes']} nodes | Best Fitness: {stats['best_fitness']:.4f}")
+        return genome, stats
+
+    def _solve_ga(self, remaining_hours: dict, week_num: int, dynamic_constraints: dict, solver_options: dict, warm_start=None, deadline: float = None):
+        """GA backend; returns (best_genome, best_fitness, generations_run, stop_reason, {"evaluations", "islands"})."""
+        problem, rng = self.problem, self.rng
+        population_size = solver_options.get("population_size", DEFAULT_POPULATION_SIZE)
+        generations = solver_options.get("generations", DEFAULT_GENERATIONS)
+        fitness_backend = solver_options.get("fitness_backend")
+        stall_limit = solver_options.get("stall_limit")
+        # Optional progress callback(gen, best_fitness), e.g. for job status.
+        progress_callback = solver_options.get("on_generation")
+        # Optional callback(stats dict) with best/mean fitness, diversity and evaluations.
+        stats_callback = solver_options.get("on_generation_stats")
+
+        def on_generation(gen, best_fitness):
+            _print_progress(gen, best_fitness)
+            if progress_callback:
+                progress_callback(gen, best_fitness)
+
+        # Larger configs are split across worker processes (see islands.py).
+        from islands import IslandsUnavailable, resolve_island_count, run_island_model
+        num_islands = resolve_island_count(problem, solver_options.get("islands"))
+        ranked = None
+        if num_islands > 1:
+            try:
+                ranked, generations_run, stop_reason, evaluations = run_island_model(
+                    problem, remaining_hours, week_num, dynamic_constraints,
+                    num_islands=num_islands,
+                    population_size=population_size,
+                    generations=generations,
+                    migration_interval=solver_options.get("migration_interval"),
+                    migrants=solver_options.get("migrants"),
+                    fitness_backend=fitness_backend,
+                    seeding=solver_options.get("seeding"),
+                    warm_start=warm_start,
+                    deadline=deadline,
+                    stall_limit=stall_limit,
+                    on_generation=progress_callback,
+                    on_generation_stats=stats_callback,
+                    rng=rng,
+                )
+            except IslandsUnavailable as e:
+                print(f"{e}; evolving in this process instead")
+                num_islands = 1
+        if ranked is None:
+            with phase("seeding"):
+                population = create_initial_population(problem, population_size, remaining_hours, week_num, dynamic_constraints, solver_options.get("seeding"), warm_start, rng)
+            population, scores, generations_run, stop_reason, evaluations = evolve_population(
+                problem, population, generations, fitness_backend,
+                on_generation=on_generation, deadline=deadline, stall_limit=stall_limit, rng=rng,
+                on_generation_stats=stats_callback, dynamic_constraints=dynamic_constraints,
+            )
+            ranked = sorted(zip(population, scores), key=lambda x: x[1], reverse=True)
+
+        # Repair and export work on the cell genome, which holds one session
+        # per batch cell: overlaps are moved (or unplaced) first and the
+        # candidates rescored, so the reported fitness is the exported one's.
+        candidates = []
+        for genome, _ in ranked[:max(solver_options.get("local_search_starts", 3), 1)]:
+            resolved = resolve_overlaps(problem, genome, dynamic_constraints)
+            candidates.append((resolved, genome_fitness(problem, resolved)))
+        candidates.sort(key=lambda x: x[1], reverse=True)
+        best_genome, best_fitness = to_cell_genome(problem, candidates[0][0]), candidates[0][1]
+        unplaced = int((~placed(candidates[0][0])).sum())
+        if best_fitness == 1.0:
+            stop_reason = "perfect"
+        method = solver_options.get("local_search")
+        time_budget = solver_options.get("local_search_time", DEFAULT_TIME_BUDGET)
+        if deadline is not None:
+            time_budget = min(time_budget, deadline - time.time())
+        if method and best_fitness < 1.0 and time_budget > 0:
+            # Memetic phase: targeted repair moves on the best few individuals.
+            # Local search cannot add sessions, so it only starts from
+            # individuals missing as many sessions as the best one and their
+            # score keeps that penalty.
+            starts = [to_cell_genome(problem, genome) for genome, _ in candidates
+                      if int((~placed(genome)).sum()) == unplaced]
+            with phase("local_search"):
+                repaired, repaired_fitness = repair(
+                    problem, starts, dynamic_constraints, method,
+                    max_iterations=solver_options.get("local_search_iterations", DEFAULT_ITERATIONS),
+                    time_budget=time_budget,
+                    rng=rng,
+                )
+            repaired_fitness = with_unplaced(repaired_fitness, unplaced)
+            print(f"Local search ({method}) | Best Fitness: {best_fitness:.4f} -> {repaired_fitness:.4f}")
+            if repaired_fitness > best_fitness:
+                best_genome, best_fitness = repaired, repaired_fitness
+                if best_fitness == 1.0:
+                    stop_reason = "perfect"
+
+        record_solve(stop_reason, generations_run, evaluations)
+        return best_genome, best_fitness, generations_run, stop_reason, {"evaluations": evaluations, "islands": num_islands}
+
+
+def repair_timetable_from_config(config: dict, day_dates: dict, previous_timetable: dict, remaining_hours: dict = None, dynamic_constraints: dict = None, solver_options: dict = None, calendar: SemesterCalendar = None):
+    """
+    Like generate_timetable_from_config, but repairs previous_timetable (a
+    week's 'raw' result) in place instead of solving the week again; see
+    TimetableSolver.repair_week.
+    """
+    solver = TimetableSolver(config, seed=(solver_options or {}).get("seed"), calendar=calendar)
+    return solver.repair_week(day_dates, previous_timetable, remaining_hours, dynamic_constraints, solver_options)
+
+
+def generate_timetable_from_config(config: dict, day_dates: dict, remaining_hours: dict = None, dynamic_constraints: dict = None, solver_options: dict = None, previous_timetable: dict = None, solution_memo: dict = None, calendar: SemesterCalendar = None):
     """
     High-level function called by the server. It's now stateless and robust.
     It takes a configuration, specific dates, and remaining hours, runs the
     generation process, and returns a dictionary with both raw and formatted results.
+
+    solver_options may set population_size, generations, time_limit (seconds)
+    or deadline (time.time()), stall_limit (generations without improvement)
+    seed (for a reproducible run), backend ("ga", "exact" or "auto"; see
+    choose_backend) and cache ("use", "refresh" or "bypass"; see
+    result_cache.py). Every backend returns the same result format.
+    previous_timetable is an earlier 'raw' result for the same week; when given,
+    the GA is warm-started from it instead of a fresh random population.
+    Passing the same solution_memo dict for every week of a multi-week run lets
+    weeks with an identical demand signature reuse an earlier solution.
+    calendar defaults to the cached SemesterCalendar for this config.
     """
-    # Override global variables with the provided config.
-    global DAYS, TIMESLOTS, SEMESTER_WEEKS, CONTRACTED_HOURS, COURSE_LOAD, SUBJECTS, TEACHERS, TEACHER_AVAILABILITY, ROOMS, BATCHES
-
-    DAYS = config.get("DAYS", [])
-    TIMESLOTS = config.get("TIMESLOTS", [])
-    SEMESTER_WEEKS = config.get("SEMESTER_WEEKS", 15)
-    CONTRACTED_HOURS = config.get("CONTRACTED_HOURS", {})
-    COURSE_LOAD = config.get("COURSE_LOAD", {})
-    SUBJECTS = config.get("SUBJECTS", {})
-    TEACHERS = config.get("TEACHERS", {})
-    TEACHER_AVAILABILITY = config.get("TEACHER_AVAILABILITY", {})
-    ROOMS = config.get("ROOMS", {})
-    BATCHES = config.get("BATCHES", [])
-
-    # --- Start of generation logic ---
-    monday_date_str = day_dates.get("Monday")
-    if not monday_date_str:
-        return None # Cannot proceed without a start date
-    start_of_week = date.fromisoformat(monday_date_str)
-
-    dynamic_constraints = check_for_holidays(start_of_week, country_code='IN')
-
-    if remaining_hours is None:
-        current_remaining_hours = copy.deepcopy(CONTRACTED_HOURS)
-    else:
-        current_remaining_hours = copy.deepcopy(remaining_hours)
-
-    week_number = 1
-
-    final_timetable_raw = run_genetic_algorithm(current_remaining_hours, week_number, dynamic_constraints)
-
-    if final_timetable_raw:
-        # ### FIX ###
-        # Firestore cannot save dictionaries that have tuples as keys.
-        # To fix this, we convert the tuple keys e.g., ('Monday', '9-10', 'Batch_A')
-        # into a single string e.g., "Monday|9-10|Batch_A".
-        firestore_safe_raw = {f"{k[0]}|{k[1]}|{k[2]}": v for k, v in final_timetable_raw.items()}
-
-        return {
-            # IMPORTANT: The 'raw' key now contains string keys to be Firestore-compatible.
-            # The HourTracker class in 'agent.py' MUST be updated to handle this.
-            # The line in `update_after_week`:
-            #   _, _, batch = key
-            # MUST be changed to:
-            #   day, timeslot, batch = key.split('|')
-            "raw": firestore_safe_raw,
-            "batches": format_timetable_for_json(final_timetable_raw, day_dates)["batches"]
-        }
-    else:
-        return None
+    solver = TimetableSolver(config, seed=(solver_options or {}).get("seed"), calendar=calendar)
+    return solver.generate(day_dates, remaining_hours, dynamic_constraints, solver_options, previous_timetable, solution_memo)
 
-def format_timetable_for_json(timetable: dict, day_dates: dict):
+def format_timetable_for_json(timetable: dict, day_dates: dict, days: list, batches: list):
     """Converts the timetable from its internal format to a clean, nested JSON structure."""
     json_output = {
         "weekOf": day_dates.get("Monday"),
-        "batches": {batch: {day: {} for day in DAYS} for batch in BATCHES}
+        "batches": {batch: {day: {} for day in days} for batch in batches}
     }
 
     for key, value in timetable.items():
@@ -104,51 +415,6 @@ def format_timetable_for_json(timetable: dict, day_dates: dict):
             }
     return json_output
 
-# --- Priority System Functions (Made More Robust) ---
-def calculate_subject_priorities(batch):
-    """Calculates priority scores for subjects, safely handling non-numeric data."""
-    batch_subjects = CONTRACTED_HOURS.get(batch, {})
-    if not batch_subjects:
-        return {}
-
-    # Ensure all values are numeric before processing to prevent TypeErrors.
-    numeric_values = [v for v in batch_subjects.values() if isinstance(v, (int, float))]
-    if not numeric_values:
-        return {} # Return if no valid numbers are found
-
-    max_hours = max(numeric_values)
-    min_hours = min(numeric_values)
-
-    priorities = {}
-    for subject, hours in batch_subjects.items():
-        if not isinstance(hours, (int, float)):
-            continue
-
-        if max_hours == min_hours:
-            priorities[subject] = 1.0
-        else:
-            # This calculation is now safe from TypeErrors and ZeroDivisionErrors
-            normalized_priority = 0.3 + 0.7 * (hours - min_hours) / (max_hours - min_hours)
-            priorities[subject] = normalized_priority
-    return priorities
-
-
-def get_priority_ordered_subjects(batch, remaining_hours):
-    priorities = calculate_subject_priorities(batch)
-    batch_remaining = remaining_hours.get(batch, {})
-
-    subject_info = []
-    for subject in COURSE_LOAD.get(batch, {}):
-        priority = priorities.get(subject, 0.5)
-        contracted_total = CONTRACTED_HOURS.get(batch, {}).get(subject, 0)
-        remaining = batch_remaining.get(subject, contracted_total)
-
-        adjusted_priority = priority * (1 + remaining / 100)
-        subject_info.append((subject, adjusted_priority, remaining))
-
-    subject_info.sort(key=lambda x: (-x[1], -x[2]))
-    return subject_info
-
 # --- State Management (No longer used by the main API function, but kept for standalone runs) ---
 STATE_FILE = "timetable_state.json"
 def load_state():
@@ -171,91 +437,87 @@ def save_state(start_of_week_date):
 # --- Holiday Detection ---
 def check_for_holidays(start_of_week, country_code='IN'):
     holiday_days = []
-    country_holidays = holidays.country_holidays(country_code)
     for i in range(5):
         current_date = start_of_week + timedelta(days=i)
-        if current_date in country_holidays:
+        if current_date in country_holidays(country_code, (current_date.year,)):
             holiday_days.append(current_date.strftime('%A'))
     return {"holiday_days": holiday_days}
 
 # --- Genetic Algorithm Core (Made More Robust) ---
-def is_teacher_available(teacher, timeslot):
-    return timeslot in TEACHER_AVAILABILITY.get(teacher, [])
-
-def create_random_timetable(remaining_hours: dict, week_num: int, dynamic_constraints: dict = None):
-    dynamic_constraints = dynamic_constraints or {}
-    holiday_days = dynamic_constraints.get("holiday_days", [])
-    unavailable_teachers = dynamic_constraints.get("unavailable_teachers", []) # For agent requests
+def create_random_timetable(problem: CompiledProblem, remaining_hours: dict, week_num: int, dynamic_constraints: dict = None, rng=random):
+    """Builds one random genome, placing each session on a random start that is free for its batch, teacher and a room."""
+    occupancy = Occupancy(problem, dynamic_constraints)
 
     teacher_assignments = {}
-    for batch in BATCHES:
-        for subject in COURSE_LOAD.get(batch, {}):
-            possible_teachers = [t for t, subs in TEACHERS.items() if subject in subs]
+    for b in range(problem.num_batches):
+        for subject_id in problem.batch_subjects[b]:
+            possible_teachers = problem.subject_teachers[subject_id]
             if not possible_teachers:
-                print(f"Error: No teacher found for subject: {subject}")
+                print(f"Error: No teacher found for subject: {problem.subjects[subject_id]}")
                 continue
-            teacher_assignments[(batch, subject)] = random.choice(possible_teachers)
-
-    timetable = {}
-    for batch in BATCHES:
-        priority_subjects = get_priority_ordered_subjects(batch, remaining_hours)
-        for subject, _, remaining in priority_subjects:
-            is_lab = SUBJECTS.get(subject, {}).get("is_lab", False)
-            num_slots_per_session = 2 if is_lab else 1
-
-            min_hours = COURSE_LOAD.get(batch, {}).get(subject, 1)
-            rem_hrs = remaining_hours.get(batch, {}).get(subject, 0)
-            weeks_left = max(1, SEMESTER_WEEKS - week_num + 1)
-            target_hours = math.ceil(rem_hrs / weeks_left)
-            hours_to_schedule = max(min_hours, target_hours)
-            sessions_to_schedule = (hours_to_schedule + num_slots_per_session - 1) // num_slots_per_session
-
-            scheduled_sessions = 0
-            for _ in range(300): # Attempts to schedule
-                if scheduled_sessions >= sessions_to_schedule:
-                    break
+            teacher_assignments[(b, subject_id)] = rng.choice(possible_teachers)
 
-                teacher_key = (batch, subject)
-                if teacher_key not in teacher_assignments:
-                    continue
-                teacher = teacher_assignments[teacher_key]
+    genome = new_genome(problem)
+    for b in range(problem.num_batches):
+        for subject_id, _ in problem.ordered_subjects(b, remaining_hours):
+            num_slots_per_session = int(problem.session_length[subject_id])
+            sessions_to_schedule = problem.sessions_to_schedule(b, subject_id, remaining_hours, week_num)
 
-                room_type = "Lab" if is_lab else "Lecture"
-                possible_rooms = [r for r, d in ROOMS.items() if d["type"] == room_type]
-                if not possible_rooms: continue
-
-                day = random.choice(DAYS)
-                # Apply constraints
-                if day in holiday_days: continue
-                is_teacher_unavailable = any(
-                    entry["teacher"] == teacher and day in entry["days"] for entry in unavailable_teachers
-                )
-                if is_teacher_unavailable: continue
-
-                max_slot_index = len(TIMESLOTS) - num_slots_per_session
-                if max_slot_index < 0: continue
-
-                start_slot_index = random.randint(0, max_slot_index)
-                if not is_teacher_available(teacher, TIMESLOTS[start_slot_index]):
-                    continue
+            teacher = teacher_assignments.get((b, subject_id))
+            possible_rooms = problem.subject_rooms[subject_id]
+            if teacher is None or not possible_rooms or num_slots_per_session > problem.num_slots:
+                continue
 
-                slots_are_free = all((day, TIMESLOTS[start_slot_index + i], batch) not in timetable for i in range(num_slots_per_session))
+            for _ in range(sessions_to_schedule):
+                # Holidays, leave days and availability are part of the free starts.
+                starts = occupancy.free_starts(b, teacher, num_slots_per_session, possible_rooms)
+                if not starts:
+                    break
+                day, start_slot_index = occupancy.cell(rng.choice(list(positions(starts))))
+                room = rng.choice(occupancy.free_rooms(possible_rooms, day, start_slot_index, num_slots_per_session))
+                genome[b, day, start_slot_index:start_slot_index + num_slots_per_session] = (subject_id, teacher, room)
+                occupancy.place(b, teacher, room, day, start_slot_index, num_slots_per_session)
+    return genome
 
-                if slots_are_free:
-                    room = random.choice(possible_rooms)
-                    for i in range(num_slots_per_session):
-                        ts = TIMESLOTS[start_slot_index + i]
-                        timetable[(day, ts, batch)] = (subject, teacher, room)
-                    scheduled_sessions += 1
-    return timetable
 
+# "constructive" seeds from seeding.TimetableConstructor; "random" uses the
+# trial-and-error create_random_timetable above.
+SEEDING_STRATEGY = "constructive"
+# Random swaps applied to the mutated half of a warm-started population.
+WARM_START_MUTATIONS = 2
 
-def calculate_fitness(timetable: dict, dynamic_constraints: dict = None):
+def create_initial_population(problem: CompiledProblem, size: int, remaining_hours: dict, week_num: int, dynamic_constraints: dict = None, strategy: str = None, warm_start=None, rng=random):
+    """
+    Seeds a population of session genomes (see session_genome.py). With a
+    `warm_start` cell genome (e.g. the stored solution for this week), every
+    individual keeps the still-valid sessions of that solution and re-places
+    only the displaced ones; half of them are then mutated so the GA still
+    has something to explore.
+    """
+    constructor = TimetableConstructor(problem, remaining_hours, week_num, dynamic_constraints, rng)
+    layout = SessionLayout(problem, constructor.requests)
+    if warm_start is not None:
+        population = [constructor.build_sessions(layout, base=warm_start) for _ in range(size)]
+        for genome in population[size // 2:]:
+            for _ in range(WARM_START_MUTATIONS):
+                mutate(genome, constructor.occupancy, mutation_rate=1.0, rng=rng)
+        return population
+    if (strategy or SEEDING_STRATEGY) == "random":
+        return [layout.from_cells(create_random_timetable(problem, remaining_hours, week_num, dynamic_constraints, rng)) for _ in range(size)]
+    return [constructor.build_sessions(layout) for _ in range(size)]
+
+
+def calculate_fitness(timetable, dynamic_constraints: dict = None, timeslots: list = None, unplaced: int = 0):
+    # Reference (dict-based) scorer; `timeslots` gives the slot order used for gaps
+    # and `unplaced` the demanded sessions missing from the timetable. Also takes
+    # a list of (key, value) pairs, where one batch may hold two sessions at once.
+    slot_index = {slot: i for i, slot in enumerate(timeslots or [])}
     conflicts = 0
     occupied = {}
     teacher_gaps = {}
 
-    for key, value in timetable.items():
+    entries = timetable.items() if isinstance(timetable, dict) else timetable
+    for key, value in entries:
         if not (isinstance(key, tuple) and len(key) == 3 and isinstance(value, tuple) and len(value) == 3):
             conflicts += 10; continue
 
@@ -273,7 +535,7 @@ def calculate_fitness(timetable: dict, dynamic_constraints: dict = None):
         occupied[slot_key]["rooms"].add(room)
         occupied[slot_key]["batches"].add(batch)
 
-        teacher_gaps.setdefault(teacher, {}).setdefault(day, []).append(TIMESLOTS.index(timeslot))
+        teacher_gaps.setdefault(teacher, {}).setdefault(day, []).append(slot_index[timeslot])
 
     for _, days_data in teacher_gaps.items():
         for _, slot_indices in days_data.items():
@@ -282,62 +544,205 @@ def calculate_fitness(timetable: dict, dynamic_constraints: dict = None):
                 if slot_indices[i+1] - slot_indices[i] > 1:
                     conflicts += 0.5
 
+    conflicts += UNPLACED_PENALTY * unplaced
     return 1 / (1 + conflicts)
 
-def select_parents(population_with_fitness):
+# Which evaluator scores the population: "numpy" (vectorised), "python" (the
+# dict-based calculate_fitness above) or "compare" (both, warning on mismatch).
+FITNESS_BACKEND = os.environ.get("TIMETABLE_FITNESS_BACKEND", "numpy")
+
+def _reference_scores(problem: CompiledProblem, population: list):
+    """calculate_fitness of every session genome, overlaps within a batch included."""
+    return [calculate_fitness(decode_sessions(problem, g), timeslots=problem.timeslots, unplaced=int((~placed(g)).sum())) for g in population]
+
+def score_population(problem: CompiledProblem, population: list, backend: str = None):
+    """Fitness of every genome in the population, using the selected backend."""
+    backend = backend or FITNESS_BACKEND
+    if backend == "python":
+        return _reference_scores(problem, population)
+
+    scores = evaluate_population(problem, population).tolist()
+    if backend == "compare":
+        reference = _reference_scores(problem, population)
+        mismatches = sum(1 for a, b in zip(scores, reference) if a != b)
+        if mismatches:
+            print(f"{Fore.YELLOW}Warning: numpy and python fitness disagree on {mismatches}/{len(population)} individuals.")
+    return scores
+
+def select_parents(population_with_fitness, rng=random):
     # Tournament selection
-    return max(random.sample(population_with_fitness, 5), key=lambda x: x[1])[0]
-
-def crossover(parent1, parent2):
-    child = {}
-    keys1 = set(parent1.keys())
-    keys2 = set(parent2.keys())
-    # Inherit common slots from a random parent
-    for key in keys1.intersection(keys2):
-        child[key] = random.choice([parent1[key], parent2[key]])
-    # Inherit unique slots
-    for key in keys1.difference(keys2):
-        child[key] = parent1[key]
-    for key in keys2.difference(keys1):
-        child[key] = parent2[key]
-    return child
-
-def mutate(timetable, mutation_rate=0.05):
-    if random.random() < mutation_rate and len(timetable) > 1:
-        key1, key2 = random.sample(list(timetable.keys()), 2)
-        timetable[key1], timetable[key2] = timetable[key2], timetable[key1]
-    return timetable
-
-def run_genetic_algorithm(remaining_hours: dict, week_num: int, dynamic_constraints: dict = None):
-    POPULATION_SIZE, NUM_GENERATIONS = 100, 200 # Reduced for faster API response
-
-    population = [create_random_timetable(remaining_hours, week_num, dynamic_constraints) for _ in range(POPULATION_SIZE)]
-
-    for gen in range(NUM_GENERATIONS):
-        population_with_fitness = [(tt, calculate_fitness(tt, dynamic_constraints)) for tt in population]
-        best_fitness = max(p[1] for p in population_with_fitness)
-
-        if (gen + 1) % 50 == 0:
-            print(f"Generation {gen+1:03} | Best Fitness: {best_fitness:.4f}")
+    return max(rng.sample(population_with_fitness, 5), key=lambda x: x[1])[0]
+
+def _coin_flips(rng, shape):
+    """Boolean array of fair coin flips drawn from a random.Random-style rng."""
+    n = int(np.prod(shape))
+    bits = np.unpackbits(np.frombuffer(rng.getrandbits(8 * ((n + 7) // 8) or 8).to_bytes((n + 7) // 8 or 1, 'little'), dtype=np.uint8))
+    return bits[:n].reshape(shape).astype(bool)
+
+def crossover(parent1, parent2, rng=random):
+    # Session genomes share their rows, so the child takes each (batch,
+    # subject)'s sessions, whole and with their teacher, from a random parent.
+    if not len(parent1):
+        return parent1.copy()
+    units, unit_of_row = np.unique(parent1[:, [GENE_BATCH, GENE_SUBJECT]], axis=0, return_inverse=True)
+    take_p1 = _coin_flips(rng, (len(units),))[unit_of_row.ravel()]
+    return np.where(take_p1[:, None], parent1, parent2)
+
+def mutate(genome, occupancy: Occupancy, mutation_rate=0.05, rng=random):
+    # Moves one random session as a whole (a lab keeps both of its slots) to a
+    # start where its batch, teacher and a room are free under `occupancy`'s
+    # week constraints, so the mutation never creates a double booking. A
+    # session that could not be placed so far gets placed the same way, or on
+    # a start its teacher may use, clashes accepted, when nothing is free.
+    if rng.random() < mutation_rate and len(genome):
+        _relocate_session(genome, occupancy, rng)
+    return genome
+
+def _relocate_session(genome, occupancy: Occupancy, rng=random):
+    problem = occupancy.problem
+    row = rng.randrange(len(genome))
+    b, subject_id, teacher, room, d, s, length = genome[row].tolist()
+    if teacher == UNPLACED:
+        # Keep to the teacher the subject's other sessions in this batch already have.
+        unit = (genome[:, GENE_BATCH] == b) & (genome[:, GENE_SUBJECT] == subject_id) & placed(genome)
+        teacher = int(genome[unit, GENE_TEACHER][0]) if unit.any() else rng.choice(problem.subject_teachers[subject_id])
+
+    genome[row, GENE_DAY] = UNPLACED
+    rooms = problem.subject_rooms[subject_id]
+    starts = occupancy.load_sessions(genome).free_starts(b, teacher, length, rooms)
+    if not starts and d == UNPLACED:
+        starts = occupancy.fallback_starts(b, teacher, length)
+    if not starts:
+        genome[row, GENE_DAY] = d  # Nowhere clash-free to go, not even back.
+        return
+    nd, ns = occupancy.cell(rng.choice(list(positions(starts))))
+    room = rng.choice(occupancy.free_rooms(rooms, nd, ns, length) or rooms)
+    genome[row, [GENE_TEACHER, GENE_ROOM, GENE_DAY, GENE_START]] = (teacher, room, nd, ns)
+
+def resolve_overlaps(problem: CompiledProblem, genome, dynamic_constraints: dict = None):
+    """
+    Copy of a session genome in which no two sessions of a batch overlap, so
+    to_cell_genome keeps every placed session. Each session that overlaps an
+    earlier one of its batch moves to its earliest clash-free start, else the
+    earliest start free for the batch, else it is left unplaced.
+    """
+    genome = genome.copy()
+    occupancy = Occupancy(problem, dynamic_constraints)
+    kept = [0] * problem.num_batches
+    overlapping = []
+    for row in np.flatnonzero(placed(genome)).tolist():
+        b, d, s, length = genome[row, [GENE_BATCH, GENE_DAY, GENE_START, GENE_LENGTH]].tolist()
+        mask = occupancy.span(d, s, length)
+        if kept[b] & mask:
+            overlapping.append(row)
+        else:
+            kept[b] |= mask
+    if not overlapping:
+        return genome
+
+    genome[overlapping, GENE_DAY] = UNPLACED
+    occupancy.load_sessions(genome)
+    for row in overlapping:
+        b, subject_id, teacher, room, _, _, length = genome[row].tolist()
+        rooms = problem.subject_rooms[subject_id]
+        cell = occupancy.first_free(b, teacher, length, rooms)
+        if cell is None:
+            batch_free = occupancy.runs(~occupancy.batch[b] & occupancy.all_cells, length) & occupancy.allowed_starts(teacher, length)
+            if not batch_free:
+                continue
+            cell = occupancy.cell((batch_free & -batch_free).bit_length() - 1)
+        nd, ns = cell
+        free_rooms = occupancy.free_rooms(rooms, nd, ns, length)
+        room = room if room in free_rooms or not free_rooms else free_rooms[0]
+        genome[row, [GENE_ROOM, GENE_DAY, GENE_START]] = (room, nd, ns)
+        occupancy.place(b, teacher, room, nd, ns, length)
+    return genome
+
+def next_generation(population_with_fitness: list, population_size: int, occupancy: Occupancy, rng=random):
+    """Elitism plus tournament-selected, crossed-over and mutated children (see mutate for `occupancy`)."""
+    elites_count = population_size // 10
+    elites = [p[0] for p in sorted(population_with_fitness, key=lambda x: x[1], reverse=True)[:elites_count]]
+    next_population = elites
+
+    while len(next_population) < population_size:
+        p1 = select_parents(population_with_fitness, rng)
+        p2 = select_parents(population_with_fitness, rng)
+        child = crossover(p1, p2, rng)
+        mutate(child, occupancy, rng=rng)
+        next_population.append(child)
+    return next_population
+
+def evolve_population(problem: CompiledProblem, population: list, generations: int, fitness_backend: str = None,
+                      should_stop=None, on_generation=None, deadline: float = None, stall_limit: int = None, rng=random,
+                      on_generation_stats=None, dynamic_constraints: dict = None):
+    """
+    Runs up to `generations` GA steps on a population of session genomes. Stops early on a perfect
+    score, at the wall-clock `deadline` (time.time()), after `stall_limit`
+    generations without improvement, or when should_stop() returns True.
+    on_generation(gen, best_fitness) is called once per generation, and
+    on_generation_stats(stats) with metrics.generation_stats when given.
+    Mutations respect the week's dynamic_constraints (holidays, leave).
+    Returns (population, scores, generations_run, stop_reason, evaluations),
+    evaluations counting every individual scored.
+    """
+    occupancy = Occupancy(problem, dynamic_constraints)
+    with phase("evaluation"):
+        scores = score_population(problem, population, fitness_backend)
+    evaluations = len(population)
+    best_so_far, stalled = max(scores), 0
+    for gen in range(generations):
+        best_fitness = max(scores)
+        if on_generation:
+            on_generation(gen, best_fitness)
+        if on_generation_stats:
+            on_generation_stats(generation_stats(gen, population, scores, evaluations))
+        if best_fitness > best_so_far:
+            best_so_far, stalled = best_fitness, 0
+        elif gen > 0:
+            stalled += 1
 
         if best_fitness == 1.0:
-            print(f"Found a perfect timetable in generation {gen+1}!")
-            return max(population_with_fitness, key=lambda x: x[1])[0]
-
-        elites_count = POPULATION_SIZE // 10
-        elites = [p[0] for p in sorted(population_with_fitness, key=lambda x: x[1], reverse=True)[:elites_count]]
-        next_population = elites
-
-        while len(next_population) < POPULATION_SIZE:
-            p1 = select_parents(population_with_fitness)
-            p2 = select_parents(population_with_fitness)
-            child = crossover(p1, p2)
-            mutate(child)
-            next_population.append(child)
-
-        population = next_population
-
-    return max(population, key=lambda tt: calculate_fitness(tt, dynamic_constraints))
+            return population, scores, gen, "perfect", evaluations
+        if stall_limit and stalled >= stall_limit:
+            return population, scores, gen, "stalled", evaluations
+        if deadline is not None and time.time() >= deadline:
+            return population, scores, gen, "deadline", evaluations
+        if should_stop and should_stop():
+            return population, scores, gen, "stopped", evaluations
+
+        with phase("selection_crossover"):
+            population = next_generation(list(zip(population, scores)), len(population), occupancy, rng)
+        with phase("evaluation"):
+            scores = score_population(problem, population, fitness_backend)
+        evaluations += len(population)
+    return population, scores, generations, "max_generations", evaluations
+
+def _print_progress(gen, best_fitness):
+    if best_fitness == 1.0:
+        print(f"Found a perfect timetable in generation {gen+1}!")
+    elif (gen + 1) % 50 == 0:
+        print(f"Generation {gen+1:03} | Best Fitness: {best_fitness:.4f}")
+
+def _resolve_deadline(solver_options: dict):
+    """Earliest of an absolute 'deadline' (time.time()) and 'time_limit' seconds from now."""
+    deadlines = [solver_options.get("deadline")]
+    if solver_options.get("time_limit"):
+        deadlines.append(time.time() + solver_options["time_limit"])
+    deadlines = [d for d in deadlines if d is not None]
+    return min(deadlines) if deadlines else None
+
+def run_genetic_algorithm(config: dict, remaining_hours: dict, week_num: int, dynamic_constraints: dict = None, solver_options: dict = None, solution_memo: dict = None, return_stats: bool = False):
+    """
+    Solves one week for `config` with the GA backend (whatever SOLVER_BACKEND
+    or solver_options["backend"] say) and returns the tuple-keyed timetable
+    dict, or (timetable, stats) with `return_stats`. stats["backend"] is "ga",
+    or "memo" when solution_memo already held a perfect solution.
+    """
+    solver_options = dict(solver_options or {}, backend="ga")
+    solver = TimetableSolver(config, seed=solver_options.get("seed"))
+    best_genome, stats = solver.solve_week(remaining_hours, week_num, dynamic_constraints, solver_options, solution_memo=solution_memo)
+    timetable = decode_genome(solver.problem, best_genome)
+    return (timetable, stats) if return_stats else timetable
 
 # --- Main Execution Block (for standalone testing) ---
 if __name__ == '__main__':
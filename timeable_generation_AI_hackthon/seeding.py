@@ -0,0 +1,125 @@
+import random
+
+from problem import CompiledProblem, extract_sessions, new_genome
+from occupancy import Occupancy, positions
+from session_genome import SessionLayout
+
+# ==============================================================================
+#                     CONSTRAINT-AWARE CONSTRUCTION HEURISTIC
+# ==============================================================================
+# Instead of drawing random (day, start slot) pairs and throwing most of them
+# away, the feasible domain of every (teacher, session length) is built once
+# per run. Each individual then places its sessions most-constrained-first,
+# sampling only from what is still free for the batch, the teacher and at
+# least one room (see occupancy.py), so teachers and rooms are not
+# double-booked as long as a free start exists. A session with no free start
+# left is still placed, on a start its teacher may use, and its clash is left
+# to the GA and local search.
+
+
+class TimetableConstructor:
+    """Builds near-feasible genomes for one (config, week, constraints) run."""
+
+    def __init__(self, problem: CompiledProblem, remaining_hours: dict, week_num: int, dynamic_constraints: dict = None, rng=random):
+        self.problem = problem
+        self.rng = rng
+        self.occupancy = Occupancy(problem, dynamic_constraints)
+        self.day_blocked, self.teacher_day_blocked = self.occupancy.day_blocked, self.occupancy.teacher_day_blocked
+
+        # (batch, subject, sessions, session length) for everything placeable.
+        self.requests = []
+        for b in range(problem.num_batches):
+            for subject_id, _ in problem.ordered_subjects(b, remaining_hours):
+                length = int(problem.session_length[subject_id])
+                if not problem.subject_teachers[subject_id]:
+                    print(f"Error: No teacher found for subject: {problem.subjects[subject_id]}")
+                    continue
+                if not problem.subject_rooms[subject_id] or length > problem.num_slots:
+                    continue
+                sessions = problem.sessions_to_schedule(b, subject_id, remaining_hours, week_num)
+                self.requests.append((b, subject_id, sessions, length))
+        self._domains = {}
+
+    def domain(self, teacher: int, length: int):
+        """All (day, start slot) pairs a teacher may start a session of this length on."""
+        key = (teacher, length)
+        if key not in self._domains:
+            occupancy = self.occupancy
+            self._domains[key] = [occupancy.cell(p) for p in positions(occupancy.allowed_starts(teacher, length))]
+        return self._domains[key]
+
+    def build(self, base=None):
+        """
+        Builds a genome. With a `base` genome (warm start), its sessions are
+        kept unless they now fall on a blocked day or a teacher's leave day or
+        exceed this week's demand, and only the missing sessions are placed.
+        """
+        genome = new_genome(self.problem)
+        for b, d, s, length, value in self.place_sessions(base):
+            genome[b, d, s:s + length] = value
+        return genome
+
+    def build_sessions(self, layout: SessionLayout, base=None):
+        """Like build, but returns a session genome with `layout`'s rows."""
+        return layout.from_placements(self.place_sessions(base))
+
+    def place_sessions(self, base=None):
+        """The (batch, day, start, length, (subject, teacher, room)) sessions of one build."""
+        problem = self.problem
+        occupancy = self.occupancy.clear()
+        placements = []
+
+        def place(b, d, s, length, value):
+            occupancy.place(b, value[1], value[2], d, s, length)
+            placements.append((b, d, s, length, value))
+
+        demand = {(b, subject_id): sessions for b, subject_id, sessions, _ in self.requests}
+        kept_teacher = {}
+        if base is not None:
+            for b, d, s, length, value in extract_sessions(problem, base):
+                subject_id, teacher, room = value
+                key = (b, subject_id)
+                if demand.get(key, 0) <= 0 or self.day_blocked[d] or self.teacher_day_blocked[teacher, d]:
+                    continue
+                if not occupancy.can_place(b, teacher, room, d, s, length):
+                    continue
+                demand[key] -= 1
+                kept_teacher[key] = teacher
+                place(b, d, s, length, value)
+
+        units = []
+        for b, subject_id, _, length in self.requests:
+            sessions = demand[(b, subject_id)]
+            if sessions <= 0:
+                continue
+            teacher = kept_teacher.get((b, subject_id))
+            if teacher is None:
+                teacher = self.rng.choice(problem.subject_teachers[subject_id])
+            domain = self.domain(teacher, length)
+            units.append((len(domain) / sessions, self.rng.random(), b, subject_id, teacher, sessions, length))
+        units.sort()  # Most constrained first, random tie-break.
+
+        for _, _, b, subject_id, teacher, sessions, length in units:
+            rooms = problem.subject_rooms[subject_id]
+            for _ in range(sessions):
+                best_candidates, best_added_gaps = [], None
+                for position in positions(occupancy.free_starts(b, teacher, length, rooms)):
+                    d, s = occupancy.cell(position)
+                    blocks = occupancy.day_blocks(teacher, d)
+                    added_gaps = occupancy.day_blocks(teacher, d, occupancy.span(d, s, length)) - max(blocks, 1)
+                    if best_added_gaps is None or added_gaps < best_added_gaps:
+                        best_candidates, best_added_gaps = [], added_gaps
+                    if added_gaps == best_added_gaps:
+                        best_candidates.append((d, s))
+                if best_candidates:
+                    d, s = self.rng.choice(best_candidates)
+                    room = self.rng.choice(occupancy.free_rooms(rooms, d, s, length))
+                else:
+                    fallback = occupancy.fallback_starts(b, teacher, length)
+                    if not fallback:
+                        break  # The teacher cannot take this subject on any day this week.
+                    d, s = occupancy.cell(self.rng.choice(list(positions(fallback))))
+                    room = self.rng.choice(occupancy.free_rooms(rooms, d, s, length) or rooms)
+                place(b, d, s, length, (subject_id, teacher, room))
+
+        return placements
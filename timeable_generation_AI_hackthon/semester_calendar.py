@@ -0,0 +1,123 @@
+import json
+import threading
+from datetime import date, timedelta
+from functools import lru_cache
+
+import holidays
+
+# ==============================================================================
+#                     SEMESTER CALENDAR (blocked days and teacher leave)
+# ==============================================================================
+# Built once per config/semester. Combines public holidays, institution
+# closure dates and per-teacher leave into a date -> blocked table, so weekly
+# generation looks up its constraints instead of rebuilding holiday data.
+#
+# Optional config keys:
+#   "HOLIDAY_COUNTRY": "IN"                               (default "IN")
+#   "CLOSURE_DATES":   ["2025-10-02", ...]
+#   "TEACHER_LEAVE":   {"Dr. Gamma": ["2025-10-08", ...]}
+
+DEFAULT_COUNTRY = "IN"
+
+
+@lru_cache(maxsize=32)
+def country_holidays(country_code: str, years: tuple):
+    """Holiday table for a country and years, shared by all calendars."""
+    return holidays.country_holidays(country_code, years=list(years))
+
+
+def merge_constraints(*constraint_sets):
+    """Unions holiday_days and per-teacher unavailable days of several constraint dicts."""
+    holiday_days = []
+    teacher_days = {}
+    for constraints in constraint_sets:
+        if not constraints:
+            continue
+        for day in constraints.get("holiday_days", []):
+            if day not in holiday_days:
+                holiday_days.append(day)
+        for entry in constraints.get("unavailable_teachers", []):
+            days = teacher_days.setdefault(entry["teacher"], [])
+            days.extend(d for d in entry.get("days", []) if d not in days)
+
+    merged = {"holiday_days": holiday_days}
+    if teacher_days:
+        merged["unavailable_teachers"] = [{"teacher": t, "days": days} for t, days in teacher_days.items()]
+    return merged
+
+
+class SemesterCalendar:
+    """Indexed date -> {"holiday", "closed", "teachers"} table for one semester."""
+
+    def __init__(self, config: dict, start_date: date = None, weeks: int = None):
+        self.country_code = config.get("HOLIDAY_COUNTRY", DEFAULT_COUNTRY)
+        self.closures = {date.fromisoformat(d) for d in config.get("CLOSURE_DATES", [])}
+        self.teacher_leave = {}
+        for teacher, dates in config.get("TEACHER_LEAVE", {}).items():
+            for d in dates:
+                self.teacher_leave.setdefault(date.fromisoformat(d), set()).add(teacher.strip())
+
+        if start_date is None:
+            today = date.today()
+            start_date = today - timedelta(days=today.weekday())
+        weeks = weeks or config.get("SEMESTER_WEEKS", 15)
+        self.start_date = start_date
+        self.end_date = start_date + timedelta(weeks=weeks)
+
+        self._index = {}
+        current = start_date
+        while current < self.end_date:
+            self._index[current] = self._build_entry(current)
+            current += timedelta(days=1)
+
+    def _build_entry(self, day: date):
+        public = country_holidays(self.country_code, (day.year,))
+        return {
+            "holiday": public.get(day),
+            "closed": day in self.closures,
+            "teachers": self.teacher_leave.get(day, set()),
+        }
+
+    def entry(self, day: date):
+        """Blocked info for a date; dates outside the semester are computed on demand."""
+        if day not in self._index:
+            self._index[day] = self._build_entry(day)
+        return self._index[day]
+
+    def constraints_for_week(self, day_dates: dict):
+        """Constraints dict for a {day name: ISO date} week, as used by the solver."""
+        holiday_days = []
+        teacher_days = {}
+        for day_name, iso_date in day_dates.items():
+            info = self.entry(date.fromisoformat(iso_date))
+            if info["holiday"] or info["closed"]:
+                holiday_days.append(day_name)
+            for teacher in info["teachers"]:
+                teacher_days.setdefault(teacher, []).append(day_name)
+
+        constraints = {"holiday_days": holiday_days}
+        if teacher_days:
+            constraints["unavailable_teachers"] = [{"teacher": t, "days": days} for t, days in teacher_days.items()]
+        return constraints
+
+
+def _calendar_key(config: dict):
+    keys = ("HOLIDAY_COUNTRY", "CLOSURE_DATES", "TEACHER_LEAVE", "SEMESTER_WEEKS")
+    return json.dumps({k: config.get(k) for k in keys}, sort_keys=True)
+
+
+_CALENDARS = {}
+_MAX_CALENDARS = 32
+_CALENDARS_LOCK = threading.Lock()
+
+
+def calendar_for_config(config: dict):
+    """Returns the cached calendar for a config, building it on first use."""
+    key = _calendar_key(config)
+    with _CALENDARS_LOCK:
+        calendar = _CALENDARS.get(key)
+        if calendar is None:
+            if len(_CALENDARS) >= _MAX_CALENDARS:
+                _CALENDARS.pop(next(iter(_CALENDARS)))
+            calendar = _CALENDARS[key] = SemesterCalendar(config)
+        return calendar
@@ -3,36 +3,111 @@ import traceback
 import csv
 import io
 import copy
+import itertools
 
-from flask import Flask, request, jsonify, Response
+import time
+from flask import Flask, request, jsonify, Response, stream_with_context, g
 from flask_cors import CORS
 from dotenv import load_dotenv
 from firebase_admin import auth
 import firebase_admin
 from firebase_admin import credentials, firestore
 from datetime import date, timedelta
-from google.cloud.firestore_v1.base_query import FieldFilter
 
 # --- Initialization ---
 load_dotenv()
 
-try:
-    # IMPORTANT: Ensure your serviceAccountKey.json is in the same directory
-    cred = credentials.Certificate("serviceAccountKey.json")
-    firebase_admin.initialize_app(cred)
-    db = firestore.client()
-    print("✅ Firebase Admin SDK initialized successfully.")
-except Exception as e:
-    db = None
-    print(f"🔥 Firebase Admin SDK initialization failed: {e}")
+# GA island workers (islands.py) are spawned processes that import this file
+# again as "__mp_main__". They only need its definitions: no Firebase
+# connection and no background key refresh.
+IN_WORKER_PROCESS = __name__ == "__mp_main__"
+
+def _init_firebase():
+    try:
+        # IMPORTANT: Ensure your serviceAccountKey.json is in the same directory
+        cred = credentials.Certificate("serviceAccountKey.json")
+        firebase_admin.initialize_app(cred)
+        client = firestore.client()
+        print("✅ Firebase Admin SDK initialized successfully.")
+        return client
+    except Exception as e:
+        print(f"🔥 Firebase Admin SDK initialization failed: {e}")
+        return None
+
+db = None if IN_WORKER_PROCESS else _init_firebase()
 
 # Import necessary components from your other files
-from run import generate_timetable_from_config, CONTRACTED_HOURS
-from agent import process_dynamic_request, HourTracker
+from run import generate_timetable_from_config
+from result_cache import CACHE_MODES
+from agent import process_dynamic_request, HourTracker, DYNAMIC_REQUEST_MODES
+from semester_calendar import SemesterCalendar
+from concurrent.futures import ThreadPoolExecutor
+from jobs import JobRunner, InMemoryJobStore, QueueFullError, SUCCEEDED, FAILED
+from storage import FirestoreGenerationStore, InMemoryGenerationStore, build_teacher_index
+from metrics import REGISTRY, REQUEST_LATENCY, GENERATION_FLIGHTS, InstrumentedProxy, phase
+from auth_tokens import CachedTokenVerifier, FirebaseTokenVerifier, bearer_token
+from coalescing import KeyedLocks, SingleFlight, canonical_key
+
 
+# Generations are stored as a header plus one document per week (storage.py).
+# Every store call is timed as the "storage" phase.
+if db:
+    generation_store = InstrumentedProxy(FirestoreGenerationStore(db), "storage")
+else:
+    generation_store = InstrumentedProxy(InMemoryGenerationStore(), "storage")
+    if not IN_WORKER_PROCESS:
+        print("⚠️ Using the in-memory generation store; generations are lost on restart.")
 
 app = Flask(__name__)
 
+# Per-week solver budget: each week returns the best timetable found within
+# WEEK_TIME_LIMIT seconds, or earlier once WEEK_STALL_LIMIT generations pass
+# without improvement.
+WEEK_SOLVER_OPTIONS = {
+    "time_limit": float(os.getenv("WEEK_TIME_LIMIT", "15")),
+    "stall_limit": int(os.getenv("WEEK_STALL_LIMIT", "60")),
+}
+
+# --- Authentication ---
+# Every endpoint verifies its bearer token through one cached verifier
+# (auth_tokens.py); tests replace it with a CachedTokenVerifier around a
+# FakeTokenVerifier.
+token_verifier = CachedTokenVerifier(FirebaseTokenVerifier(), max_entries=int(os.getenv("AUTH_TOKEN_CACHE_SIZE", "1024")))
+if db:
+    token_verifier.verifier.start_key_refresh()
+
+def _authenticate():
+    """(uid, None) for the request's valid bearer token, otherwise (None, error message)."""
+    id_token = bearer_token(request.headers.get('Authorization'))
+    if not id_token:
+        return None, "Unauthorized: Missing or invalid token"
+    try:
+        return token_verifier.verify(id_token)['uid'], None
+    except Exception as e:
+        return None, f"Authentication error: {e}"
+
+# --- Request Metrics ---
+@app.before_request
+def _start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def _observe_request_latency(response):
+    # For streamed responses this is the time until the body starts.
+    started = g.pop('request_started', None)
+    if started is not None:
+        endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+        REQUEST_LATENCY.observe(time.perf_counter() - started, endpoint=endpoint, method=request.method, status=response.status_code)
+    return response
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus scrape endpoint; set METRICS_TOKEN to require it as a bearer token."""
+    token = os.getenv("METRICS_TOKEN")
+    if token and request.headers.get('Authorization') != f"Bearer {token}":
+        return Response("Unauthorized", status=401)
+    return Response(REGISTRY.render(), mimetype="text/plain; version=0.0.4")
+
 # --- Security & CORS Configuration ---
 CORS(app, resources={r"/api/*": {"origins": ["http://localhost:3000", "http://localhost:5173", "null"]}})
 
@@ -75,21 +150,32 @@ def login():
         return jsonify({"error": f"An unexpected error occurred: {e}"}), 500
 
 
-# --- CSV Generation Helper (Unchanged) ---
-def _create_multi_week_csv(all_weekly_timetables, config):
-    output = io.StringIO()
-    writer = csv.writer(output)
+# --- CSV Generation Helpers ---
+# The multi-week CSV is rendered as a stream of chunks (one per batch of each
+# week) so responses can start as soon as a week is solved and no full copy of
+# the file is ever held in memory or stored.
+def _iter_week_csv(week_num, weekly_data, config):
+    """Yields the CSV text of one week, one chunk per batch."""
     batches = config.get("BATCHES", [])
     days = config.get("DAYS", [])
     timeslots = config.get("TIMESLOTS", [])
-    if not batches or not all_weekly_timetables: return ""
-    for week_num, weekly_data in enumerate(all_weekly_timetables, 1):
-        timetable = weekly_data['timetable']
-        day_dates = weekly_data['dates']
-        writer.writerow([])
-        writer.writerow([f"====== WEEK {week_num} (Week of {day_dates.get('Monday', '')}) ======"])
-        dated_headers = [f"{day} ({day_dates.get(day, '')})" for day in days]
-        for batch in sorted(batches):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def flush():
+        chunk = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return chunk
+
+    timetable = weekly_data['timetable']
+    day_dates = weekly_data['dates']
+    writer.writerow([])
+    writer.writerow([f"====== WEEK {week_num} (Week of {day_dates.get('Monday', '')}) ======"])
+    dated_headers = [f"{day} ({day_dates.get(day, '')})" for day in days]
+    for batch in sorted(batches):
+        # Only rendering is timed, not the time the client takes to read the chunk.
+        with phase("csv"):
             writer.writerow([])
             writer.writerow([f'Timetable for {batch}'])
             writer.writerow(['TIME'] + dated_headers)
@@ -104,67 +190,305 @@ def _create_multi_week_csv(all_weekly_timetables, config):
                     else:
                         row.append("")
                 writer.writerow(row)
-    return output.getvalue()
+            chunk = flush()
+        yield chunk
+
+def _csv_marker(text):
+    """A closing row telling a complete CSV apart from a cut-off one."""
+    return f"\r\n====== {text} ======\r\n"
+
+def _iter_multi_week_csv(all_weekly_timetables, config):
+    """Yields the multi-week CSV chunk by chunk; weeks may come from a generator."""
+    if not config.get("BATCHES", []):
+        return
+    for week_num, weekly_data in enumerate(all_weekly_timetables, 1):
+        yield from _iter_week_csv(week_num, weekly_data, config)
+
+def _csv_response(chunks, filename, headers=None):
+    """Chunked text/csv download response."""
+    headers = dict(headers or {}, **{"Content-Disposition": f"attachment; filename={filename}"})
+    return Response(stream_with_context(chunks), mimetype="text/csv", headers=headers)
+
 
+# --- Multi-Week Generation Helpers ---
+NUM_WEEKS = 4
 
-# --- Timetable Generation Endpoint (Unchanged) ---
+class WeekGenerationError(Exception):
+    """Raised when no timetable could be produced for a week."""
+
+def _normalize_config(config_data):
+    if 'TEACHERS' in config_data and isinstance(config_data['TEACHERS'], dict):
+        config_data['TEACHERS'] = {key.strip(): value for key, value in config_data['TEACHERS'].items()}
+    if 'TEACHER_AVAILABILITY' in config_data and isinstance(config_data['TEACHER_AVAILABILITY'], dict):
+        config_data['TEACHER_AVAILABILITY'] = {key.strip(): value for key, value in config_data['TEACHER_AVAILABILITY'].items()}
+    return config_data
+
+def _this_monday():
+    today = date.today()
+    return today - timedelta(days=today.weekday())
+
+def _iter_weeks(config_data, solver_options=None, on_week_start=None, on_week_done=None, start_of_simulation=None):
+    """Generates NUM_WEEKS consecutive weeks from `start_of_simulation` (default this Monday), yielding each week's data as it is solved."""
+    start_of_simulation = start_of_simulation or _this_monday()
+    tracker = HourTracker(filepath=None, contracted_hours=config_data.get("CONTRACTED_HOURS", {}))
+    solution_memo = {}  # Weeks with the same demand signature reuse a solution.
+    calendar = SemesterCalendar(config_data, start_of_simulation)
+    for week_index in range(NUM_WEEKS):
+        current_week_start_date = start_of_simulation + timedelta(weeks=week_index)
+        week_dates = {day: (current_week_start_date + timedelta(days=i)).strftime('%Y-%m-%d') for i, day in enumerate(config_data.get("DAYS", []))}
+        print(f"🧠 Generating timetable for Week {week_index + 1}...")
+        if on_week_start:
+            on_week_start(week_index + 1)
+        timetable_result = generate_timetable_from_config(config_data, week_dates, tracker.get_remaining_hours(), solver_options=solver_options or WEEK_SOLVER_OPTIONS, solution_memo=solution_memo, calendar=calendar)
+        if not timetable_result:
+            raise WeekGenerationError(f"Failed to generate a valid timetable for Week {week_index + 1}.")
+        stats = timetable_result['stats']
+        print(f"   -> Week {week_index + 1}: {stats['stop_reason']} after {stats['generations']} generations (fitness {stats['best_fitness']:.4f})")
+        tracker.update_after_week(timetable_result['raw'])
+        week_data = {'timetable': timetable_result, 'dates': week_dates, 'remaining_hours_after': copy.deepcopy(tracker.get_remaining_hours())}
+        if on_week_done:
+            on_week_done(week_index + 1, stats)
+        yield week_data
+
+def _generate_weeks(config_data, solver_options=None, on_week_start=None, on_week_done=None):
+    """Generates all NUM_WEEKS weeks and returns the weekly data list."""
+    return list(_iter_weeks(config_data, solver_options, on_week_start, on_week_done))
+
+def _cache_mode():
+    """
+    The request's ?cache= option for the persistent result cache
+    (result_cache.py): "use" (default), "refresh" or "bypass". None when invalid.
+    """
+    mode = request.args.get('cache', 'use')
+    return mode if mode in CACHE_MODES else None
+
+def _save_generation(uid, config_data, all_weeks_data, generation_id=None, error=None):
+    """
+    Stores a generation and returns its ID. The CSV is not stored;
+    downloads render it from the weeks. `generation_id` is an ID from
+    generation_store.new_id() that was already sent to the client. With
+    `error` the run stopped early and the weeks solved so far are saved
+    with status "partial".
+    """
+    generation_id = generation_id or generation_store.new_id()
+    generation_store.save(generation_id, uid, config_data, all_weeks_data, error=str(error) if error else None)
+    if error:
+        print(f"⚠️ Partial timetable generation ({len(all_weeks_data)} weeks) saved with ID: {generation_id}")
+    else:
+        print(f"✅ Timetable generation saved with ID: {generation_id}")
+    return generation_id
+
+
+# --- Request Coalescing ---
+# Identical generate-and-download requests (same normalized config, same start
+# week) that overlap in time share one in-flight computation (coalescing.py).
+# Every request still streams the weeks itself and saves its own generation.
+generation_flights = SingleFlight("generation")
+
+def _join_generation(config_data, cache_mode="use"):
+    """The in-flight generation (coalescing.Flight of weeks) for this config, starting one if none runs."""
+    start_of_simulation = _this_monday()
+    key = canonical_key(config_data, start_of_simulation.isoformat(), cache_mode)
+    solver_options = dict(WEEK_SOLVER_OPTIONS, cache=cache_mode)
+    flight, started = generation_flights.join(key, lambda: _iter_weeks(config_data, solver_options, start_of_simulation=start_of_simulation))
+    GENERATION_FLIGHTS.inc(role="leader" if started else "follower")
+    if not started:
+        print(f"🔗 Joining in-flight generation {key[:12]} ({flight.waiters} requests)")
+    return flight
+
+
+# --- Timetable Generation Endpoint ---
 @app.route('/api/generate-and-download', methods=['POST'])
 def generate_and_download_timetables():
-    auth_header = request.headers.get('Authorization')
-    if not auth_header or not auth_header.startswith('Bearer '):
-        return Response("Unauthorized: Missing or invalid token", status=401)
-    try:
-        id_token = auth_header.split('Bearer ')[1]
-        decoded_token = auth.verify_id_token(id_token)
-        uid = decoded_token['uid']
-    except Exception as e:
-        return Response(f"Authentication error: {e}", status=401)
+    uid, auth_error = _authenticate()
+    if auth_error:
+        return Response(auth_error, status=401)
     config_data = request.get_json()
     if not config_data:
         return Response("Bad Request: Missing configuration data", status=400)
-    if 'TEACHERS' in config_data and isinstance(config_data['TEACHERS'], dict):
-        config_data['TEACHERS'] = {key.strip(): value for key, value in config_data['TEACHERS'].items()}
-    if 'TEACHER_AVAILABILITY' in config_data and isinstance(config_data['TEACHER_AVAILABILITY'], dict):
-        config_data['TEACHER_AVAILABILITY'] = {key.strip(): value for key, value in config_data['TEACHER_AVAILABILITY'].items()}
+    cache_mode = _cache_mode()
+    if cache_mode is None:
+        return Response(f"Bad Request: cache must be one of {', '.join(CACHE_MODES)}", status=400)
+    config_data = _normalize_config(config_data)
     try:
-        today = date.today()
-        start_of_simulation = today - timedelta(days=today.weekday())
-        all_weeks_data = []
-        tracker = HourTracker(filepath=None)
-        for week_index in range(4):
-            current_week_start_date = start_of_simulation + timedelta(weeks=week_index)
-            week_dates = {day: (current_week_start_date + timedelta(days=i)).strftime('%Y-%m-%d') for i, day in enumerate(config_data.get("DAYS", []))}
-            print(f"🧠 Generating timetable for Week {week_index + 1}...")
-            timetable_result = generate_timetable_from_config(config_data, week_dates, tracker.get_remaining_hours())
-            if not timetable_result:
-                return Response(f"Failed to generate a valid timetable for Week {week_index + 1}.", status=500)
-            tracker.update_after_week(timetable_result['raw'])
-            all_weeks_data.append({'timetable': timetable_result, 'dates': week_dates, 'remaining_hours_after': copy.deepcopy(tracker.get_remaining_hours())})
-        print("📦 Compiling all weeks into a single CSV file...")
-        csv_content = _create_multi_week_csv(all_weeks_data, config_data)
-        generation_id = None
-        if db:
-            log_entry = {'userId': uid, 'status': 'success', 'createdAt': firestore.SERVER_TIMESTAMP, 'inputConfig': config_data, 'weeklyData': all_weeks_data, 'outputCsv': csv_content}
-            _, doc_ref = db.collection('generations').add(log_entry)
-            generation_id = doc_ref.id
-            print(f"✅ Timetable generation saved to Firestore with ID: {generation_id}")
-        return Response(csv_content, mimetype="text/csv", headers={"Content-Disposition": "attachment; filename=timetable_4_weeks.csv", "X-Generation-ID": generation_id, "Access-Control-Expose-Headers": "X-Generation-ID"})
+        flight = _join_generation(config_data, cache_mode)
+        weeks = iter(flight)
+        # Week 1 is solved before responding so its failures still get an error status.
+        first_week = next(weeks)
+        # The ID is allocated up front because headers go out before the last week is solved.
+        generation_id = generation_store.new_id()
+    except WeekGenerationError as e:
+        return Response(str(e), status=500)
     except Exception as e:
         print(traceback.format_exc())
         return Response(f"An unexpected server error occurred: {e}", status=500)
 
+    # Saved when the generation finishes, whether or not this client reads to the end;
+    # a later week failing saves the weeks solved so far as "partial".
+    flight.add_done_callback(lambda all_weeks_data, error: _save_generation(uid, config_data, all_weeks_data, generation_id, error))
 
-# --- Dynamic Request Endpoint (Unchanged) ---
+    def stream():
+        weeks_sent = 0
+        print("📦 Streaming all weeks as a single CSV file...")
+        try:
+            for week_data in itertools.chain([first_week], weeks):
+                yield from _iter_week_csv(weeks_sent + 1, week_data, config_data)
+                weeks_sent += 1
+        except Exception as e:
+            # Headers (status 200) are already sent, so the failure goes into the file itself.
+            if not isinstance(e, WeekGenerationError):
+                print(traceback.format_exc())
+            yield _csv_marker(f"INCOMPLETE: generation stopped after week {weeks_sent}: {e}")
+            return
+        yield _csv_marker(f"END OF TIMETABLE ({weeks_sent} weeks)")
+
+    return _csv_response(stream(), "timetable_4_weeks.csv", {"X-Generation-ID": generation_id, "Access-Control-Expose-Headers": "X-Generation-ID"})
+
+
+# --- Asynchronous Generation Jobs ---
+def _run_generation_job(job, report):
+    """Worker body for a generation job: same pipeline as /api/generate-and-download."""
+    config_data = job.payload['config']
+    solver_options = dict(WEEK_SOLVER_OPTIONS, cache=job.payload['cache'], on_generation=lambda gen, best_fitness: report(best_fitness=best_fitness))
+    all_weeks_data = _generate_weeks(
+        config_data, solver_options,
+        on_week_start=lambda week: report(current_week=week),
+        on_week_done=lambda week, stats: report(weeks_completed=week, best_fitness=stats['best_fitness']),
+    )
+    generation_id = _save_generation(job.user_id, config_data, all_weeks_data)
+    return {'weeklyData': all_weeks_data, 'generationId': generation_id}
+
+job_runner = JobRunner(
+    _run_generation_job,
+    InMemoryJobStore(),
+    max_workers=int(os.getenv("GENERATION_WORKERS", "2")),
+    max_pending=int(os.getenv("GENERATION_MAX_PENDING", "20")),
+)
+
+@app.route('/api/generation-jobs', methods=['POST'])
+def submit_generation_job():
+    uid, auth_error = _authenticate()
+    if auth_error:
+        return jsonify({"error": auth_error}), 401
+    config_data = request.get_json()
+    if not config_data:
+        return jsonify({"error": "Bad Request: Missing configuration data"}), 400
+    cache_mode = _cache_mode()
+    if cache_mode is None:
+        return jsonify({"error": f"Bad Request: cache must be one of {', '.join(CACHE_MODES)}"}), 400
+    try:
+        job = job_runner.submit(uid, {'config': _normalize_config(config_data), 'cache': cache_mode}, NUM_WEEKS)
+    except QueueFullError as e:
+        return jsonify({"error": str(e)}), 503
+    print(f"🗂️ Queued generation job {job.id}")
+    return jsonify(job.to_dict()), 202, {"Location": f"/api/generation-jobs/{job.id}"}
+
+def _get_owned_job(job_id):
+    """Returns (job, error_response) for the authenticated caller."""
+    uid, auth_error = _authenticate()
+    if auth_error:
+        return None, (jsonify({"error": auth_error}), 401)
+    job = job_runner.get(job_id)
+    if not job:
+        return None, (jsonify({"error": "Job not found"}), 404)
+    if job.user_id != uid:
+        return None, (jsonify({"error": "Forbidden"}), 403)
+    return job, None
+
+@app.route('/api/generation-jobs/<job_id>', methods=['GET'])
+def get_generation_job(job_id):
+    job, error = _get_owned_job(job_id)
+    if error:
+        return error
+    return jsonify(job.to_dict()), 200
+
+@app.route('/api/generation-jobs/<job_id>/result', methods=['GET'])
+def get_generation_job_result(job_id):
+    job, error = _get_owned_job(job_id)
+    if error:
+        return error
+    if job.status == FAILED:
+        return jsonify({"error": job.error, "status": job.status}), 500
+    if job.status != SUCCEEDED:
+        return jsonify(job.to_dict()), 409
+    if request.args.get('format', 'csv') == 'json':
+        return jsonify({"jobId": job.id, "generationId": job.result['generationId'], "weeklyData": job.result['weeklyData']}), 200
+    return _csv_response(
+        _iter_multi_week_csv(job.result['weeklyData'], job.payload['config']),
+        f"timetable_{job.id}.csv",
+        {"X-Generation-ID": job.result['generationId'] or "", "Access-Control-Expose-Headers": "X-Generation-ID"}
+    )
+
+
+# --- Stale Week Refresh ---
+# A dynamic request re-solves only the week it changes; later weeks whose
+# input hours changed are marked stale and re-solved when they are read.
+# With STALE_WEEK_REFRESH=background they are also refreshed right after the
+# request on a single background worker.
+STALE_WEEK_REFRESH = os.getenv("STALE_WEEK_REFRESH", "lazy")
+_refresh_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="week-refresh")
+# Refreshes and dynamic requests read a week's input hours, solve and write
+# the weeks after it; one generation's updates run one at a time so the
+# week-to-week hours chain never mixes the output of two runs.
+generation_locks = KeyedLocks()
+
+def _hours_after(start_hours, raw_timetable):
+    tracker = HourTracker(filepath=None)
+    tracker.remaining_hours = copy.deepcopy(start_hours)
+    tracker.update_after_week(raw_timetable)
+    return tracker.get_remaining_hours()
+
+def _refresh_stale_weeks(generation_id, header, upto=None):
+    """
+    Re-solves the stale weeks of a generation up to week `upto` (default: all)
+    and returns the updated header. A stale week whose input hours turn out to
+    match the ones it was solved with is kept, and so is everything after it.
+    """
+    if not _has_stale_weeks(header, upto):
+        return header
+    with generation_locks.lock(generation_id):
+        # Another request may have refreshed these weeks while this one waited.
+        header = generation_store.get_header(generation_id)
+        if not _has_stale_weeks(header, upto):
+            return header
+        return _refresh_locked(generation_id, header, upto)
+
+def _has_stale_weeks(header, upto=None):
+    stale_from = header.get('staleFrom')
+    return bool(stale_from) and stale_from <= (header['numWeeks'] if upto is None else min(upto, header['numWeeks']))
+
+def _refresh_locked(generation_id, header, upto):
+    stale_from = header['staleFrom']
+    last = header['numWeeks'] if upto is None else min(upto, header['numWeeks'])
+    config_data = _normalize_config(header['inputConfig'])
+    hours = header['staleInputHours']
+    changed_weeks = {}
+    for n, week in zip(range(stale_from, last + 1), generation_store.get_weeks(generation_id, stale_from, last)):
+        raw = week['timetable'].get('raw')
+        if _hours_after(hours, raw) == week['remaining_hours_after']:
+            # Same input hours as when this week was solved: it and later weeks are current.
+            stale_from = None
+            break
+        print(f"   -> Regenerating stale Week {n}...")
+        result = generate_timetable_from_config(config_data, week['dates'], hours, solver_options=WEEK_SOLVER_OPTIONS, previous_timetable=raw)
+        if not result:
+            raise WeekGenerationError(f"Failed during regeneration of stale week {n}")
+        hours = _hours_after(hours, result['raw'])
+        changed_weeks[n] = {'timetable': result, 'dates': week['dates'], 'remaining_hours_after': copy.deepcopy(hours)}
+    else:
+        stale_from = last + 1 if last < header['numWeeks'] else None
+
+    generation_store.put_weeks(generation_id, changed_weeks)
+    generation_store.mark_stale(generation_id, stale_from, hours)
+    return generation_store.get_header(generation_id)
+
+
+# --- Dynamic Request Endpoint ---
 @app.route('/api/dynamic-request', methods=['POST'])
 def handle_dynamic_request():
-    auth_header = request.headers.get('Authorization')
-    if not auth_header or not auth_header.startswith('Bearer '):
-        return jsonify({"error": "Unauthorized: Missing or invalid token"}), 401
-    try:
-        id_token = auth_header.split('Bearer ')[1]
-        auth.verify_id_token(id_token)
-    except Exception as e:
-        return jsonify({"error": f"Authentication error: {e}"}), 401
+    uid, auth_error = _authenticate()
+    if auth_error:
+        return jsonify({"error": auth_error}), 401
     data = request.get_json()
     if not data or not all(k in data for k in ['generationId', 'teacher_name', 'unavailable_days', 'week_num']):
         return jsonify({"error": "Missing 'generationId', 'teacher_name', 'unavailable_days', or 'week_num'"}), 400
@@ -172,103 +496,113 @@ def handle_dynamic_request():
     teacher_name = data['teacher_name']
     unavailable_days = data['unavailable_days']
     week_num = data['week_num']
-    if not db:
-        return jsonify({"error": "Database not initialized"}), 500
+    mode = data.get('mode', 'repair')
+    if mode not in DYNAMIC_REQUEST_MODES:
+        return jsonify({"error": f"'mode' must be one of {', '.join(DYNAMIC_REQUEST_MODES)}"}), 400
+    if not isinstance(week_num, int) or isinstance(week_num, bool):
+        return jsonify({"error": "'week_num' must be an integer"}), 400
     try:
-        doc_ref = db.collection('generations').document(generation_id)
-        doc = doc_ref.get()
-        if not doc.exists: return jsonify({"error": "Generation record not found"}), 404
-        generation_data = doc.to_dict()
-        if 'inputConfig' not in generation_data or 'weeklyData' not in generation_data:
-            return jsonify({"error": "This timetable was saved in an old format and cannot be modified. Please generate a new one."}), 400
-        config_data = generation_data['inputConfig']
-        original_weeks_data = generation_data['weeklyData']
-        if 'TEACHERS' in config_data and isinstance(config_data['TEACHERS'], dict):
-            config_data['TEACHERS'] = {key.strip(): value for key, value in config_data['TEACHERS'].items()}
-        if 'TEACHER_AVAILABILITY' in config_data and isinstance(config_data['TEACHER_AVAILABILITY'], dict):
-            config_data['TEACHER_AVAILABILITY'] = {key.strip(): value for key, value in config_data['TEACHER_AVAILABILITY'].items()}
-        start_hours = copy.deepcopy(CONTRACTED_HOURS) if week_num == 1 else original_weeks_data[week_num - 2]['remaining_hours_after']
-        print(f"🔄 Recalculating from Week {week_num} for request: Make {teacher_name} unavailable on {unavailable_days}")
-        week_dates = original_weeks_data[week_num - 1]['dates']
-        modified_week_timetable = process_dynamic_request(remaining_hours=start_hours, week_num=week_num, teacher_name=teacher_name.strip(), unavailable_days=unavailable_days, day_dates=week_dates, config=config_data)
-        if not modified_week_timetable:
-            return jsonify({"error": "Failed to generate a valid schedule for the given constraint."}), 500
-        new_full_schedule = original_weeks_data[:week_num - 1]
-        tracker = HourTracker(filepath=None)
-        tracker.remaining_hours = copy.deepcopy(start_hours)
-        tracker.update_after_week(modified_week_timetable['raw'])
-        new_full_schedule.append({'timetable': modified_week_timetable, 'dates': original_weeks_data[week_num - 1]['dates'], 'remaining_hours_after': copy.deepcopy(tracker.get_remaining_hours())})
-        for i in range(week_num, 4):
-            print(f"   -> Regenerating subsequent Week {i + 1}...")
-            next_week_result = generate_timetable_from_config(config_data, original_weeks_data[i]['dates'], tracker.get_remaining_hours())
-            if not next_week_result:
-                raise Exception(f"Failed during cascading regeneration of week {i + 1}")
-            tracker.update_after_week(next_week_result['raw'])
-            new_full_schedule.append({'timetable': next_week_result, 'dates': original_weeks_data[i]['dates'], 'remaining_hours_after': copy.deepcopy(tracker.get_remaining_hours())})
-        new_csv_content = _create_multi_week_csv(new_full_schedule, config_data)
-        update_payload = {'weeklyData': new_full_schedule, 'outputCsv': new_csv_content, 'updatedAt': firestore.SERVER_TIMESTAMP}
-        doc_ref.update(update_payload)
-        print(f"✅ Timetable {generation_id} successfully updated in Firestore.")
-        return jsonify({"message": "Timetable updated successfully!", "generationId": generation_id}), 200
+        with generation_locks.lock(generation_id):
+            return _apply_dynamic_request(generation_id, teacher_name, unavailable_days, week_num, mode)
     except Exception as e:
         print(traceback.format_exc())
         return jsonify({"error": f"An unexpected server error occurred: {e}"}), 500
 
-# --- ENDPOINT TO GET LATEST TIMETABLE DETAILS ---
-@app.route('/api/latest-timetable-details', methods=['GET'])
-def get_latest_timetable_details():
-    auth_header = request.headers.get('Authorization')
-    if not auth_header or not auth_header.startswith('Bearer '):
-        return jsonify({"error": "Unauthorized"}), 401
+def _apply_dynamic_request(generation_id, teacher_name, unavailable_days, week_num, mode):
+    """The dynamic request's read-solve-write, run under the generation's lock."""
+    header = generation_store.get_header(generation_id)
+    if not header: return jsonify({"error": "Generation record not found"}), 404
+    if 'inputConfig' not in header or not header.get('numWeeks'):
+        return jsonify({"error": "This timetable was saved in an old format and cannot be modified. Please generate a new one."}), 400
+    if not 1 <= week_num <= header['numWeeks']:
+        return jsonify({"error": f"'week_num' must be between 1 and {header['numWeeks']}"}), 400
+    # Weeks up to week_num must be current before they are built upon.
+    header = _refresh_stale_weeks(generation_id, header, upto=week_num)
+    config_data = _normalize_config(header['inputConfig'])
+    num_weeks = header['numWeeks']
+    # Only the week before week_num (for its remaining hours) and week_num itself are read.
+    first_needed = max(1, week_num - 1)
+    stored_weeks = dict(zip(range(first_needed, week_num + 1), generation_store.get_weeks(generation_id, first_needed, week_num)))
+    start_hours = copy.deepcopy(config_data.get("CONTRACTED_HOURS", {})) if week_num == 1 else stored_weeks[week_num - 1]['remaining_hours_after']
+    print(f"🔄 Recalculating from Week {week_num} for request: Make {teacher_name} unavailable on {unavailable_days}")
+    week_dates = stored_weeks[week_num]['dates']
+    modified_week_timetable = process_dynamic_request(remaining_hours=start_hours, week_num=week_num, teacher_name=teacher_name.strip(), unavailable_days=unavailable_days, day_dates=week_dates, config=config_data, solver_options=WEEK_SOLVER_OPTIONS, previous_timetable=stored_weeks[week_num]['timetable'].get('raw'), mode=mode)
+    if not modified_week_timetable:
+        return jsonify({"error": "Failed to generate a valid schedule for the given constraint."}), 500
+    hours_after = _hours_after(start_hours, modified_week_timetable['raw'])
+    generation_store.put_weeks(generation_id, {week_num: {'timetable': modified_week_timetable, 'dates': week_dates, 'remaining_hours_after': copy.deepcopy(hours_after)}})
+    # Later weeks depend only on the hours left before them. If those changed,
+    # they are marked stale and re-solved when read instead of now.
+    stale_from = header.get('staleFrom')
+    if week_num < num_weeks and hours_after != stored_weeks[week_num]['remaining_hours_after']:
+        stale_from = week_num + 1
+        generation_store.mark_stale(generation_id, stale_from, hours_after)
+        if STALE_WEEK_REFRESH == "background":
+            _refresh_executor.submit(lambda: _refresh_stale_weeks(generation_id, generation_store.get_header(generation_id)))
+    stale_weeks = list(range(stale_from, num_weeks + 1)) if stale_from else []
+    print(f"✅ Timetable {generation_id} week {week_num} updated; stale weeks: {stale_weeks}.")
+    return jsonify({
+        "message": "Timetable updated successfully!",
+        "generationId": generation_id,
+        "sessionsMoved": modified_week_timetable['stats'].get('sessions_moved'),
+        "weeksUpdated": [week_num],
+        "staleWeeks": stale_weeks
+    }), 200
+
+# --- ENDPOINT TO GET A SINGLE WEEK OF A TIMETABLE ---
+@app.route('/api/generations/<generationId>/weeks/<int:week_num>', methods=['GET'])
+def get_generation_week(generationId, week_num):
+    uid, auth_error = _authenticate()
+    if auth_error:
+        return jsonify({"error": auth_error}), 401
+
     try:
-        id_token = auth_header.split('Bearer ')[1]
-        decoded_token = auth.verify_id_token(id_token)
-        uid = decoded_token['uid']
+        header = generation_store.get_header(generationId)
+        if not header:
+            return jsonify({"error": "Timetable not found"}), 404
+        if header.get('userId') != uid:
+            return jsonify({"error": "Forbidden"}), 403
+        if not 1 <= week_num <= header.get('numWeeks', 0):
+            return jsonify({"error": f"Week {week_num} does not exist"}), 404
+        # Only the weeks up to this one are brought up to date.
+        _refresh_stale_weeks(generationId, header, upto=week_num)
+        week = generation_store.get_weeks(generationId, week_num, week_num)[0]
+        return jsonify({"generationId": generationId, "weekNum": week_num, **week}), 200
     except Exception as e:
-        return jsonify({"error": f"Authentication error: {e}"}), 401
+        print(traceback.format_exc())
+        return jsonify({"error": f"An unexpected server error occurred: {e}"}), 500
 
-    if not db:
-        return jsonify({"error": "Database not configured"}), 500
+# --- ENDPOINT TO GET LATEST TIMETABLE DETAILS ---
+@app.route('/api/latest-timetable-details', methods=['GET'])
+def get_latest_timetable_details():
+    uid, auth_error = _authenticate()
+    if auth_error:
+        return jsonify({"error": auth_error}), 401
 
     try:
-        # Query for the most recent timetable for the user
-        query = db.collection('generations').where(filter=FieldFilter("userId", "==", uid)).order_by("createdAt", direction="DESCENDING").limit(1)
-        docs = query.stream()
-        
-        latest_doc = next(docs, None)
-        if not latest_doc:
+        # Query for the most recent timetable for the user; the teacher index is stored per week.
+        generation_id, header = generation_store.latest_for_user(uid)
+        if not generation_id:
             return jsonify({"error": "No timetables found for this user."}), 404
-        
-        timetable_data = latest_doc.to_dict()
-        generation_id = latest_doc.id
-        weekly_data = timetable_data.get('weeklyData', [])
-        
-        teacher_schedule = {}
+        header = _refresh_stale_weeks(generation_id, header)
 
-        for week_index, week_info in enumerate(weekly_data):
-            week_num = week_index + 1
-            batches = week_info.get('timetable', {}).get('batches', {})
+        teacher_index = generation_store.get_teacher_index(generation_id, last=header.get('numWeeks'))
+        if teacher_index is None:
+            # Records saved before the index existed.
+            weekly_data = generation_store.get_weeks(generation_id)
+            teacher_index = {str(n): build_teacher_index(week) for n, week in enumerate(weekly_data, 1)}
 
-            for batch, days in batches.items():
-                for day, slots in days.items():
-                    for slot, details in slots.items():
-                        if not isinstance(details, dict):
-                            continue
-                        teacher = details.get('teacher')
-                        if not teacher:
-                            continue
-
-                        teacher_schedule.setdefault(teacher, {})
-                        teacher_schedule[teacher].setdefault(f"Week {week_num}", set()).add(day)
-
-        # Convert sets → lists for JSON
-        for teacher, weeks in teacher_schedule.items():
-            for week, days in weeks.items():
-                teacher_schedule[teacher][week] = sorted(list(days))
+        teacher_schedule = {}
+        teacher_slots = {}
+        for week_num in sorted(teacher_index, key=int):
+            for teacher, entry in teacher_index[week_num].items():
+                teacher_schedule.setdefault(teacher, {})[f"Week {week_num}"] = entry['days']
+                teacher_slots.setdefault(teacher, {})[f"Week {week_num}"] = entry['slots']
 
         return jsonify({
             "generationId": generation_id,
-            "schedule": teacher_schedule
+            "schedule": teacher_schedule,
+            "slots": teacher_slots
         }), 200
 
     except Exception as e:
@@ -278,37 +612,46 @@ def get_latest_timetable_details():
 # --- ENDPOINT TO DOWNLOAD THE CSV FOR AN EXISTING TIMETABLE ---
 @app.route('/api/download-csv/<generationId>', methods=['GET'])
 def download_csv(generationId):
-    auth_header = request.headers.get('Authorization')
-    if not auth_header or not auth_header.startswith('Bearer '):
-        return Response("Unauthorized", status=401)
-    try:
-        id_token = auth_header.split('Bearer ')[1]
-        decoded_token = auth.verify_id_token(id_token)
-        uid = decoded_token['uid']
-    except Exception as e:
-        return Response(f"Authentication error: {e}", status=401)
+    uid, auth_error = _authenticate()
+    if auth_error:
+        return Response(auth_error, status=401)
     
-    if not db:
-        return Response("Database not configured", status=500)
-
     try:
-        doc_ref = db.collection('generations').document(generationId)
-        doc = doc_ref.get()
-        if not doc.exists:
+        header = generation_store.get_header(generationId)
+        if not header:
             return Response("Timetable not found", status=404)
-        
-        data = doc.to_dict()
+
         # Security check: ensure the user requesting the doc is the one who created it
-        if data.get('userId') != uid:
+        if header.get('userId') != uid:
             return Response("Forbidden", status=403)
-            
-        csv_content = data.get('outputCsv', '')
-        
-        return Response(
-            csv_content,
-            mimetype="text/csv",
-            headers={"Content-Disposition": f"attachment; filename=timetable_{generationId}.csv"}
-        )
+
+        if header.get('numWeeks') and 'inputConfig' in header:
+            if header.get('status') == 'partial':
+                marker = _csv_marker(f"INCOMPLETE: generation stopped after week {header['numWeeks']}: {header.get('error', '')}")
+            else:
+                marker = _csv_marker(f"END OF TIMETABLE ({header['numWeeks']} weeks)")
+
+            # Weeks are read one at a time as the response streams; stale ones are re-solved first.
+            def chunks():
+                current = header
+                n = 0
+                try:
+                    for n in range(1, header['numWeeks'] + 1):
+                        current = _refresh_stale_weeks(generationId, current, upto=n)
+                        yield from _iter_week_csv(n, generation_store.get_weeks(generationId, n, n)[0], header['inputConfig'])
+                except Exception as e:
+                    # Headers (status 200) are already sent, so the failure goes into the file itself.
+                    if not isinstance(e, WeekGenerationError):
+                        print(traceback.format_exc())
+                    yield _csv_marker(f"INCOMPLETE: week {n} could not be brought up to date: {e}")
+                    return
+                yield marker
+            chunks = chunks()
+        else:
+            # Oldest records only have the pre-rendered CSV.
+            chunks = iter([header.get('outputCsv', '')])
+
+        return _csv_response(chunks, f"timetable_{generationId}.csv")
 
     except Exception as e:
         print(traceback.format_exc())
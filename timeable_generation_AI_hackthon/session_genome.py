@@ -0,0 +1,102 @@
+import numpy as np
+
+from problem import CompiledProblem, extract_sessions, new_genome, GENOME_DTYPE
+
+# ==============================================================================
+#                     SESSION-LEVEL GENOME (one gene per session)
+# ==============================================================================
+# The GA evolves sessions rather than timetable cells. An individual is an
+# int16 array of shape (sessions, 7); row i is one session:
+#   (batch, subject, teacher, room, day, start slot, length)
+# A lab is one gene of length 2, so crossover and mutation always move it
+# whole and can never split it or leave half of it behind.
+#
+# Every individual of a run has the same rows in the same order (one per
+# session demanded this week, see SessionLayout): batch, subject and length
+# never change, and a session that could not be placed has day = -1.
+# Crossover therefore keeps the number of sessions of every subject fixed.
+#
+# The (batch, day, slot) cell genome of problem.py is derived only to score,
+# repair and export a solution (to_cell_genome, after run.resolve_overlaps
+# has moved apart sessions of a batch that overlap). The reference scorer reads
+# the sessions directly (decode_sessions), so it sees the same overlaps.
+
+GENE_BATCH, GENE_SUBJECT, GENE_TEACHER, GENE_ROOM, GENE_DAY, GENE_START, GENE_LENGTH = range(7)
+UNPLACED = -1
+
+
+class SessionLayout:
+    """The rows of one week's session genomes, from TimetableConstructor.requests."""
+
+    def __init__(self, problem: CompiledProblem, requests: list):
+        self.problem = problem
+        rows = [(b, subject_id, length) for b, subject_id, sessions, length in requests for _ in range(max(sessions, 0))]
+        self.template = np.full((len(rows), 7), UNPLACED, dtype=GENOME_DTYPE)
+        if rows:
+            self.template[:, [GENE_BATCH, GENE_SUBJECT, GENE_LENGTH]] = rows
+        self.rows = {}
+        for i, (b, subject_id, _) in enumerate(rows):
+            self.rows.setdefault((b, subject_id), []).append(i)
+
+    def from_placements(self, placements):
+        """Genome from (batch, day, start, length, (subject, teacher, room)) sessions; extras are dropped."""
+        genome = self.template.copy()
+        used = {}
+        for b, d, s, length, (subject_id, teacher, room) in placements:
+            rows = self.rows.get((b, subject_id), [])
+            n = used.get((b, subject_id), 0)
+            if n >= len(rows) or genome[rows[n], GENE_LENGTH] != length:
+                continue  # More sessions than demanded, or half of a lab.
+            used[(b, subject_id)] = n + 1
+            genome[rows[n], [GENE_TEACHER, GENE_ROOM, GENE_DAY, GENE_START]] = (teacher, room, d, s)
+        return genome
+
+    def from_cells(self, cell_genome):
+        """Genome from a (batch, day, slot, 3) cell genome."""
+        return self.from_placements(extract_sessions(self.problem, cell_genome))
+
+
+def placed(genome):
+    """Row mask of the sessions that have a day and start slot."""
+    return genome[:, GENE_DAY] != UNPLACED
+
+
+def expand_cells(genomes):
+    """
+    Every occupied cell of a (population, sessions, 7) stack as flat arrays
+    (individual, batch, day, slot, teacher, room, subject); a session of
+    length n contributes n cells.
+    """
+    individual, row = np.nonzero(genomes[..., GENE_DAY] != UNPLACED)
+    genes = genomes[individual, row].astype(np.int64)
+    lengths = genes[:, GENE_LENGTH]
+    repeat = np.repeat(np.arange(len(genes)), lengths)
+    # Offset of each cell within its session: 0, 1, ... length - 1.
+    offsets = np.arange(len(repeat)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    genes = genes[repeat]
+    return (individual[repeat], genes[:, GENE_BATCH], genes[:, GENE_DAY], genes[:, GENE_START] + offsets,
+            genes[:, GENE_TEACHER], genes[:, GENE_ROOM], genes[:, GENE_SUBJECT])
+
+
+def decode_sessions(problem: CompiledProblem, genome):
+    """
+    Every placed cell of one individual as ((day, timeslot, batch), (subject,
+    teacher, room)) pairs, like decode_genome's items but keeping sessions
+    that overlap within a batch.
+    """
+    _, b, d, s, teacher, room, subject_id = (values.tolist() for values in expand_cells(genome[None]))
+    return [
+        ((problem.days[d[i]], problem.timeslots[s[i]], problem.batches[b[i]]),
+         (problem.subjects[subject_id[i]], problem.teachers[teacher[i]], problem.rooms[room[i]]))
+        for i in range(len(b))
+    ]
+
+
+def to_cell_genome(problem: CompiledProblem, genome):
+    """The (batch, day, slot, 3) cell genome of one individual, for repair and export."""
+    cells = new_genome(problem)
+    _, b, d, s, teacher, room, subject_id = expand_cells(genome[None])
+    # Where two sessions of a batch overlap, only one of them is kept;
+    # run.resolve_overlaps moves them apart before export.
+    cells[b, d, s] = np.stack([subject_id, teacher, room], axis=-1)
+    return cells
@@ -0,0 +1,267 @@
+import copy
+import threading
+import time
+import uuid
+
+from firebase_admin import firestore
+from google.cloud.firestore_v1.base_query import FieldFilter
+
+# ==============================================================================
+#                     GENERATION STORAGE (header + one document per week)
+# ==============================================================================
+# A generation is stored as a small header document (owner, input config,
+# number of weeks, timestamps) plus one document per week holding that week's
+# timetable, dates and remaining hours. Readers fetch only the weeks they
+# need and dynamic requests rewrite only the weeks they changed.
+#
+# Firestore layout:
+#   generations/{id}                      header
+#   generations/{id}/weeks/{n}            week n (1-based)
+#   generations/{id}/teacherIndex/{n}     teacher index of week n
+#
+# Records written before this layout keep all weeks in the header's
+# `weeklyData` array; they are still readable and are migrated to week
+# documents the first time they are modified.
+#
+# After a dynamic request, later weeks may be left stale: the header's
+# `staleFrom` is the first week that must be re-solved before it is read and
+# `staleInputHours` the remaining hours it must be solved with.
+#
+# Every week also gets a teacher -> days/slots index, built whenever the week
+# is written, so the teacher dashboard reads one small document per week
+# instead of walking every timetable cell. The index is kept out of the
+# header (which every endpoint reads) because on large configs it outgrows
+# the rest of the record; only get_teacher_index reads it.
+
+
+class GenerationStore:
+    """Interface for generation persistence."""
+
+    def new_id(self):
+        """Allocates an ID for a generation that will be saved later."""
+        raise NotImplementedError
+
+    def save(self, generation_id: str, user_id: str, config: dict, weeks: list, error: str = None):
+        """
+        Writes a generation (header and every week). With `error` the run
+        stopped early: the header gets status "partial" and the error.
+        """
+        raise NotImplementedError
+
+    def get_header(self, generation_id: str):
+        """Header dict (userId, inputConfig, numWeeks, ...) or None."""
+        raise NotImplementedError
+
+    def get_weeks(self, generation_id: str, first: int = 1, last: int = None):
+        """Weeks first..last (1-based, inclusive) in order; `last` defaults to the final week."""
+        raise NotImplementedError
+
+    def put_weeks(self, generation_id: str, weeks: dict):
+        """Overwrites only the given {week number: week data} entries."""
+        raise NotImplementedError
+
+    def mark_stale(self, generation_id: str, first_week: int, input_hours: dict = None):
+        """Marks weeks first_week.. as stale with week first_week's input hours; None clears it."""
+        raise NotImplementedError
+
+    def latest_for_user(self, user_id: str):
+        """(generation_id, header) of the user's most recent generation, or (None, None)."""
+        raise NotImplementedError
+
+    def get_teacher_index(self, generation_id: str, first: int = 1, last: int = None):
+        """{"n": build_teacher_index(week n)} for weeks first..last, or None for records without one."""
+        raise NotImplementedError
+
+
+def build_teacher_index(week: dict):
+    """
+    Teacher index of one week: {teacher: {"days": [...], "slots": [...]}},
+    where each slot is {"day", "slot", "batch", "subject", "room"}.
+    """
+    index = {}
+    batches = week.get('timetable', {}).get('batches', {})
+    for batch, days in batches.items():
+        for day, slots in days.items():
+            for slot, details in slots.items():
+                if not isinstance(details, dict):
+                    continue
+                teacher = details.get('teacher')
+                if not teacher:
+                    continue
+                entry = index.setdefault(teacher, {'days': set(), 'slots': []})
+                entry['days'].add(day)
+                entry['slots'].append({'day': day, 'slot': slot, 'batch': batch, 'subject': details.get('subject'), 'room': details.get('room')})
+    for entry in index.values():
+        entry['days'] = sorted(entry['days'])
+    return index
+
+
+def _header(user_id: str, config: dict, weeks: list, created_at, error: str = None):
+    header = {'userId': user_id, 'status': 'partial' if error else 'success', 'createdAt': created_at, 'inputConfig': config, 'numWeeks': len(weeks)}
+    if error:
+        header['error'] = error
+    return header
+
+
+class InMemoryGenerationStore(GenerationStore):
+    """Thread-safe local stand-in; values are deep-copied as a database would."""
+
+    def __init__(self):
+        self._headers = {}
+        self._weeks = {}
+        self._indexes = {}
+        self._lock = threading.Lock()
+
+    def new_id(self):
+        return uuid.uuid4().hex
+
+    def save(self, generation_id: str, user_id: str, config: dict, weeks: list, error: str = None):
+        with self._lock:
+            self._headers[generation_id] = copy.deepcopy(_header(user_id, config, weeks, time.time(), error))
+            self._weeks[generation_id] = {n: copy.deepcopy(week) for n, week in enumerate(weeks, 1)}
+            self._indexes[generation_id] = {n: build_teacher_index(week) for n, week in enumerate(weeks, 1)}
+
+    def get_header(self, generation_id: str):
+        with self._lock:
+            return copy.deepcopy(self._headers.get(generation_id))
+
+    def get_weeks(self, generation_id: str, first: int = 1, last: int = None):
+        with self._lock:
+            weeks = self._weeks.get(generation_id, {})
+            last = len(weeks) if last is None else last
+            return [copy.deepcopy(weeks[n]) for n in range(first, last + 1) if n in weeks]
+
+    def put_weeks(self, generation_id: str, weeks: dict):
+        with self._lock:
+            stored = self._weeks[generation_id]
+            indexes = self._indexes[generation_id]
+            for n, week in weeks.items():
+                stored[n] = copy.deepcopy(week)
+                indexes[n] = build_teacher_index(week)
+            self._headers[generation_id]['updatedAt'] = time.time()
+
+    def mark_stale(self, generation_id: str, first_week: int, input_hours: dict = None):
+        with self._lock:
+            header = self._headers[generation_id]
+            if first_week is None:
+                header.pop('staleFrom', None)
+                header.pop('staleInputHours', None)
+            else:
+                header.update(staleFrom=first_week, staleInputHours=copy.deepcopy(input_hours))
+
+    def latest_for_user(self, user_id: str):
+        with self._lock:
+            owned = [(header['createdAt'], gid) for gid, header in self._headers.items() if header['userId'] == user_id]
+            if not owned:
+                return None, None
+            generation_id = max(owned)[1]
+            return generation_id, copy.deepcopy(self._headers[generation_id])
+
+    def get_teacher_index(self, generation_id: str, first: int = 1, last: int = None):
+        with self._lock:
+            indexes = self._indexes.get(generation_id)
+            if indexes is None:
+                return None
+            last = len(indexes) if last is None else last
+            return {str(n): copy.deepcopy(indexes[n]) for n in range(first, last + 1) if n in indexes}
+
+
+class FirestoreGenerationStore(GenerationStore):
+    """Firestore implementation of the header + per-week layout."""
+
+    def __init__(self, db, collection: str = 'generations'):
+        self.db = db
+        self.collection = db.collection(collection)
+
+    def _week_ref(self, generation_id: str, week_num: int):
+        return self.collection.document(generation_id).collection('weeks').document(str(week_num))
+
+    def _index_ref(self, generation_id: str, week_num: int):
+        return self.collection.document(generation_id).collection('teacherIndex').document(str(week_num))
+
+    def new_id(self):
+        return self.collection.document().id
+
+    def save(self, generation_id: str, user_id: str, config: dict, weeks: list, error: str = None):
+        batch = self.db.batch()
+        batch.set(self.collection.document(generation_id), _header(user_id, config, weeks, firestore.SERVER_TIMESTAMP, error))
+        for n, week in enumerate(weeks, 1):
+            batch.set(self._week_ref(generation_id, n), dict(week, weekNum=n))
+            batch.set(self._index_ref(generation_id, n), build_teacher_index(week))
+        batch.commit()
+
+    @staticmethod
+    def _from_snapshot(doc):
+        header = doc.to_dict()
+        if 'weeklyData' in header:  # Old single-document record.
+            header['numWeeks'] = len(header['weeklyData'])
+            header.pop('weeklyData')
+            header.pop('outputCsv', None)
+        return header
+
+    def get_header(self, generation_id: str):
+        doc = self.collection.document(generation_id).get()
+        return self._from_snapshot(doc) if doc.exists else None
+
+    def _legacy_weeks(self, generation_id: str):
+        doc = self.collection.document(generation_id).get()
+        return doc.to_dict().get('weeklyData') if doc.exists else None
+
+    def get_weeks(self, generation_id: str, first: int = 1, last: int = None):
+        if last is None:
+            header = self.get_header(generation_id)
+            last = header['numWeeks'] if header else 0
+        refs = [self._week_ref(generation_id, n) for n in range(first, last + 1)]
+        docs = [doc for doc in self.db.get_all(refs) if doc.exists]
+        if not docs and refs:
+            legacy = self._legacy_weeks(generation_id)
+            if legacy is not None:
+                return legacy[first - 1:last]
+        weeks = sorted((doc.to_dict() for doc in docs), key=lambda week: week['weekNum'])
+        for week in weeks:
+            week.pop('weekNum')
+        return weeks
+
+    def put_weeks(self, generation_id: str, weeks: dict):
+        header_ref = self.collection.document(generation_id)
+        batch = self.db.batch()
+        doc = header_ref.get()
+        stored = doc.to_dict() if doc.exists else {}
+        header_update = {'updatedAt': firestore.SERVER_TIMESTAMP}
+        legacy = stored.get('weeklyData')
+        if legacy is not None:
+            # First modification of an old record: move its weeks out of the header.
+            for n, week in enumerate(legacy, 1):
+                if n not in weeks:
+                    batch.set(self._week_ref(generation_id, n), dict(week, weekNum=n))
+                    batch.set(self._index_ref(generation_id, n), build_teacher_index(week))
+            header_update.update({'numWeeks': len(legacy), 'weeklyData': firestore.DELETE_FIELD, 'outputCsv': firestore.DELETE_FIELD})
+        for n, week in weeks.items():
+            batch.set(self._week_ref(generation_id, n), dict(week, weekNum=n))
+            # Only the index documents of the rewritten weeks change.
+            batch.set(self._index_ref(generation_id, n), build_teacher_index(week))
+        batch.update(header_ref, header_update)
+        batch.commit()
+
+    def mark_stale(self, generation_id: str, first_week: int, input_hours: dict = None):
+        if first_week is None:
+            update = {'staleFrom': firestore.DELETE_FIELD, 'staleInputHours': firestore.DELETE_FIELD}
+        else:
+            update = {'staleFrom': first_week, 'staleInputHours': input_hours}
+        self.collection.document(generation_id).update(update)
+
+    def latest_for_user(self, user_id: str):
+        query = self.collection.where(filter=FieldFilter("userId", "==", user_id)).order_by("createdAt", direction="DESCENDING").limit(1)
+        latest_doc = next(query.stream(), None)
+        if not latest_doc:
+            return None, None
+        return latest_doc.id, self._from_snapshot(latest_doc)
+
+    def get_teacher_index(self, generation_id: str, first: int = 1, last: int = None):
+        if last is None:
+            header = self.get_header(generation_id)
+            last = header['numWeeks'] if header else 0
+        refs = [self._index_ref(generation_id, n) for n in range(first, last + 1)]
+        docs = [doc for doc in self.db.get_all(refs) if doc.exists]
+        # None for records saved before the index existed.
+        return {doc.id: doc.to_dict() for doc in docs} if docs else None
@@ -0,0 +1,23 @@
+import os
+import sys
+
+# The solver modules are flat top-level modules next to this directory.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+import pytest
+
+
+@pytest.fixture
+def server_app(monkeypatch):
+    """server.py on in-memory stores with a fake token verifier (the token is the uid) and no result cache."""
+    import result_cache
+    import server
+    import storage
+    from auth_tokens import CachedTokenVerifier, FakeTokenVerifier
+
+    monkeypatch.setattr(result_cache, "CACHE_PATH", "")
+    monkeypatch.setattr(server, "generation_store", storage.InMemoryGenerationStore())
+    monkeypatch.setattr(server, "token_verifier", CachedTokenVerifier(FakeTokenVerifier()))
+    monkeypatch.setattr(server, "WEEK_SOLVER_OPTIONS", {"backend": "ga", "islands": 1, "population_size": 20, "generations": 20, "seed": 1})
+    return server
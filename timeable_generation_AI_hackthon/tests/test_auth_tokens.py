@@ -0,0 +1,66 @@
+import pytest
+
+from auth_tokens import CachedTokenVerifier, FakeTokenVerifier, bearer_token
+
+
+class Clock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def test_cached_until_exp_then_verified_again():
+    clock = Clock()
+    fake = FakeTokenVerifier({"token-a": {"uid": "alice", "exp": 1100}}, clock=clock)
+    verifier = CachedTokenVerifier(fake, clock=clock)
+
+    assert verifier.verify("token-a")["uid"] == "alice"
+    assert verifier.verify("token-a")["uid"] == "alice"
+    assert fake.calls == 1
+
+    clock.now = 1100  # The token's own expiry.
+    verifier.verify("token-a")
+    assert fake.calls == 2
+
+
+def test_expired_token_is_not_served_from_the_cache():
+    clock = Clock()
+    fake = FakeTokenVerifier({"token-a": {"uid": "alice", "exp": 1100}}, clock=clock)
+    verifier = CachedTokenVerifier(fake, clock=clock)
+    verifier.verify("token-a")
+
+    # Once expired the token is rejected upstream, and the cached claims must not hide that.
+    del fake.claims_by_token["token-a"]
+    clock.now = 1101
+    with pytest.raises(ValueError):
+        verifier.verify("token-a")
+    assert len(verifier) == 0
+
+
+def test_already_expired_and_rejected_tokens_are_not_cached():
+    clock = Clock()
+    fake = FakeTokenVerifier({"stale": {"uid": "alice", "exp": 900}}, clock=clock)
+    verifier = CachedTokenVerifier(fake, clock=clock)
+    verifier.verify("stale")
+    with pytest.raises(ValueError):
+        verifier.verify("unknown")
+    assert len(verifier) == 0
+
+
+def test_least_recently_used_tokens_are_evicted():
+    clock = Clock()
+    fake = FakeTokenVerifier(clock=clock)
+    verifier = CachedTokenVerifier(fake, max_entries=2, clock=clock)
+    for token in ("a", "b", "a", "c"):
+        verifier.verify(token)
+    assert len(verifier) == 2 and fake.calls == 3
+    verifier.verify("a")  # Still cached; "b" was evicted.
+    verifier.verify("b")
+    assert fake.calls == 4
+
+
+def test_bearer_token():
+    assert bearer_token("Bearer abc ") == "abc"
+    assert bearer_token("Basic abc") is None and bearer_token("Bearer ") is None and bearer_token(None) is None
@@ -0,0 +1,102 @@
+import json
+import os
+import threading
+
+import pytest
+
+from coalescing import SingleFlight
+
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "config.json")
+
+
+@pytest.fixture
+def config():
+    with open(CONFIG_PATH) as f:
+        return json.load(f)
+
+
+def _stub_solver(server, monkeypatch, result=None):
+    """
+    Counts solver calls and holds the first one until a second request has
+    joined the flight, so the two requests are sure to overlap.
+    """
+    calls = []
+    joined = threading.Event()
+    solve, join = server.generate_timetable_from_config, server._join_generation
+
+    def counting_join(*args, **kwargs):
+        flight = join(*args, **kwargs)
+        if flight.waiters >= 2:
+            joined.set()
+        return flight
+
+    def stub(*args, **kwargs):
+        calls.append(args[1]["Monday"])
+        assert joined.wait(10)
+        return solve(*args, **kwargs) if result is None else result
+
+    monkeypatch.setattr(server, "_join_generation", counting_join)
+    monkeypatch.setattr(server, "generate_timetable_from_config", stub)
+    return calls
+
+
+def _post_concurrently(server, config, users):
+    responses = {}
+
+    def post(user):
+        response = server.app.test_client().post("/api/generate-and-download", json=config, headers={"Authorization": f"Bearer {user}"})
+        responses[user] = (response.status_code, response.headers.get("X-Generation-ID"), response.get_data())
+
+    threads = [threading.Thread(target=post, args=(user,)) for user in users]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return responses
+
+
+def test_identical_requests_share_one_solve(server_app, monkeypatch, config):
+    calls = _stub_solver(server_app, monkeypatch)
+    responses = _post_concurrently(server_app, config, ["alice", "bob"])
+
+    assert len(calls) == server_app.NUM_WEEKS  # One solve per week, not one per request.
+    (status_a, id_a, csv_a), (status_b, id_b, csv_b) = responses["alice"], responses["bob"]
+    assert status_a == status_b == 200
+    assert csv_a == csv_b and b"END OF TIMETABLE" in csv_a
+
+    # Each caller gets its own generation record, with the same weeks.
+    store = server_app.generation_store
+    assert id_a != id_b
+    assert store.get_header(id_a)["userId"] == "alice" and store.get_header(id_b)["userId"] == "bob"
+    assert store.get_weeks(id_a) == store.get_weeks(id_b)
+    assert server_app.generation_flights.in_flight() == 0
+
+
+def test_first_week_failure_reaches_every_caller(server_app, monkeypatch, config):
+    calls = _stub_solver(server_app, monkeypatch, result={})  # An empty result fails the week.
+    responses = _post_concurrently(server_app, config, ["alice", "bob"])
+
+    assert len(calls) == 1
+    for status, _, body in responses.values():
+        assert status == 500 and b"Week 1" in body
+
+
+def test_follower_sees_the_leaders_error():
+    flights = SingleFlight("test")
+    release = threading.Event()
+
+    def producer():
+        yield "week 1"
+        release.wait(10)
+        raise RuntimeError("week 2 failed")
+
+    leader, started = flights.join("key", producer)
+    follower, joined_started = flights.join("key", lambda: iter(()))
+    assert started and not joined_started and follower is leader
+    release.set()
+    for flight in (leader, follower):
+        items = []
+        with pytest.raises(RuntimeError, match="week 2 failed"):
+            for item in flight:
+                items.append(item)
+        assert items == ["week 1"]
@@ -0,0 +1,58 @@
+import random
+
+import pytest
+
+from benchmarks.synthetic import PRESETS, generate_config
+from fitness import ConflictTracker, genome_fitness, with_unplaced
+from problem import compile_problem, decode_genome, new_genome, EMPTY, SUBJECT
+from run import calculate_fitness, create_initial_population, resolve_overlaps
+from session_genome import placed, to_cell_genome, GENE_BATCH, GENE_DAY, GENE_START, GENE_LENGTH
+
+
+def _random_genome(problem, rng, fill=0.6):
+    """A cell genome with random entries, clashes and gaps included."""
+    genome = new_genome(problem)
+    for b in range(problem.num_batches):
+        subjects = [s for s in problem.batch_subjects[b] if problem.subject_teachers[s]]
+        for d in range(problem.num_days):
+            for s in range(problem.num_slots):
+                if rng.random() < fill:
+                    subject_id = rng.choice(subjects)
+                    genome[b, d, s] = (subject_id, rng.choice(problem.subject_teachers[subject_id]), rng.randrange(problem.num_rooms))
+    return genome
+
+
+def _random_cell(problem, rng):
+    return (rng.randrange(problem.num_batches), rng.randrange(problem.num_days), rng.randrange(problem.num_slots))
+
+
+@pytest.mark.parametrize("size", ["small", "medium"])
+def test_tracker_delta_matches_full_rescore(size):
+    rng = random.Random(0)
+    problem = compile_problem(generate_config(**PRESETS[size], seed=0))
+    genome = _random_genome(problem, rng)
+    tracker = ConflictTracker(problem, genome)
+
+    for _ in range(1500):
+        cell1, cell2 = _random_cell(problem, rng), _random_cell(problem, rng)
+        fitness = tracker.swap(cell1, cell2) if rng.random() < 0.5 else tracker.move(cell1, cell2)
+        assert fitness == calculate_fitness(decode_genome(problem, tracker.genome), timeslots=problem.timeslots)
+        assert fitness == genome_fitness(problem, tracker.genome)
+
+
+
+def test_exported_fitness_counts_overlapping_sessions():
+    rng = random.Random(0)
+    config = generate_config(**PRESETS["small"], seed=0)
+    problem = compile_problem(config)
+    for genome in create_initial_population(problem, 10, config["CONTRACTED_HOURS"], 1, rng=rng):
+        # Stack sessions of a batch onto each other, as crossover can.
+        rows = [i for i in range(len(genome)) if (genome[i, [GENE_BATCH, GENE_LENGTH]] == genome[0, [GENE_BATCH, GENE_LENGTH]]).all()]
+        for row in rng.sample(rows, 4):
+            genome[row, [GENE_DAY, GENE_START]] = genome[0, [GENE_DAY, GENE_START]]
+
+        resolved = resolve_overlaps(problem, genome)
+        cells = to_cell_genome(problem, resolved)
+        assert (cells[..., SUBJECT] != EMPTY).sum() == resolved[placed(resolved), GENE_LENGTH].sum()
+        assert genome_fitness(problem, resolved) == pytest.approx(
+            with_unplaced(genome_fitness(problem, cells), int((~placed(resolved)).sum())))
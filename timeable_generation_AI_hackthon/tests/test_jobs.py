@@ -0,0 +1,92 @@
+import json
+import os
+import threading
+import time
+
+import pytest
+
+from jobs import FAILED, QUEUED, RUNNING, SUCCEEDED, InMemoryJobStore, JobRunner, QueueFullError
+
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "config.json")
+
+
+def _wait_until_finished(get_job, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = get_job()
+        if job.status in (SUCCEEDED, FAILED):
+            return job
+        time.sleep(0.02)
+    raise AssertionError("job did not finish")
+
+
+def test_job_reports_progress_and_succeeds():
+    started, release = threading.Event(), threading.Event()
+
+    def work(job, report):
+        started.set()
+        report(current_week=1)
+        report(weeks_completed=1, best_fitness=0.5)
+        assert release.wait(10)
+        return {"weeklyData": ["week 1"], "generationId": "g1"}
+
+    runner = JobRunner(work, InMemoryJobStore(), max_workers=1)
+    job = runner.submit("alice", {"config": {}}, total_weeks=1)
+    assert job.status in (QUEUED, RUNNING)
+    assert started.wait(10)
+    status = runner.get(job.id).to_dict()
+    assert status["status"] == RUNNING and status["currentWeek"] == 1 and status["weeksCompleted"] == 1 and status["bestFitness"] == 0.5
+
+    release.set()
+    job = _wait_until_finished(lambda: runner.get(job.id))
+    assert job.status == SUCCEEDED and job.finished_at is not None
+    assert job.to_dict()["generationId"] == "g1" and job.result["weeklyData"] == ["week 1"]
+    runner.shutdown()
+
+
+def test_job_failure_is_captured():
+    def work(job, report):
+        report(current_week=2)
+        raise ValueError("week 2 has no valid timetable")
+
+    runner = JobRunner(work, InMemoryJobStore(), max_workers=1)
+    job_id = runner.submit("alice", {}, 4).id
+    job = _wait_until_finished(lambda: runner.get(job_id))
+    assert job.status == FAILED and job.error == "week 2 has no valid timetable"
+    assert job.current_week == 2 and job.result is None
+    runner.shutdown()
+
+
+def test_queue_is_bounded():
+    release = threading.Event()
+    runner = JobRunner(lambda job, report: release.wait(10), InMemoryJobStore(), max_workers=1, max_pending=1)
+    first = runner.submit("alice", {}, 1)
+    with pytest.raises(QueueFullError):
+        runner.submit("alice", {}, 1)
+    release.set()
+    _wait_until_finished(lambda: runner.get(first.id))
+    runner.shutdown()
+    assert runner._pending == 0
+
+
+def test_jobs_are_only_visible_to_their_owner(server_app, monkeypatch):
+    with open(CONFIG_PATH) as f:
+        config = json.load(f)
+    monkeypatch.setattr(server_app, "job_runner", JobRunner(server_app._run_generation_job, InMemoryJobStore(), max_workers=1))
+    client = server_app.app.test_client()
+    alice, bob = {"Authorization": "Bearer alice"}, {"Authorization": "Bearer bob"}
+
+    response = client.post("/api/generation-jobs", json=config, headers=alice)
+    assert response.status_code == 202
+    job_id = response.get_json()["jobId"]
+    assert client.get(f"/api/generation-jobs/{job_id}", headers=bob).status_code == 403
+    assert client.get(f"/api/generation-jobs/{job_id}/result", headers=bob).status_code == 403
+    assert client.get("/api/generation-jobs/unknown", headers=alice).status_code == 404
+
+    _wait_until_finished(lambda: server_app.job_runner.get(job_id))
+    status = client.get(f"/api/generation-jobs/{job_id}", headers=alice).get_json()
+    assert status["status"] == SUCCEEDED and status["weeksCompleted"] == server_app.NUM_WEEKS
+    result = client.get(f"/api/generation-jobs/{job_id}/result?format=json", headers=alice).get_json()
+    assert len(result["weeklyData"]) == server_app.NUM_WEEKS
+    assert server_app.generation_store.get_header(result["generationId"])["userId"] == "alice"
+    server_app.job_runner.shutdown()
@@ -0,0 +1,60 @@
+import json
+from datetime import date, timedelta
+
+import pytest
+
+import result_cache
+from benchmarks.synthetic import PRESETS, generate_config
+from result_cache import ResultCache, result_key
+from run import generate_timetable_from_config
+
+SOLVER_OPTIONS = {"backend": "ga", "islands": 1, "population_size": 20, "generations": 20, "seed": 1}
+MONDAY = date(2025, 1, 6)
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    cache = ResultCache(str(tmp_path / "cache.sqlite3"))
+    monkeypatch.setattr(result_cache, "_SHARED", cache)
+    yield cache
+    cache.close()
+
+
+def _generate(config, **options):
+    day_dates = {day: (MONDAY + timedelta(days=i)).isoformat() for i, day in enumerate(config["DAYS"])}
+    return generate_timetable_from_config(config, day_dates, solver_options=dict(SOLVER_OPTIONS, **options))
+
+
+def _without_cache_mark(result):
+    result = json.loads(json.dumps(result))
+    result["stats"].pop("cache", None)
+    return result
+
+
+def test_hit_returns_the_solved_result(cache):
+    config = generate_config(**PRESETS["small"], seed=0)
+    solved = _generate(config)
+    assert solved["stats"]["best_fitness"] == 1.0 and cache.stores == 1
+
+    hit = _generate(config)
+    assert cache.hits == 1
+    assert hit["stats"]["cache"] == "hit"
+    assert json.dumps(_without_cache_mark(hit)) == json.dumps(solved)
+
+    _generate(config, cache="bypass")
+    _generate(config, cache="refresh")
+    assert cache.hits == 1 and cache.stores == 2
+
+
+def test_imperfect_results_are_not_stored(cache):
+    config = generate_config(batches=6, subjects_per_batch=6, teachers=6, availability=0.3, weekly_load=(3, 4))
+    assert _generate(config, generations=5)["stats"]["best_fitness"] < 1.0
+    assert "cache" not in _generate(config, generations=5)["stats"]
+    assert cache.stores == 0 and cache.hits == 0
+
+
+def test_key_includes_the_solver_version(monkeypatch):
+    config = generate_config(**PRESETS["small"], seed=0)
+    key = result_key(config, config["CONTRACTED_HOURS"], None, 1)
+    monkeypatch.setattr(result_cache, "SOLVER_VERSION", result_cache.SOLVER_VERSION + 1)
+    assert result_key(config, config["CONTRACTED_HOURS"], None, 1) != key
@@ -0,0 +1,33 @@
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.synthetic import PRESETS, generate_config
+from run import TimetableSolver
+
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "config.json")
+# Generation-bounded GA runs without a deadline, so a seed fixes the result.
+SOLVER_OPTIONS = {"backend": "ga", "islands": 1, "population_size": 30, "generations": 30, "seeding": "random"}
+
+
+def _cases():
+    with open(CONFIG_PATH) as f:
+        configs = [json.load(f)]
+    configs += [generate_config(**dict(PRESETS["small"], seed=seed)) for seed in range(3)]
+    configs += [generate_config(**dict(PRESETS["small"], seed=seed, lab_ratio=0.5)) for seed in range(2)]
+    return [(config, seed) for config in configs for seed in (1, 2)]
+
+
+def _solve(case):
+    config, seed = case
+    solver = TimetableSolver(config, seed=seed)
+    genome, stats = solver.solve_week(config["CONTRACTED_HOURS"], 1, solver_options=dict(SOLVER_OPTIONS, seed=seed))
+    return genome.tobytes(), stats["best_fitness"], stats["generations"]
+
+
+def test_threaded_runs_match_sequential_runs():
+    cases = _cases()
+    sequential = [_solve(case) for case in cases]
+    with ThreadPoolExecutor(max_workers=6) as pool:
+        threaded = list(pool.map(_solve, cases))
+    assert threaded == sequential
@@ -0,0 +1,62 @@
+from storage import InMemoryGenerationStore, build_teacher_index
+
+
+def _week(teacher, day="Monday", batch="A"):
+    return {
+        "timetable": {"batches": {batch: {day: {"9-10": {"subject": "Maths", "teacher": teacher, "room": "R1"}}}}},
+        "dates": {day: "2025-01-06"},
+        "remaining_hours_after": {batch: {"Maths": 1}},
+    }
+
+
+def test_weeks_and_teacher_index_round_trip():
+    store = InMemoryGenerationStore()
+    generation_id = store.new_id()
+    weeks = [_week("T1"), _week("T2", day="Tuesday"), _week("T3")]
+    store.save(generation_id, "alice", {"BATCHES": ["A"]}, weeks)
+
+    header = store.get_header(generation_id)
+    assert header["userId"] == "alice" and header["numWeeks"] == 3 and header["status"] == "success"
+    assert store.get_weeks(generation_id) == weeks
+    assert store.get_weeks(generation_id, 2, 3) == weeks[1:]
+    assert store.get_teacher_index(generation_id) == {str(n): build_teacher_index(week) for n, week in enumerate(weeks, 1)}
+    assert store.get_teacher_index(generation_id, 2, 2) == {"2": {"T2": {"days": ["Tuesday"], "slots": [
+        {"day": "Tuesday", "slot": "9-10", "batch": "A", "subject": "Maths", "room": "R1"}]}}}
+
+    # Only the rewritten week and its index change.
+    store.put_weeks(generation_id, {2: _week("T4")})
+    assert store.get_weeks(generation_id) == [weeks[0], _week("T4"), weeks[2]]
+    index = store.get_teacher_index(generation_id)
+    assert list(index["2"]) == ["T4"] and list(index["1"]) == ["T1"]
+    assert "updatedAt" in store.get_header(generation_id)
+
+    # Callers get copies, as from a database.
+    store.get_weeks(generation_id)[0]["dates"].clear()
+    assert store.get_weeks(generation_id, 1, 1) == [weeks[0]]
+
+
+def test_stale_marker_is_set_and_cleared():
+    store = InMemoryGenerationStore()
+    store.save("g1", "alice", {}, [_week("T1"), _week("T2")])
+    hours = {"A": {"Maths": 2}}
+    store.mark_stale("g1", 2, hours)
+    hours["A"]["Maths"] = 0
+    header = store.get_header("g1")
+    assert header["staleFrom"] == 2 and header["staleInputHours"] == {"A": {"Maths": 2}}
+
+    store.mark_stale("g1", None)
+    header = store.get_header("g1")
+    assert "staleFrom" not in header and "staleInputHours" not in header
+
+
+def test_partial_saves_and_latest_generation():
+    store = InMemoryGenerationStore()
+    assert store.latest_for_user("alice") == (None, None)
+    assert store.get_header("missing") is None and store.get_teacher_index("missing") is None
+
+    store.save("first", "alice", {}, [_week("T1")])
+    store.save("second", "alice", {}, [_week("T1")], error="week 2 failed")
+    store.save("other", "bob", {}, [_week("T1")])
+    generation_id, header = store.latest_for_user("alice")
+    assert generation_id == "second"
+    assert header["status"] == "partial" and header["error"] == "week 2 failed" and header["numWeeks"] == 1